@@ -58,6 +58,7 @@ fitness_agent_prompt = """你是一位专业的健身教练AI助手。你的任
 4. 确保运动计划的安全性和有效性
 
 请根据用户提供的信息，使用健身规划工具生成合适的运动计划。
+工具返回紧凑JSON格式的计划，请将其整理为清晰易读的回答，并提醒热身、拉伸等安全注意事项。
 """
 
 nutrition_agent_prompt = """你是一位专业的营养师AI助手。你的任务是：
@@ -67,6 +68,7 @@ nutrition_agent_prompt = """你是一位专业的营养师AI助手。你的任
 4. 考虑用户的饮食偏好和限制
 
 请根据用户提供的信息，使用营养规划工具生成合适的饮食计划。
+工具返回紧凑JSON格式的计划（kcal为每日热量目标，macros_g为蛋白质/碳水/脂肪克数），请将其整理为清晰易读的回答。
 """
 
 wellness_agent_prompt = """你是一位专业的心理健康顾问AI助手。你的任务是：
@@ -76,6 +78,7 @@ wellness_agent_prompt = """你是一位专业的心理健康顾问AI助手。你
 4. 提供情绪支持和积极引导
 
 请使用心理健康工具为用户提供有益的建议。
+工具返回紧凑JSON格式的建议，请结合用户情况整理成温和、易读的回答。
 """
 
 # 创建各个代理
@@ -171,8 +174,8 @@ class HealthAssistant:
     def __init__(self):
         self.graph = create_health_assistant_graph()
         
-    def process_request(self, user_input, thread_id="default"):
-        """处理用户请求"""
+    def process_request(self, user_input, thread_id="default", user_id=1):
+        """处理用户请求（user_id 经运行配置传给规划工具，用于派生计划种子）"""
         inputs = {
             "messages": [HumanMessage(content=user_input)]
         }
@@ -180,6 +183,7 @@ class HealthAssistant:
         config = {
             "configurable": {
                 "thread_id": thread_id,
+                "user_id": user_id,
                 "recursion_limit": 15
             }
         }
@@ -0,0 +1,77 @@
+"""
+回填工具 - 由全部历史记录重建增量维护的派生表
+
+用法:
+    python backfill.py streaks anomalies --db data/health_assistant.db
+    python backfill.py anomalies --db data/health_assistant.db --user 1 --user 2
+
+    streaks       连续打卡 (streaks 表)
+    anomalies     异常检测状态和异常记录 (anomaly_states、anomalies 表)
+    daily_totals  每日计数器 (daily_totals 表)
+    goal_events   为没有进度历史的已有目标补写历史 (goal_progress_events 表，不覆盖已有历史)
+
+首次上线相应功能或导入历史数据后运行；之后添加记录或更新目标进度时这些表会增量更新。
+按用户分块重建，每块一个事务。
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Iterable, List, Optional, Sequence
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 回填目标 -> DatabaseManager 上的重建方法
+TARGETS = {
+    "streaks": "rebuild_streaks",
+    "anomalies": "rebuild_anomalies",
+    "daily_totals": "rebuild_daily_totals",
+    "goal_events": "seed_goal_progress_events",
+}
+
+
+def backfill(db_path: str, targets: Iterable[str] = tuple(TARGETS), user_ids: Optional[Sequence[int]] = None,
+             chunksize: int = 5000) -> int:
+    """重建指定的派生表，返回处理的用户数
+
+    Args:
+        db_path: SQLite数据库路径
+        targets: 要重建的目标（TARGETS中的键）
+        user_ids: 只重建这些用户，默认所有用户
+        chunksize: 每个事务包含的用户数
+    """
+    from core.database import DatabaseManager
+
+    db = DatabaseManager(db_path)
+    try:
+        if user_ids is None:
+            user_ids = db.get_user_ids()
+        count = 0
+        for i in range(0, len(user_ids), chunksize):
+            chunk: List[int] = list(user_ids[i:i + chunksize])
+            if not all(getattr(db, TARGETS[target])(chunk) for target in targets):
+                break
+            count += len(chunk)
+        return count
+    finally:
+        db.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="由历史记录重建连续打卡、异常检测、每日计数器和目标进度历史")
+    parser.add_argument("targets", nargs="*", choices=list(TARGETS), default=list(TARGETS),
+                        help="要重建的目标，默认全部")
+    parser.add_argument("--db", default="data/health_assistant.db", help="数据库文件路径")
+    parser.add_argument("--user", type=int, action="append", dest="users", help="只重建指定用户，可重复")
+    parser.add_argument("--chunksize", type=int, default=5000, help="每个事务包含的用户数")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = backfill(args.db, args.targets, args.users, args.chunksize)
+    elapsed = time.perf_counter() - start
+    print(f"✅ 重建 {count} 个用户的 {', '.join(args.targets)}, 用时 {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+批量计划生成 - 为教练的整批学员生成健身和营养计划
+
+用法:
+    python batch_plans.py profiles.jsonl -o plans.jsonl --workers 4
+
+输入为JSON Lines（每行一个用户数据字典）或JSON数组，两种格式都逐条解析，内存占用与
+输入大小无关；输出为JSON Lines，每行一份结构化计划；吞吐量统计输出到stderr。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 每个工作进程内共享的规划器（运动库、食物成分表和计划缓存只加载一次）
+_fitness_planner = None
+_nutrition_planner = None
+
+
+def _init_worker():
+    """初始化工作进程的规划器"""
+    global _fitness_planner, _nutrition_planner
+    from tools import FitnessPlanner, NutritionPlanner
+    _fitness_planner = FitnessPlanner()
+    _nutrition_planner = NutritionPlanner()
+
+
+def _generate_one(user_data: Dict[str, Any], day: date) -> Dict[str, Any]:
+    """为单个用户生成结构化计划"""
+    from tools import resolve_plan_seed
+    seed = resolve_plan_seed(user_data, user_data.get("seed"), day)
+
+    return {
+        "user_id": user_data.get("user_id"),
+        "seed": seed,
+        "workout": _fitness_planner.build_workout_plan(user_data, seed=seed).model_dump(mode="json"),
+        "nutrition": _nutrition_planner.build_nutrition_plan(user_data).model_dump(mode="json"),
+    }
+
+
+def _generate_chunk(chunk: List[Dict[str, Any]], day: date) -> List[Dict[str, Any]]:
+    """生成一批用户的计划（在工作进程中执行）"""
+    if _fitness_planner is None:
+        _init_worker()
+    results = []
+    for user_data in chunk:
+        try:
+            results.append(_generate_one(user_data, day))
+        except Exception as e:
+            results.append({"user_id": user_data.get("user_id"), "error": str(e)})
+    return results
+
+
+def _chunked(items: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """按固定大小切分输入"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate_plans_batch(profiles: Iterable[Dict[str, Any]], workers: Optional[int] = None,
+                         chunksize: int = 64, day: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+    """批量生成计划，按输入顺序流式返回结果
+
+    Args:
+        profiles: 用户数据字典的可迭代对象（可以是生成器）
+        workers: 工作进程数，默认等于CPU核数；为0时在当前进程内顺序生成
+        chunksize: 每个任务包含的用户数
+        day: 用于派生随机种子的日期，默认当天
+    """
+    day = day or date.today()
+
+    if workers == 0:
+        for chunk in _chunked(profiles, chunksize):
+            yield from _generate_chunk(chunk, day)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # 只保留有限数量的在途任务，避免一次性读入全部输入
+        pending = deque()
+        for chunk in _chunked(profiles, chunksize):
+            pending.append(executor.submit(_generate_chunk, chunk, day))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _iter_json_array(stream: Any, block_size: int = 1 << 16) -> Iterator[Any]:
+    """逐个解析JSON数组的元素（开头的 '[' 已被读取），缓冲区只保留当前元素和一个读取块"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    expect_value, count = True, 0
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos < len(buffer):
+            char = buffer[pos]
+            if char == "]" and (not expect_value or count == 0):
+                return
+            if not expect_value:
+                if char != ",":
+                    raise ValueError(f"JSON数组第 {count} 个元素后应为 ',' 或 ']'")
+                pos += 1
+                expect_value = True
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            # 解析失败或数值恰好在缓冲区末尾时（可能被截断），读入更多内容后重试
+            if end is not None and (end < len(buffer) or eof):
+                yield item
+                count += 1
+                pos, expect_value = end, False
+                continue
+        elif eof:
+            raise ValueError("JSON数组未结束")
+        block = stream.read(block_size)
+        buffer, pos, eof = buffer[pos:] + block, 0, not block
+
+
+def _read_profiles(path: str) -> Iterator[Dict[str, Any]]:
+    """流式读取JSON数组或JSON Lines格式的用户数据"""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        first = stream.read(1)
+        while first and first.isspace():
+            first = stream.read(1)
+        if first == "[":
+            yield from _iter_json_array(stream)
+            return
+        buffer = first
+        for line in stream:
+            line = (buffer + line).strip()
+            buffer = ""
+            if line:
+                yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量生成健身和营养计划")
+    parser.add_argument("input", help="用户数据文件（JSON Lines或JSON数组），'-'表示标准输入")
+    parser.add_argument("-o", "--output", default="-", help="输出文件，默认标准输出")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，0表示不使用进程池")
+    parser.add_argument("--chunksize", type=int, default=64, help="每个任务包含的用户数")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    count = 0
+    start = time.perf_counter()
+    try:
+        for plan in generate_plans_batch(_read_profiles(args.input), args.workers, args.chunksize):
+            out.write(json.dumps(plan, ensure_ascii=False, separators=(",", ":")) + "\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"✅ 生成 {count} 份计划, 用时 {elapsed:.2f}s, {rate:.0f} 计划/秒", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+性能基准脚本 - 测量智能健康助手关键路径的耗时
+
+用法:
+    python benchmark.py            # 运行全部基准
+    python benchmark.py nutrition  # 只运行指定基准
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _timeit(func, repeat: int = 5) -> float:
+    """多次运行取最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_nutrition():
+    """基准：一周餐食计划求解"""
+    print("🍎 基准: 一周餐食计划...")
+    from core.nutrition import MealPlanEngine
+
+    engine = MealPlanEngine()
+    profile = {
+        "primary_goal": "muscle gain",
+        "age": 28,
+        "gender": "男",
+        "height": 178,
+        "weight": 72,
+        "activity_level": "中度活跃",
+    }
+
+    def cold_plan():
+        engine._solve_week.cache_clear()
+        engine.plan(profile, days=7)
+
+    cold = _timeit(cold_plan, repeat=20)
+    warm = _timeit(lambda: engine.plan(profile, days=7), repeat=20)
+    print(f"  7天 × 4餐, {len(engine.food_table)} 种食物: 求解 {cold:.2f} ms, 命中缓存 {warm:.2f} ms")
+
+
+def _synthetic_profiles(count: int):
+    """生成模拟学员数据"""
+    import random
+    rng = random.Random(0)
+    goals = ["weight loss", "muscle gain", "endurance", "general fitness"]
+    levels = ["久坐", "轻度活跃", "中度活跃", "高度活跃"]
+    for user_id in range(1, count + 1):
+        yield {
+            "user_id": user_id,
+            "primary_goal": rng.choice(goals),
+            "activity_level": rng.choice(levels),
+            "age": rng.randint(18, 65),
+            "gender": rng.choice(["男", "女"]),
+            "height": rng.randint(150, 195),
+            "weight": rng.randint(45, 110),
+        }
+
+
+def bench_batch():
+    """基准：批量计划生成吞吐量"""
+    print("👥 基准: 批量计划生成...")
+    from batch_plans import generate_plans_batch
+
+    count = 2000
+    for workers in (0, os.cpu_count() or 1):
+        start = time.perf_counter()
+        generated = sum(1 for _ in generate_plans_batch(_synthetic_profiles(count), workers=workers))
+        elapsed = time.perf_counter() - start
+        mode = "单进程" if workers == 0 else f"{workers}个工作进程"
+        print(f"  {generated} 份计划 ({mode}): {elapsed:.2f}s, {generated / elapsed:.0f} 计划/秒")
+
+
+def _estimate_tokens(text: str) -> int:
+    """估算token数：优先使用tiktoken，否则按中文每字1个、其他约每4字符1个估算"""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except ImportError:
+        cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+        return cjk + (len(text) - cjk + 3) // 4
+
+
+def bench_plan_tokens():
+    """基准：每次工具调用返回给LLM的token数（Markdown vs 紧凑JSON）"""
+    print("🧾 基准: 工具输出token数...")
+    from tools import FitnessPlanner, NutritionPlanner, MentalWellnessCoach
+
+    user_data = {"primary_goal": "weight loss", "activity_level": "beginner",
+                 "age": 30, "gender": "女", "height": 162, "weight": 60}
+    plans = {
+        "健身计划": FitnessPlanner().build_workout_plan(user_data, seed=1),
+        "营养计划": NutritionPlanner().build_nutrition_plan(user_data),
+        "心理建议": MentalWellnessCoach().build_wellness_plan(user_data, seed=1),
+    }
+    for name, plan in plans.items():
+        markdown_tokens = _estimate_tokens(plan.to_markdown())
+        compact_tokens = _estimate_tokens(plan.to_compact_json())
+        saved = (1 - compact_tokens / markdown_tokens) * 100
+        print(f"  {name}: Markdown {markdown_tokens} → 紧凑JSON {compact_tokens} tokens (减少 {saved:.0f}%)")
+
+
+def bench_trends():
+    """基准：10万个数据点的趋势计算"""
+    print("📈 基准: 趋势计算 (100k 点)...")
+    import numpy as np
+    from core.trends import linear_trend, rolling_mean, ewma
+
+    n = 100_000
+    rng = np.random.default_rng(0)
+    # 可穿戴设备数据：平均每10分钟一条，间隔不均匀
+    seconds = np.cumsum(rng.integers(60, 1140, size=n))
+    dates = (np.datetime64("2024-01-01T00:00:00") + seconds.astype("timedelta64[s]"))
+    values = 70 + np.cumsum(rng.normal(0, 0.01, size=n))
+
+    def legacy():
+        # 原实现：按行号回归并用列表推导生成趋势线
+        from scipy import stats
+        x_numeric = list(range(len(values)))
+        slope, intercept, _, _, _ = stats.linregress(x_numeric, values)
+        return [slope * x + intercept for x in x_numeric]
+
+    print(f"  原实现 (scipy + 列表推导): {_timeit(legacy, repeat=3):.1f} ms")
+    print(f"  linear_trend: {_timeit(lambda: linear_trend(dates, values)):.1f} ms")
+    print(f"  linear_trend (含显著性): {_timeit(lambda: linear_trend(dates, values, with_stats=True)):.1f} ms")
+    print(f"  rolling_mean (7天): {_timeit(lambda: rolling_mean(dates, values, 7)):.1f} ms")
+    print(f"  ewma (半衰期7天): {_timeit(lambda: ewma(dates, values, 7)):.1f} ms")
+
+
+def _synthetic_records(record_type: str, n: int, low: float, high: float):
+    """生成模拟的高频健康记录（可穿戴设备，约每10分钟一条）"""
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    import numpy as np
+    rng = np.random.default_rng(0)
+    start = datetime(2024, 1, 1)
+    values = np.clip(np.cumsum(rng.normal(0, 0.05, size=n)) + (low + high) / 2, low, high)
+    return [SimpleNamespace(record_type=record_type, date=start + timedelta(minutes=10 * i),
+                            numeric_value=float(v)) for i, v in enumerate(values)]
+
+
+def bench_downsample():
+    """基准：长时间范围图表的降采样（载荷字节数和构建耗时）"""
+    print("📉 基准: 图表降采样 (50k 点)...")
+    from modules.visualization import HealthVisualizer
+
+    weight_records = _synthetic_records("weight", 50_000, 50, 90)
+    mood_records = _synthetic_records("mood", 50_000, 1, 10)
+
+    for label, visualizer in [("不降采样", HealthVisualizer(max_points=None)),
+                              ("LTTB 1500点", HealthVisualizer(max_points=1500, downsample_mode="lttb")),
+                              ("MinMax 1500点", HealthVisualizer(max_points=1500, downsample_mode="minmax"))]:
+        for chart, records, builder in [("体重", weight_records, visualizer.create_weight_trend_chart),
+                                        ("心情", mood_records, visualizer.create_mood_trend_chart)]:
+            elapsed = _timeit(lambda: builder(records), repeat=3)
+            start = time.perf_counter()
+            payload = builder(records).to_json()
+            serialize = (time.perf_counter() - start) * 1000
+            print(f"  {chart}图 ({label}): 构建 {elapsed:.0f} ms, 构建+序列化 {serialize:.0f} ms, "
+                  f"JSON {len(payload) / 1024:.0f} KB")
+
+
+def bench_bucketing():
+    """基准：100万条记录的按日/周/月分桶"""
+    print("🗓️ 基准: 时间分桶 (1M 记录)...")
+    from datetime import datetime, timedelta
+    import numpy as np
+    from core.bucketing import bucket_values
+    from core.trends import datetimes_to_array
+
+    n = 1_000_000
+    rng = np.random.default_rng(0)
+    seconds = np.sort(rng.integers(0, 365 * 86400, size=n))
+    dates = np.datetime64("2025-01-01T00:00:00") + seconds.astype("timedelta64[s]")
+    start, end = np.datetime64("2025-01-01"), np.datetime64("2025-12-31")
+
+    for freq in ("D", "W", "M"):
+        elapsed = _timeit(lambda: bucket_values(dates, start, end, freq), repeat=3)
+        print(f"  bucket_values ({freq}): {elapsed:.1f} ms")
+
+    # 从ORM对象得到的datetime列表需要先转换
+    py_dates = [datetime(2025, 1, 1) + timedelta(seconds=int(s)) for s in seconds[:100_000]]
+    print(f"  datetime列表转换 (100k): {_timeit(lambda: datetimes_to_array(py_dates), repeat=3):.1f} ms")
+
+    def legacy_daily():
+        # 原实现：strftime + 字典累加
+        counts = {}
+        for d in py_dates:
+            key = d.strftime('%Y-%m-%d')
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def legacy_weekly():
+        # 原实现：每天扫描一遍全部记录
+        week = [(py_dates[-1] - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
+        return [sum(1 for d in py_dates if d.strftime('%Y-%m-%d') == day) for day in week]
+
+    print(f"  原实现按日统计 (100k): {_timeit(legacy_daily, repeat=1):.1f} ms")
+    print(f"  原实现周度统计 (100k): {_timeit(legacy_weekly, repeat=1):.1f} ms")
+
+
+def bench_lite_images():
+    """基准：轻量模式静态图片与交互式图表的传输字节数"""
+    print("🖼️ 基准: 轻量模式图表载荷...")
+    import os
+    import plotly
+    from modules.figure_cache import figure_to_image, image_renderer_available
+    from modules.visualization import HealthVisualizer
+
+    if not image_renderer_available():
+        print("  未安装kaleido，跳过")
+        return
+
+    # 交互式图表首次还需加载Plotly前端（此处以plotly.min.js的大小近似）
+    bundle = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+    if os.path.exists(bundle):
+        print(f"  Plotly前端: {os.path.getsize(bundle) / 1024:.0f} KB")
+
+    visualizer = HealthVisualizer()
+    records = {
+        "weight": _synthetic_records("weight", 5_000, 50, 90),
+        "exercise": _synthetic_records("exercise", 2_000, 10, 90),
+        "mood": _synthetic_records("mood", 5_000, 1, 10),
+    }
+    figures = {
+        "体重": visualizer.create_weight_trend_chart(records["weight"]),
+        "心情": visualizer.create_mood_trend_chart(records["mood"]),
+        "组合": visualizer.create_combined_chart(records),
+    }
+    for name, fig in figures.items():
+        fig_json = fig.to_json()
+        png = figure_to_image(fig_json, "png")
+        svg = figure_to_image(fig_json, "svg")
+        print(f"  {name}图: JSON {len(fig_json) / 1024:.0f} KB, PNG {len(png) / 1024:.0f} KB, "
+              f"SVG {len(svg) / 1024:.0f} KB")
+
+
+def bench_quick_record():
+    """基准：快速记录后整页重跑与只重跑指标面板片段的查询数和耗时"""
+    print("⚡ 基准: 快速记录刷新 (Streamlit bare模式)...")
+    import logging
+    import time
+    from core.database import DatabaseManager
+    from modules.dashboard import Dashboard
+    from modules.visualization import HealthVisualizer
+
+    logging.disable(logging.WARNING)
+    db = DatabaseManager(":memory:")
+    for i in range(300):
+        db.add_health_record("weight", "kg", 70 - i * 0.01)
+        db.add_health_record("exercise", "跑步", 30)
+        db.add_health_record("mood", "心情", 6)
+    # bare模式下没有脚本运行上下文，st.fragment不会执行函数体，这里直接调用被包装的函数
+    class PlainDashboard(Dashboard):
+        _render_metric_panel = Dashboard._render_metric_panel.__wrapped__
+
+    dashboard = PlainDashboard(db, HealthVisualizer())
+    dashboard.render_dashboard()
+
+    refreshes = {
+        "整页重跑": dashboard.render_dashboard,
+        "面板片段": lambda: dashboard._render_metric_panel("weight"),
+    }
+    for label, refresh in refreshes.items():
+        with db.track_queries() as stats:
+            start = time.perf_counter()
+            for _ in range(10):
+                db.add_health_record("weight", "kg", 69.5)
+                refresh()
+            elapsed = (time.perf_counter() - start) * 100
+        print(f"  {label}: 每次记录 {stats['queries'] / 10:.1f} 次查询, {elapsed:.0f} ms")
+    logging.disable(logging.NOTSET)
+
+
+def bench_insights():
+    """基准：1万用户、300条规则的洞察批量求值"""
+    print("💡 基准: 洞察规则引擎 (10k 用户 x 300 规则)...")
+    import numpy as np
+    import pandas as pd
+    from core.insights import DEFAULT_RULES, InsightEngine, build_feature_frame
+
+    n_users, n_days = 10_000, 30
+    rng = np.random.default_rng(0)
+    frames = []
+    for metric, low, high in (("weight", 50, 90), ("exercise", 10, 90), ("mood", 1, 10)):
+        users = np.repeat(np.arange(n_users), n_days)
+        days = np.tile(np.datetime64("2025-03-01") - np.arange(n_days), n_users)
+        keep = rng.random(len(users)) < 0.7
+        count = rng.integers(1, 3, size=keep.sum())
+        mean = rng.uniform(low, high, size=keep.sum())
+        frames.append(pd.DataFrame({"user_id": users[keep], "record_type": metric, "day": days[keep],
+                                    "count": count, "sum": mean * count, "mean": mean}))
+    rollups = pd.concat(frames, ignore_index=True)
+
+    # 在默认规则基础上扰动阈值得到300条规则
+    rules = [{**rule, "id": f"{rule['id']}_{i}",
+              "when": [(f, op, v * (1 + 0.01 * i)) for f, op, v in rule["when"]]}
+             for i in range(300 // len(DEFAULT_RULES) + 1) for rule in DEFAULT_RULES][:300]
+    engine = InsightEngine(rules)
+
+    build = _timeit(lambda: build_feature_frame(rollups, "2025-03-01"), repeat=3)
+    frame = build_feature_frame(rollups, "2025-03-01")
+    evaluate = _timeit(lambda: engine.evaluate(frame), repeat=3)
+    print(f"  特征矩阵: {frame.shape[0]} 用户 x {frame.shape[1]} 特征, {build:.0f} ms")
+    print(f"  规则求值: {len(rules)} 条规则, {evaluate:.1f} ms "
+          f"({evaluate * 1000 / n_users:.2f} µs/用户)")
+
+
+def bench_digest():
+    """基准：10万用户的每日摘要批处理，以及页面首次加载读取摘要 vs 实时计算"""
+    print("🌙 基准: 每日摘要批处理 (100k 用户)...")
+    import tempfile
+    from datetime import datetime, timedelta
+    import numpy as np
+    from core.database import DatabaseManager, Goal, HealthRecord, UserProfile
+    from core.digest import user_digest
+    from core.insights import InsightEngine
+    from daily_digest import run_daily_digest
+
+    n_users, per_user = 100_000, 8
+    now = datetime.utcnow()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/digest.db"
+        db = DatabaseManager(db_path)
+        users = np.repeat(np.arange(2, n_users + 1), per_user)
+        types = rng.choice(["weight", "exercise", "mood"], size=len(users))
+        ages = rng.uniform(0, 30, size=len(users))
+        values = rng.uniform(1, 90, size=len(users))
+        with db.engine.begin() as conn:
+            conn.execute(UserProfile.__table__.insert(),
+                         [{"id": uid, "name": f"用户{uid}", "timezone": "Asia/Shanghai"} for uid in range(2, n_users + 1)])
+            conn.execute(HealthRecord.__table__.insert(), [
+                {"user_id": int(u), "record_type": t, "value": "", "numeric_value": float(v),
+                 "date": now - timedelta(days=float(a))}
+                for u, t, a, v in zip(users, types, ages, values)])
+            conn.execute(Goal.__table__.insert(), [
+                {"user_id": uid, "title": "目标", "target_value": 10, "current_value": uid % 10,
+                 "deadline": now + timedelta(days=uid % 30), "status": "active"}
+                for uid in range(2, n_users + 1, 2)])
+
+        for workers in (0, os.cpu_count() or 1):
+            start = time.perf_counter()
+            count = run_daily_digest(db_path, workers=workers, now_utc=now)
+            elapsed = time.perf_counter() - start
+            mode = "单进程" if workers == 0 else f"{workers}个工作进程"
+            print(f"  {count} 份摘要 ({mode}): {elapsed:.1f}s, {count / elapsed:.0f} 用户/秒")
+
+        # 页面首次加载：读取一行预计算摘要 vs 在快照上实时计算
+        snapshot = db.get_dashboard_snapshot(30, user_id=2)
+        records = [r for rs in snapshot.records.values() for r in rs]
+        engine = InsightEngine()
+        read = _timeit(lambda: db.session.expire_all() or db.get_daily_digest(snapshot.local_date, 2), repeat=20)
+        live = _timeit(lambda: user_digest(records, snapshot.active_goals, 2, snapshot.timezone, engine), repeat=20)
+        print(f"  首次加载: 读取摘要 {read:.2f} ms vs 实时计算 {live:.1f} ms")
+        db.close()
+
+
+def bench_anomaly():
+    """基准：流式异常检测的单条更新开销和向量化回填吞吐量"""
+    print("🚨 基准: 异常检测...")
+    import numpy as np
+    import pandas as pd
+    from core.anomaly import detect_series, new_state, update_state
+
+    rng = np.random.default_rng(0)
+    values = rng.normal(70, 1, 10_000)
+    state = new_state()
+    start = time.perf_counter()
+    for value in values:
+        update_state(state, value, 0.2)
+    per_record = (time.perf_counter() - start) / len(values) * 1e6
+    print(f"  流式更新: {per_record:.1f} µs/条 (状态大小固定)")
+
+    n_records, per_series = 1_000_000, 100
+    records = pd.DataFrame({
+        "user_id": np.repeat(np.arange(n_records // per_series), per_series),
+        "record_type": "weight",
+        "value": rng.normal(70, 1, n_records),
+    })
+    elapsed = _timeit(lambda: detect_series(records), repeat=1)
+    print(f"  向量化回填: {n_records} 条记录 ({n_records // per_series} 个序列), "
+          f"{elapsed / 1000:.2f}s, {n_records / elapsed * 1000:.0f} 条/秒")
+
+
+def bench_goal_stats():
+    """基准：10万个目标时的目标统计（分组SQL vs 加载全部已完成目标在Python中统计）"""
+    print("🏆 基准: 目标统计 (100k 目标)...")
+    import tempfile
+    from datetime import datetime, timedelta
+    import numpy as np
+    from core.calendar_utils import period_bounds_utc
+    from core.database import DatabaseManager, Goal
+
+    n_goals = 100_000
+    now = datetime.utcnow()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(f"{tmp}/goals.db")
+        users = rng.choice([1, 2, 3, 4], size=n_goals)  # 用户1约有2.5万个目标
+        statuses = rng.choice(["active", "completed", "completed", "paused"], size=n_goals)
+        ages = rng.uniform(0, 720, size=n_goals)
+        with db.engine.begin() as conn:
+            conn.execute(Goal.__table__.insert(), [
+                {"user_id": int(u), "title": "目标", "category": ["fitness", "weight", "wellness"][i % 3],
+                 "target_value": 10, "current_value": i % 12, "status": s,
+                 "created_at": now - timedelta(days=float(a)),
+                 "completed_at": now - timedelta(days=float(a) / 2) if s == "completed" else None}
+                for i, (u, s, a) in enumerate(zip(users, statuses, ages))])
+
+        def python_stats():
+            db.session.expunge_all()
+            completed = db.session.query(Goal).filter_by(user_id=1, status="completed").all()
+            month_start, _ = period_bounds_utc(db.get_user_timezone(), "month")
+            categories = {}
+            for goal in completed:
+                categories[goal.category] = categories.get(goal.category, 0) + 1
+            return len([g for g in completed if g.completed_at >= month_start]), categories
+
+        sql = _timeit(lambda: db.get_goal_stats(), repeat=10)
+        python = _timeit(python_stats, repeat=3)
+        page = _timeit(lambda: db.get_completed_goals(10, 1000), repeat=10)
+        print(f"  分组SQL {sql:.1f} ms vs 加载全部已完成目标 {python:.0f} ms; 分页(第101页) {page:.2f} ms")
+        db.close()
+
+
+def bench_goal_forecast():
+    """基准：一次向量化计算预测10万个目标（稳健回归）vs 逐个目标 np.polyfit"""
+    print("🔮 基准: 目标完成预测 (100k 目标)...")
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    import numpy as np
+    from core.goal_forecast import fit_progress, forecast_goals
+
+    n_goals, per_goal = 100_000, 20
+    now = datetime.utcnow()
+    rng = np.random.default_rng(0)
+    index = np.repeat(np.arange(n_goals), per_goal)
+    ages = rng.uniform(0, 60, len(index))
+    values = rng.uniform(0, 1, n_goals)[index] * (60 - ages) + rng.normal(0, 1, len(index))
+    events = {"goal_id": index + 1, "at": np.datetime64(now, "s") - (ages * 86400).astype("timedelta64[s]"),
+              "value": values}
+    goals = [SimpleNamespace(id=i + 1, current_value=30.0, target_value=60.0, deadline=now + timedelta(days=30),
+                             metric=None) for i in range(n_goals)]
+
+    batched = _timeit(lambda: forecast_goals(goals, events, now), repeat=3)
+    sample = 2000
+    per_goal_fit = _timeit(lambda: [np.polyfit(ages[index == g], values[index == g], 1) for g in range(sample)],
+                           repeat=1) * n_goals / sample
+    ols = _timeit(lambda: fit_progress(index, -ages, values, n_goals, robust=False), repeat=3)
+    print(f"  {n_goals} 个目标 × {per_goal} 条历史: 批量稳健预测 {batched:.0f} ms (其中OLS {ols:.0f} ms), "
+          f"逐个 polyfit 估计 {per_goal_fit / 1000:.1f}s")
+
+
+BENCHMARKS = {
+    "nutrition": bench_nutrition,
+    "batch": bench_batch,
+    "tokens": bench_plan_tokens,
+    "trends": bench_trends,
+    "downsample": bench_downsample,
+    "bucketing": bench_bucketing,
+    "lite": bench_lite_images,
+    "quick_record": bench_quick_record,
+    "insights": bench_insights,
+    "digest": bench_digest,
+    "anomaly": bench_anomaly,
+    "goal_stats": bench_goal_stats,
+    "goal_forecast": bench_goal_forecast,
+}
+
+
+def main():
+    """主基准函数"""
+    print("⏱️ 智能健康助手 - 性能基准")
+    print("=" * 50)
+
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            print(f"❌ 未知基准: {name}（可选: {', '.join(BENCHMARKS)}）")
+            continue
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main()
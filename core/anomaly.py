@@ -0,0 +1,183 @@
+"""
+异常检测模块 - 体重、心情、睡眠和心率序列的流式异常检测
+
+每个 (用户, 指标) 维护一个固定大小的状态：最近 WINDOW 个数值、EWMA均值/方差和快速EWMA。
+新记录到来时 update_state() 以O(1)更新状态并判断:
+    outlier  单点离群：相对滚动中位数的稳健分数 (x - 中位数) / (1.4826·MAD) 和
+             相对EWMA基线的z分数同时超过阈值
+    drift    急剧漂移：快速EWMA相对滚动中位数的偏离首次超过阈值（持续偏离不重复报警）
+两种分数的尺度都不小于指标的最小尺度，避免数值长期不变时MAD为0导致误报。
+
+detect_series() 在完整历史上向量化计算相同的结果，用于回填。
+"""
+import math
+import statistics
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 检测的指标 -> 最小尺度（体重kg、心情分、睡眠小时、心率次/分）
+ANOMALY_METRICS: Dict[str, float] = {
+    "weight": 0.2,
+    "mood": 0.5,
+    "sleep": 0.25,
+    "heart_rate": 2.0,
+}
+METRIC_LABELS = {"weight": "体重", "mood": "心情", "sleep": "睡眠", "heart_rate": "心率"}
+
+WINDOW = 15           # 滚动中位数/MAD的窗口（之前的记录数）
+EWMA_ALPHA = 0.1      # 基线EWMA的平滑系数
+FAST_ALPHA = 0.3      # 漂移检测用的快速EWMA平滑系数
+OUTLIER_Z = 3.5       # 稳健分数阈值（Iglewicz-Hoaglin）
+EWMA_Z = 3.0          # EWMA z分数阈值
+DRIFT_Z = 2.5         # 快速EWMA偏离中位数的阈值
+MIN_HISTORY = 5       # 至少有这么多条历史记录才开始判断
+MAD_SCALE = 1.4826    # MAD -> 正态分布标准差的换算系数
+
+
+def new_state() -> Dict[str, Any]:
+    """空的检测状态（可JSON序列化）"""
+    return {"window": [], "mean": 0.0, "var": 0.0, "fast": 0.0, "count": 0, "drifting": False}
+
+
+def update_state(state: Dict[str, Any], value: float, min_scale: float) -> Optional[Dict[str, Any]]:
+    """用新数值更新检测状态（原地修改），发现异常时返回 {kind, score, baseline}
+
+    状态大小固定（窗口最多WINDOW个数），每次更新为O(1)。
+    """
+    window: List[float] = state["window"]
+    anomaly = None
+
+    if state["count"] == 0:
+        state["mean"], state["var"], state["fast"] = value, 0.0, value
+    else:
+        # 先用更新前的基线打分
+        median = statistics.median(window)
+        scale = max(MAD_SCALE * statistics.median(abs(v - median) for v in window), min_scale)
+        ewma_std = max(math.sqrt(state["var"]), min_scale)
+        robust_z = (value - median) / scale
+        ewma_z = (value - state["mean"]) / ewma_std
+
+        delta = value - state["mean"]
+        state["mean"] += EWMA_ALPHA * delta
+        state["var"] = (1 - EWMA_ALPHA) * (state["var"] + EWMA_ALPHA * delta * delta)
+        state["fast"] += FAST_ALPHA * (value - state["fast"])
+        drift_z = (state["fast"] - median) / scale
+
+        if state["count"] >= MIN_HISTORY:
+            drifting = abs(drift_z) >= DRIFT_Z
+            if abs(robust_z) >= OUTLIER_Z and abs(ewma_z) >= EWMA_Z:
+                anomaly = {"kind": "outlier", "score": robust_z, "baseline": median}
+            elif drifting and not state["drifting"]:
+                anomaly = {"kind": "drift", "score": drift_z, "baseline": median}
+            state["drifting"] = drifting
+
+    window.append(value)
+    if len(window) > WINDOW:
+        del window[0]
+    state["count"] += 1
+    return anomaly
+
+
+def _previous_windows(values: np.ndarray, position: np.ndarray) -> np.ndarray:
+    """每行之前WINDOW个同组数值组成的矩阵（不足处为NaN）"""
+    windows = np.full((len(values), WINDOW), np.nan)
+    for lag in range(1, WINDOW + 1):
+        valid = position >= lag
+        windows[valid, lag - 1] = values[np.nonzero(valid)[0] - lag]
+    return windows
+
+
+def _row_medians(windows: np.ndarray, position: np.ndarray) -> np.ndarray:
+    """窗口矩阵每行的中位数：窗口已满的行（大多数）直接用 np.median，其余忽略NaN"""
+    medians = np.full(len(windows), np.nan)
+    full = position >= WINDOW
+    partial = (position > 0) & ~full
+    medians[full] = np.median(windows[full], axis=1)
+    medians[partial] = np.nanmedian(windows[partial], axis=1)
+    return medians
+
+
+def _ungroup(result: pd.Series) -> np.ndarray:
+    """分组窗口运算的结果（索引带分组键）-> 按原行顺序排列的数组"""
+    return result.reset_index(level=[0, 1], drop=True).sort_index().to_numpy()
+
+
+def detect_series(records: Any) -> Tuple[pd.DataFrame, Dict[Tuple[int, str], Dict[str, Any]]]:
+    """在完整历史上向量化检测异常（结果与逐条调用 update_state 一致）
+
+    Args:
+        records: 包含 user_id, record_type, value 列的数据框或列字典（可含 record_id, date），
+                 同一 (用户, 指标) 内须按时间排序
+
+    Returns:
+        (异常数据框: 输入列 + kind, score, baseline,
+         (user_id, record_type) -> 处理完全部记录后的检测状态)
+    """
+    records = pd.DataFrame(records)
+    records = records[records["record_type"].isin(list(ANOMALY_METRICS))]
+    records = records.sort_values(["user_id", "record_type"], kind="stable").reset_index(drop=True)
+    if records.empty:
+        return records.assign(kind=[], score=[], baseline=[]), {}
+
+    values = records["value"].to_numpy(dtype=float)
+    groups = records.groupby(["user_id", "record_type"], sort=False)
+    position = groups.cumcount().to_numpy()
+    min_scale = records["record_type"].map(ANOMALY_METRICS).to_numpy(dtype=float)
+
+    # 更新前的滚动中位数和MAD
+    windows = _previous_windows(values, position)
+    median = _row_medians(windows, position)
+    mad = _row_medians(np.abs(windows - median[:, None]), position)
+    scale = np.maximum(MAD_SCALE * mad, min_scale)
+
+    # EWMA递推与 update_state 相同（adjust=False，方差bias=True）
+    slow = groups["value"].ewm(alpha=EWMA_ALPHA, adjust=False)
+    mean = _ungroup(slow.mean())
+    var = _ungroup(slow.var(bias=True))
+    fast = _ungroup(groups["value"].ewm(alpha=FAST_ALPHA, adjust=False).mean())
+    prev_mean = np.where(position > 0, np.roll(mean, 1), np.nan)
+    prev_var = np.where(position > 0, np.roll(var, 1), np.nan)
+
+    robust_z = (values - median) / scale
+    ewma_z = (values - prev_mean) / np.maximum(np.sqrt(np.clip(prev_var, 0, None)), min_scale)
+    drift_z = (fast - median) / scale
+
+    judged = position >= MIN_HISTORY
+    drifting = judged & (np.abs(drift_z) >= DRIFT_Z)
+    was_drifting = np.zeros(len(values), dtype=bool)
+    was_drifting[1:] = drifting[:-1] & (position[1:] > 0)
+    outlier = judged & (np.abs(robust_z) >= OUTLIER_Z) & (np.abs(ewma_z) >= EWMA_Z)
+    drift = drifting & ~was_drifting & ~outlier
+
+    flagged = outlier | drift
+    anomalies = records[flagged].assign(
+        kind=np.where(outlier[flagged], "outlier", "drift"),
+        score=np.where(outlier[flagged], robust_z[flagged], drift_z[flagged]),
+        baseline=median[flagged],
+    )
+
+    # 每组最后一条记录之后的状态
+    states = {}
+    last_rows = np.nonzero(np.r_[position[1:] == 0, True])[0]
+    for row in last_rows:
+        start = row - position[row]
+        states[(int(records.at[row, "user_id"]), records.at[row, "record_type"])] = {
+            "window": values[max(start, row + 1 - WINDOW):row + 1].tolist(),
+            "mean": float(mean[row]),
+            "var": float(var[row]),
+            "fast": float(fast[row]),
+            "count": int(position[row] + 1),
+            "drifting": bool(drifting[row]),
+        }
+    return anomalies.reset_index(drop=True), states
+
+
+def describe_anomaly(record_type: str, kind: str, value: float, baseline: float) -> str:
+    """异常的提示文本"""
+    label = METRIC_LABELS.get(record_type, record_type)
+    if kind == "outlier":
+        return f"❓ {label}记录 {value:g} 明显偏离近期水平（中位数 {baseline:g}），请确认记录是否准确"
+    direction = "上升" if value > baseline else "下降"
+    return f"{'📈' if value > baseline else '📉'} {label}近期出现明显{direction}（{baseline:g} → {value:g}），留意身体状况"
@@ -0,0 +1,91 @@
+"""
+时间分桶模块 - 按日/周/月对记录计数或求和（基于日序号和np.bincount，自动补齐空桶）
+"""
+from typing import Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.trends import datetimes_to_array
+
+# 'D' 按日, 'W' 按周（周一开始）, 'M' 按自然月
+BUCKET_FREQS = ("D", "W", "M")
+# 1970-01-01是周四，加3天后整除7即得到以周一为起点的周序号
+_WEEK_OFFSET = 3
+
+
+def _ordinals(days: np.ndarray, freq: str) -> np.ndarray:
+    """将datetime64[D]数组转换为对应粒度的桶序号"""
+    if freq == "D":
+        return days.astype(np.int64)
+    if freq == "W":
+        return (days.astype(np.int64) + _WEEK_OFFSET) // 7
+    if freq == "M":
+        return days.astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"未知的分桶粒度: {freq}（可选: {', '.join(BUCKET_FREQS)}）")
+
+
+def _ordinal_starts(ordinals: np.ndarray, freq: str) -> np.ndarray:
+    """桶序号 -> 桶起始日期 (datetime64[D])"""
+    if freq == "D":
+        return ordinals.astype("datetime64[D]")
+    if freq == "W":
+        return (ordinals * 7 - _WEEK_OFFSET).astype("datetime64[D]")
+    return ordinals.astype("datetime64[M]").astype("datetime64[D]")
+
+
+def bucket_values(dates: Sequence[Any], start: Any, end: Any, freq: str = "D",
+                  weights: Optional[Sequence[float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """统计 [start, end] 内每个桶的记录数（或weights之和），空桶补0
+
+    Args:
+        dates: 记录时间（datetime64数组或datetime列表）
+        start / end: 首尾日期（包含），按所属桶对齐
+        freq: 'D'、'W' 或 'M'
+        weights: 每条记录的权重（如运动分钟数），默认计数
+
+    Returns:
+        (每个桶的起始日期, 每个桶的值)
+    """
+    days = np.asarray(dates_to_days(dates))
+    first = _ordinals(np.array([np.datetime64(start, "D")]), freq)[0]
+    last = _ordinals(np.array([np.datetime64(end, "D")]), freq)[0]
+    n_buckets = max(int(last - first) + 1, 0)
+
+    idx = _ordinals(days, freq) - first
+    mask = (idx >= 0) & (idx < n_buckets)
+    w = None if weights is None else np.asarray(weights, dtype=float)[mask]
+    values = np.bincount(idx[mask], weights=w, minlength=n_buckets)[:n_buckets]
+    starts = _ordinal_starts(np.arange(first, first + n_buckets), freq)
+    return starts, values
+
+
+def bucket_means(dates: Sequence[Any], values: Sequence[float], start: Any, end: Any,
+                 freq: str = "D") -> Tuple[np.ndarray, np.ndarray]:
+    """计算每个桶内数值的平均值，空桶为NaN"""
+    starts, sums = bucket_values(dates, start, end, freq, weights=values)
+    _, counts = bucket_values(dates, start, end, freq)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return starts, np.where(counts > 0, sums / counts, np.nan)
+
+
+def dates_to_days(dates: Sequence[Any]) -> np.ndarray:
+    """将时间序列截断为日期 (datetime64[D])"""
+    arr = np.asarray(dates)
+    if not np.issubdtype(arr.dtype, np.datetime64):
+        arr = datetimes_to_array(list(dates))
+    return arr.astype("datetime64[D]")
+
+
+def auto_freq(start: Any, end: Any, max_buckets: int) -> str:
+    """选择使桶数不超过max_buckets的最细粒度"""
+    span_days = int((np.datetime64(end, "D") - np.datetime64(start, "D")).astype(int)) + 1
+    if span_days <= max_buckets:
+        return "D"
+    if span_days / 7 <= max_buckets:
+        return "W"
+    return "M"
+
+
+def record_dates(records: Sequence[Any]) -> np.ndarray:
+    """提取健康记录的时间（datetime64[s]，保持原顺序）"""
+    return datetimes_to_array([r.date for r in records])
@@ -0,0 +1,134 @@
+"""
+日历工具模块 - 按用户时区计算日/周/月边界
+
+数据库中的时间统一以无时区的UTC时间存储。所有"今天"、"本周"、"本月"的判断都先在
+用户本地时区求出边界，再换算成UTC边界交给SQL做范围查询，从而继续使用日期索引。
+"""
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_TIMEZONE = "Asia/Shanghai"
+
+# 个人档案页面中可选的常用时区
+COMMON_TIMEZONES = [
+    "Asia/Shanghai",
+    "Asia/Hong_Kong",
+    "Asia/Taipei",
+    "Asia/Singapore",
+    "Asia/Tokyo",
+    "Europe/London",
+    "Europe/Berlin",
+    "America/New_York",
+    "America/Los_Angeles",
+    "Australia/Sydney",
+    "UTC",
+]
+
+PERIODS = ("day", "week", "month")
+
+
+@lru_cache(maxsize=64)
+def get_zone(tz_name: Optional[str]) -> ZoneInfo:
+    """获取时区对象，无效或未设置时使用默认时区"""
+    try:
+        return ZoneInfo(tz_name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def utc_now() -> datetime:
+    """当前UTC时间（无时区，与数据库存储格式一致）"""
+    return datetime.utcnow()
+
+
+def local_now(tz_name: Optional[str], now_utc: Optional[datetime] = None) -> datetime:
+    """用户本地当前时间（无时区）"""
+    now_utc = now_utc or utc_now()
+    return now_utc.replace(tzinfo=timezone.utc).astimezone(get_zone(tz_name)).replace(tzinfo=None)
+
+
+def local_today(tz_name: Optional[str], now_utc: Optional[datetime] = None) -> date:
+    """用户本地的今天"""
+    return local_now(tz_name, now_utc).date()
+
+
+def local_to_utc(local_dt: datetime, tz_name: Optional[str]) -> datetime:
+    """本地时间（无时区）-> UTC时间（无时区）"""
+    return local_dt.replace(tzinfo=get_zone(tz_name)).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utc_to_local(utc_dt: datetime, tz_name: Optional[str]) -> datetime:
+    """UTC时间（无时区）-> 本地时间（无时区）"""
+    return utc_dt.replace(tzinfo=timezone.utc).astimezone(get_zone(tz_name)).replace(tzinfo=None)
+
+
+def day_start_utc(day: date, tz_name: Optional[str]) -> datetime:
+    """本地某天零点对应的UTC时间"""
+    return local_to_utc(datetime.combine(day, datetime.min.time()), tz_name)
+
+
+def period_start(day: date, period: str) -> date:
+    """某天所在日/周（周一开始）/月的第一天"""
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"未知的周期: {period}（可选: {', '.join(PERIODS)}）")
+
+
+def period_bounds_utc(tz_name: Optional[str], period: str = "day",
+                      now_utc: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """当前自然日/周/月在UTC下的 [开始, 结束) 边界"""
+    today = local_today(tz_name, now_utc)
+    start = period_start(today, period)
+    if period == "day":
+        end = start + timedelta(days=1)
+    elif period == "week":
+        end = start + timedelta(days=7)
+    else:
+        end = (start + timedelta(days=32)).replace(day=1)
+    return day_start_utc(start, tz_name), day_start_utc(end, tz_name)
+
+
+def last_n_days_bounds_utc(tz_name: Optional[str], n_days: int,
+                           now_utc: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """包含今天在内的最近n个本地自然日在UTC下的 [开始, 结束) 边界"""
+    today = local_today(tz_name, now_utc)
+    start = today - timedelta(days=n_days - 1)
+    return day_start_utc(start, tz_name), day_start_utc(today + timedelta(days=1), tz_name)
+
+
+def to_local_array(utc_dates: Sequence[Any], tz_name: Optional[str]) -> np.ndarray:
+    """将UTC时间数组向量化转换为本地时间 (datetime64[s])，自动处理夏令时"""
+    arr = np.asarray(utc_dates, dtype="datetime64[s]")
+    if arr.size == 0:
+        return arr
+    index = pd.DatetimeIndex(arr).tz_localize("UTC").tz_convert(get_zone(tz_name).key)
+    return index.tz_localize(None).values.astype("datetime64[s]")
+
+
+def to_local_days(user_ids: Sequence[Any], utc_dates: Sequence[Any], timezones: Optional[Dict[Any, str]] = None,
+                  default_timezone: str = DEFAULT_TIMEZONE) -> np.ndarray:
+    """多个用户的UTC时间 -> 各自时区的本地日期 (datetime64[D])，按时区分组向量化转换"""
+    utc = np.asarray(utc_dates, dtype="datetime64[s]")
+    days = np.empty(len(utc), dtype="datetime64[D]")
+    if len(utc) == 0:
+        return days
+    timezones = timezones or {}
+    tz_names = pd.Series(user_ids).map(lambda uid: timezones.get(uid, default_timezone))
+    # 通常只有少数几个时区
+    for tz_name, positions in tz_names.groupby(tz_names).indices.items():
+        days[positions] = to_local_array(utc[positions], tz_name).astype("datetime64[D]")
+    return days
+
+
+def days_until(deadline_utc: datetime, tz_name: Optional[str], now_utc: Optional[datetime] = None) -> int:
+    """距离截止时间还有多少个本地自然日"""
+    return (utc_to_local(deadline_utc, tz_name).date() - local_today(tz_name, now_utc)).days
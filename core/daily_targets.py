@@ -0,0 +1,55 @@
+"""
+每日目标模块 - 今日进度条的目标定义和进度计算
+
+今日完成量来自 daily_totals 表：添加记录时按用户本地日期增量累加（每条记录一条UPSERT），
+跨过本地零点后自然落在新的一行，无需扫描原始记录。每个用户的目标值以JSON保存在
+用户档案的 daily_targets 列中，未设置的指标使用默认目标。
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+# 指标 -> 名称、单位、完成量的统计方式（total 数值之和 / count 记录条数）和默认目标
+DAILY_TARGETS: Dict[str, Dict[str, Any]] = {
+    "exercise": {"label": "🏃 运动目标", "unit": "分钟", "measure": "total", "default": 30},
+    "water": {"label": "💧 饮水目标", "unit": "杯", "measure": "count", "default": 8},
+}
+
+
+def parse_targets(raw: Optional[str]) -> Dict[str, float]:
+    """用户档案中的目标JSON -> 每个指标的目标值（缺失或无效的使用默认值）"""
+    targets = {metric: float(spec["default"]) for metric, spec in DAILY_TARGETS.items()}
+    try:
+        saved = json.loads(raw) if raw else {}
+    except ValueError:
+        saved = {}
+    for metric, value in saved.items():
+        if metric in targets and isinstance(value, (int, float)) and value > 0:
+            targets[metric] = float(value)
+    return targets
+
+
+def serialize_targets(targets: Dict[str, float]) -> str:
+    """目标值 -> 保存到用户档案的JSON（只保留已知指标）"""
+    return json.dumps({metric: float(targets[metric]) for metric in DAILY_TARGETS if metric in targets})
+
+
+def daily_progress(totals: Dict[str, Dict[str, float]], targets: Dict[str, float]) -> List[Dict[str, Any]]:
+    """今日各指标的完成量和进度
+
+    Args:
+        totals: 记录类型 -> {count, total}（今日计数器）
+        targets: 记录类型 -> 目标值
+    """
+    progress = []
+    for metric, spec in DAILY_TARGETS.items():
+        done = totals.get(metric, {}).get(spec["measure"], 0) or 0
+        target = targets.get(metric, spec["default"])
+        progress.append({
+            "metric": metric,
+            "label": spec["label"],
+            "unit": spec["unit"],
+            "done": done,
+            "target": target,
+            "ratio": min(done / target, 1.0) if target > 0 else 0.0,
+        })
+    return progress
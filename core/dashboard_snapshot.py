@@ -0,0 +1,91 @@
+"""
+仪表板数据快照模块 - 每次渲染只加载一次最近N天的数据，各区域从内存快照派生视图
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from core.calendar_utils import last_n_days_bounds_utc, local_today
+
+
+@dataclass
+class DashboardSnapshot:
+    """仪表板数据快照
+
+    records: 窗口内的记录，按类型分组、时间倒序
+    latest: 每种类型的最新记录（可能早于窗口）
+    active_goals: 活跃目标，按截止时间升序
+    streaks: 连续打卡统计，记录类型 -> {current, longest, last_day}
+    anomalies: 窗口内检测到的异常，时间倒序
+    daily_totals: 今日计数器，记录类型 -> {count, total}
+    daily_targets: 用户的每日目标，记录类型 -> 目标值
+    version: 加载时的数据版本，用于判断快照是否过期
+    """
+    user_id: int
+    days: int
+    timezone: str
+    loaded_at: datetime
+    records: Dict[str, List[Any]] = field(default_factory=dict)
+    latest: Dict[str, Any] = field(default_factory=dict)
+    active_goals: List[Any] = field(default_factory=list)
+    streaks: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    anomalies: List[Any] = field(default_factory=list)
+    daily_totals: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    daily_targets: Dict[str, float] = field(default_factory=dict)
+    version: int = 0
+
+    @property
+    def local_date(self):
+        """加载时用户本地的日期"""
+        return local_today(self.timezone, self.loaded_at)
+
+    def records_by_type(self, record_types: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        """按类型分组的窗口内记录"""
+        if record_types is None:
+            return dict(self.records)
+        return {t: self.records.get(t, []) for t in record_types}
+
+    def recent(self, record_type: Optional[str] = None, days: Optional[int] = None) -> List[Any]:
+        """最近days天（滚动时间窗口）的记录，record_type为None时返回所有类型"""
+        start = self.loaded_at - timedelta(days=days or self.days)
+        return [r for r in self._select(record_type) if r.date >= start]
+
+    def recent_anomalies(self, days: int) -> List[Any]:
+        """最近days天检测到的异常"""
+        start = self.loaded_at - timedelta(days=days)
+        return [a for a in self.anomalies if a.date >= start]
+
+    def local_days(self, record_type: Optional[str] = None, n_days: int = 1) -> List[Any]:
+        """包含今天在内最近n个本地自然日的记录"""
+        start, end = last_n_days_bounds_utc(self.timezone, n_days, self.loaded_at)
+        return [r for r in self._select(record_type) if start <= r.date < end]
+
+    def metric_stats(self, record_type: str) -> Dict[str, Any]:
+        """单项指标卡片数据（与 DatabaseManager.get_metric_stats 一致）"""
+        if record_type == 'weight':
+            latest = self.latest.get('weight')
+            return {'current_weight': latest.numeric_value if latest else 0}
+        if record_type == 'exercise':
+            return {
+                'today_exercises': self.daily_totals.get('exercise', {}).get('count', 0),
+                'week_exercises': len(self.local_days('exercise', 7)),
+            }
+        if record_type == 'mood':
+            latest = self.latest.get('mood')
+            return {'latest_mood': latest.numeric_value if latest else 5}
+        return {}
+
+    def stats(self) -> Dict[str, Any]:
+        """仪表板统计数据（与 DatabaseManager.get_dashboard_stats 一致）"""
+        stats: Dict[str, Any] = {}
+        for record_type in ('weight', 'exercise', 'mood'):
+            stats.update(self.metric_stats(record_type))
+        stats['active_goals'] = len(self.active_goals)
+        return stats
+
+    def _select(self, record_type: Optional[str]) -> List[Any]:
+        """指定类型的记录（时间倒序）"""
+        if record_type is not None:
+            return self.records.get(record_type, [])
+        merged = [r for records in self.records.values() for r in records]
+        return sorted(merged, key=lambda r: r.date, reverse=True)
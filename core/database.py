@@ -1,14 +1,32 @@
 """
 数据持久化模块 - 使用SQLite + SQLAlchemy
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, Boolean
+from sqlalchemy import create_engine, event, func, case, or_, tuple_, Column, Integer, String, Float, Date, DateTime, Text, Boolean, Index, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple, Callable
+from contextlib import contextmanager
+import json
 import os
+import time
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+from core.calendar_utils import (DEFAULT_TIMEZONE, day_start_utc, last_n_days_bounds_utc, local_today,
+                                 period_bounds_utc, period_start, to_local_days)
+from core.dashboard_snapshot import DashboardSnapshot
+from core.streaks import STREAK_TYPES, compute_streaks, streak_summary
+from core.anomaly import ANOMALY_METRICS, detect_series, new_state, update_state
+from core.daily_targets import parse_targets, serialize_targets
+from core.goal_metrics import (GOAL_METRICS, apply_record, goal_reached, goal_span_days, metric_record_type,
+                               start_goal)
+from core.goal_forecast import forecastable
+from core.reminders import DEFAULT_REMINDER_TIME
+
 Base = declarative_base()
 
 class UserProfile(Base):
@@ -25,6 +43,10 @@ class UserProfile(Base):
     fitness_goal = Column(String(100))
     health_conditions = Column(Text)
     dietary_preferences = Column(Text)
+    timezone = Column(String(50), default=DEFAULT_TIMEZONE)  # IANA时区名，用于计算本地日/周/月边界
+    daily_targets = Column(Text)  # 每日目标JSON（如 {"exercise": 30, "water": 8}），为空时使用默认目标
+    reminders_enabled = Column(Boolean, default=True)  # 是否开启目标到期提醒
+    reminder_time = Column(String(5), default=DEFAULT_REMINDER_TIME)  # 每日提醒时间（本地 HH:MM）
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -38,7 +60,12 @@ class HealthRecord(Base):
     value = Column(String(500))
     numeric_value = Column(Float)  # 用于数值类型的记录
     notes = Column(Text)
-    date = Column(DateTime, default=datetime.utcnow)
+    date = Column(DateTime, default=datetime.utcnow)  # UTC时间
+    
+    __table_args__ = (
+        # 按用户、类型和时间范围查询的复合索引
+        Index('ix_health_records_user_type_date', 'user_id', 'record_type', 'date'),
+    )
 
 class Goal(Base):
     """目标管理表"""
@@ -54,8 +81,109 @@ class Goal(Base):
     unit = Column(String(50))
     deadline = Column(DateTime)
     status = Column(String(20), default='active')  # active, completed, paused, cancelled
+    metric = Column(String(50))  # 绑定的指标（见 core.goal_metrics），为空时手动更新进度
+    baseline = Column(Float)  # 建立目标时的基线数值（体重变化类指标）
+    state = Column(Text)  # 增量计算进度的JSON状态
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
+    
+    __table_args__ = (
+        # 按用户、状态统计和按完成时间分页的复合索引
+        Index('ix_goals_user_status_completed', 'user_id', 'status', 'completed_at'),
+        # 按截止日期查询即将到期的活跃目标
+        Index('ix_goals_user_status_deadline', 'user_id', 'status', 'deadline'),
+    )
+
+class GoalProgressEvent(Base):
+    """目标进度历史表（只追加，每次进度变化一行，与进度更新在同一事务中写入，供完成预测和进度历史图使用）"""
+    __tablename__ = 'goal_progress_events'
+    
+    id = Column(Integer, primary_key=True)
+    goal_id = Column(Integer, nullable=False)
+    at = Column(DateTime, nullable=False)  # UTC时间
+    value = Column(Float, nullable=False)  # 变化后的进度
+    
+    __table_args__ = (
+        Index('ix_goal_progress_events_goal_at', 'goal_id', 'at'),
+    )
+
+class UserDailyDigest(Base):
+    """每日摘要表（夜间批处理预先计算，每用户每个本地自然日一行）"""
+    __tablename__ = 'user_daily_digest'
+    
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)  # 用户本地日期
+    timezone = Column(String(50))
+    week_exercise_count = Column(Integer, default=0)
+    week_avg_mood = Column(Float)  # 无心情记录时为空
+    insights = Column(Text)  # JSON数组
+    motivation = Column(String(200))
+    record_key = Column(Integer, default=0)  # 计算时的最新记录id
+    goals_key = Column(String(32))  # 计算时的活跃目标指纹
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class Streak(Base):
+    """连续打卡表（每用户每种记录类型一行，添加记录时增量更新）"""
+    __tablename__ = 'streaks'
+    
+    user_id = Column(Integer, primary_key=True)
+    record_type = Column(String(50), primary_key=True)
+    current = Column(Integer, default=0)  # 截至last_day的连续天数
+    longest = Column(Integer, default=0)
+    last_day = Column(Date)  # 最近一次打卡的本地日期
+
+class AnomalyState(Base):
+    """异常检测状态表（每用户每个指标一行，固定大小的JSON状态）"""
+    __tablename__ = 'anomaly_states'
+    
+    user_id = Column(Integer, primary_key=True)
+    record_type = Column(String(50), primary_key=True)
+    state = Column(Text)  # 最近数值窗口、EWMA均值/方差等，见 core.anomaly
+
+class Anomaly(Base):
+    """检测到的异常记录"""
+    __tablename__ = 'anomalies'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, default=1)
+    record_type = Column(String(50))
+    record_id = Column(Integer)  # 触发异常的健康记录
+    date = Column(DateTime)  # 记录时间（UTC）
+    value = Column(Float)
+    kind = Column(String(20))  # outlier 单点离群, drift 急剧漂移
+    score = Column(Float)  # 稳健分数（离群）或漂移分数
+    baseline = Column(Float)  # 检测时的滚动中位数
+    
+    __table_args__ = (
+        Index('ix_anomalies_user_date', 'user_id', 'date'),
+    )
+
+class DailyTotal(Base):
+    """每日计数器表（每用户每种记录类型每个本地自然日一行，添加记录时增量累加）"""
+    __tablename__ = 'daily_totals'
+    
+    user_id = Column(Integer, primary_key=True)
+    record_type = Column(String(50), primary_key=True)
+    day = Column(Date, primary_key=True)  # 用户本地日期
+    count = Column(Integer, default=0)  # 记录条数
+    total = Column(Float, default=0)  # 数值之和
+
+class GoalReminder(Base):
+    """目标到期提醒表（同一目标每个本地自然日最多一条）"""
+    __tablename__ = 'goal_reminders'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, default=1)
+    goal_id = Column(Integer)
+    day = Column(Date)  # 提醒的用户本地日期
+    message = Column(String(200))
+    read = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ux_goal_reminders_user_goal_day', 'user_id', 'goal_id', 'day', unique=True),
+        Index('ix_goal_reminders_user_read', 'user_id', 'read'),
+    )
 
 class DatabaseManager:
     """数据库管理类"""
@@ -67,16 +195,67 @@ class DatabaseManager:
         self.db_path = db_path
         self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
         
-        # 创建所有表
+        # 已执行的SQL语句数，用于度量页面和操作的查询开销
+        self.statement_count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._count_statement)
+        
+        # 创建所有表，并为旧数据库补齐新增的列和索引
         Base.metadata.create_all(self.engine)
+        self._migrate_schema()
         
-        # 创建会话工厂
-        Session = sessionmaker(bind=self.engine)
+        # 创建会话工厂（提交后不使已加载对象过期，缓存的查询结果无需逐个重新加载）
+        Session = sessionmaker(bind=self.engine, expire_on_commit=False)
         self.session = Session()
         
+        # 数据版本号: (user_id, 数据范围) -> 版本，每次写入递增，供缓存判断数据是否变化
+        # 数据范围为记录类型（'weight'、'exercise'等）或 'profile'、'goals'、'digest'、'streaks'、
+        # 'anomalies'、'daily_totals'、'reminders'
+        self._data_versions: Dict[Tuple[int, str], int] = {}
+        # 写入监听器: callback(user_id, 数据范围)，供读缓存失效使用
+        self._write_listeners: List[Callable[[int, str], None]] = []
+        # 用户档案中的设置缓存（时区、每日目标、提醒设置），档案更新时失效
+        self._profile_settings: Dict[int, Dict[str, Any]] = {}
+        # 目标订阅索引: user_id -> 记录类型 -> 绑定了该类型指标的活跃目标id，目标变化时失效
+        self._goal_subscriptions: Dict[int, Dict[str, List[int]]] = {}
+        
         # 初始化默认用户
         self._init_default_user()
     
+    def _count_statement(self, *args):
+        """SQL执行前回调：累计语句数"""
+        self.statement_count += 1
+    
+    @contextmanager
+    def track_queries(self):
+        """统计代码块执行的SQL语句数和耗时，退出后结果写入产出的字典"""
+        stats = {'queries': 0, 'ms': 0.0}
+        start_count = self.statement_count
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats['queries'] = self.statement_count - start_count
+            stats['ms'] = (time.perf_counter() - start) * 1000
+    
+    def _migrate_schema(self):
+        """为已存在的表添加模型中新增的列和索引（SQLite仅支持ADD COLUMN）"""
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                existing = {c['name'] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    col_type = column.type.compile(dialect=self.engine.dialect)
+                    default = ""
+                    if column.default is not None and column.default.is_scalar:
+                        value = column.default.arg
+                        default = f" DEFAULT '{value}'" if isinstance(value, str) else f" DEFAULT {value}"
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}{default}'))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
+    
     def _init_default_user(self):
         """初始化默认用户"""
         existing_user = self.session.query(UserProfile).filter_by(id=1).first()
@@ -89,16 +268,77 @@ class DatabaseManager:
                 height=170.0,
                 weight=65.0,
                 activity_level="轻度活跃",
-                fitness_goal="保持健康"
+                fitness_goal="保持健康",
+                timezone=DEFAULT_TIMEZONE
             )
             self.session.add(default_user)
             self.session.commit()
     
+    # 数据版本
+    def get_data_version(self, user_id: int = 1, scope: str = None) -> int:
+        """获取数据版本号；未指定范围时返回该用户所有范围版本之和"""
+        if scope is not None:
+            return self._data_versions.get((user_id, scope), 0)
+        return sum(v for (uid, _), v in self._data_versions.items() if uid == user_id)
+    
+    def _bump_data_version(self, user_id: int, scope: str):
+        """写入成功后递增数据版本号，并通知写入监听器"""
+        key = (user_id, scope)
+        self._data_versions[key] = self._data_versions.get(key, 0) + 1
+        for listener in self._write_listeners:
+            listener(user_id, scope)
+    
+    def add_write_listener(self, listener: Callable[[int, str], None]):
+        """注册写入监听器，每次写入提交后以 (user_id, 数据范围) 调用"""
+        self._write_listeners.append(listener)
+    
     # 用户档案相关操作
     def get_user_profile(self, user_id: int = 1) -> Optional[UserProfile]:
         """获取用户档案"""
         return self.session.query(UserProfile).filter_by(id=user_id).first()
     
+    def _get_profile_settings(self, user_id: int) -> Dict[str, Any]:
+        """用户档案中的设置（带缓存，一次查询同时取得时区、每日目标和提醒设置）"""
+        if user_id not in self._profile_settings:
+            user = self.get_user_profile(user_id)
+            self._profile_settings[user_id] = {
+                'timezone': (user.timezone if user else None) or DEFAULT_TIMEZONE,
+                'daily_targets': parse_targets(user.daily_targets if user else None),
+                'reminders_enabled': user.reminders_enabled is not False if user else True,
+                'reminder_time': (user.reminder_time if user else None) or DEFAULT_REMINDER_TIME,
+            }
+        return self._profile_settings[user_id]
+    
+    def get_user_timezone(self, user_id: int = 1) -> str:
+        """获取用户时区（带缓存）"""
+        return self._get_profile_settings(user_id)['timezone']
+    
+    def get_daily_targets(self, user_id: int = 1) -> Dict[str, float]:
+        """获取用户的每日目标（带缓存），未设置的指标使用默认目标"""
+        return dict(self._get_profile_settings(user_id)['daily_targets'])
+    
+    def update_daily_targets(self, targets: Dict[str, float], user_id: int = 1) -> bool:
+        """更新用户的每日目标"""
+        return self.update_user_profile({'daily_targets': serialize_targets(targets)}, user_id)
+    
+    def get_reminder_settings(self, user_id: int = 1) -> Dict[str, Any]:
+        """获取提醒设置（带缓存）: {enabled, time, timezone}"""
+        settings = self._get_profile_settings(user_id)
+        return {'enabled': settings['reminders_enabled'], 'time': settings['reminder_time'],
+                'timezone': settings['timezone']}
+    
+    def update_reminder_settings(self, enabled: bool, reminder_time: str, user_id: int = 1) -> bool:
+        """更新提醒设置（reminder_time 为本地时间 "HH:MM"）"""
+        return self.update_user_profile({'reminders_enabled': enabled, 'reminder_time': reminder_time}, user_id)
+    
+    def get_reminder_schedules(self) -> List[Tuple[int, str, str]]:
+        """所有开启提醒的用户: (user_id, 时区, 提醒时间) 列表，供提醒调度器启动时加载"""
+        rows = self.session.query(UserProfile.id, UserProfile.timezone, UserProfile.reminder_time).filter(
+            or_(UserProfile.reminders_enabled.is_(None), UserProfile.reminders_enabled.is_(True))
+        ).all()
+        return [(uid, tz or DEFAULT_TIMEZONE, reminder_time or DEFAULT_REMINDER_TIME)
+                for uid, tz, reminder_time in rows]
+    
     def update_user_profile(self, user_data: Dict[str, Any], user_id: int = 1) -> bool:
         """更新用户档案"""
         try:
@@ -109,6 +349,8 @@ class DatabaseManager:
                         setattr(user, key, value)
                 user.updated_at = datetime.utcnow()
                 self.session.commit()
+                self._profile_settings.pop(user_id, None)
+                self._bump_data_version(user_id, 'profile')
                 return True
             return False
         except Exception as e:
@@ -121,21 +363,229 @@ class DatabaseManager:
                          notes: str = "", user_id: int = 1) -> bool:
         """添加健康记录"""
         try:
+            now = datetime.utcnow()
             record = HealthRecord(
                 user_id=user_id,
                 record_type=record_type,
                 value=value,
                 numeric_value=numeric_value,
-                notes=notes
+                notes=notes,
+                date=now
             )
             self.session.add(record)
+            # 与记录在同一事务中更新今日计数器、连续打卡、异常检测和订阅的目标
+            day = local_today(self.get_user_timezone(user_id), now)
+            self._update_daily_total(user_id, record_type, day, numeric_value)
+            if record_type in STREAK_TYPES:
+                self._update_streak(user_id, record_type, day)
+            if record_type in ANOMALY_METRICS and numeric_value is not None:
+                self._detect_anomaly(record)
+            goals_changed = self._sync_goal_progress(user_id, record_type, numeric_value, day)
             self.session.commit()
+            self._bump_data_version(user_id, record_type)
+            if goals_changed:
+                self._bump_data_version(user_id, 'goals')
             return True
         except Exception as e:
             self.session.rollback()
             print(f"添加健康记录失败: {e}")
             return False
     
+    def _update_daily_total(self, user_id: int, record_type: str, day: date, numeric_value: Optional[float]):
+        """用一条UPSERT语句累加本地日期的计数器（跨过本地零点后自然写入新的一行）"""
+        table = DailyTotal.__table__
+        value = numeric_value or 0
+        stmt = sqlite_insert(table).values(
+            user_id=user_id, record_type=record_type, day=day, count=1, total=value
+        ).on_conflict_do_update(
+            index_elements=['user_id', 'record_type', 'day'],
+            set_={'count': table.c.count + 1, 'total': table.c.total + value}
+        )
+        self.session.execute(stmt)
+    
+    def get_daily_totals(self, user_id: int = 1) -> Dict[str, Dict[str, float]]:
+        """获取用户本地今天各记录类型的计数器: 记录类型 -> {count, total}"""
+        today = local_today(self.get_user_timezone(user_id))
+        rows = self.session.query(DailyTotal.record_type, DailyTotal.count, DailyTotal.total).filter(
+            DailyTotal.user_id == user_id, DailyTotal.day == today
+        ).all()
+        return {row.record_type: {'count': row.count, 'total': row.total} for row in rows}
+    
+    def rebuild_daily_totals(self, user_ids: Optional[List[int]] = None) -> bool:
+        """由全部历史记录重建每日计数器（回填），user_ids为None时重建所有用户"""
+        try:
+            query = self.session.query(
+                HealthRecord.user_id, HealthRecord.record_type, HealthRecord.date, HealthRecord.numeric_value
+            )
+            timezones = self.session.query(UserProfile.id, UserProfile.timezone)
+            old_totals = self.session.query(DailyTotal)
+            if user_ids is not None:
+                query = query.filter(HealthRecord.user_id.in_(user_ids))
+                timezones = timezones.filter(UserProfile.id.in_(user_ids))
+                old_totals = old_totals.filter(DailyTotal.user_id.in_(user_ids))
+            
+            rows = query.all()
+            tz_map = {uid: tz or DEFAULT_TIMEZONE for uid, tz in timezones}
+            user_col = [r.user_id for r in rows]
+            totals: Dict[Tuple[int, str, Any], List[float]] = {}
+            days = to_local_days(user_col, [r.date for r in rows], tz_map)
+            for row, day in zip(rows, days.tolist()):
+                counter = totals.setdefault((row.user_id, row.record_type, day), [0, 0.0])
+                counter[0] += 1
+                counter[1] += row.numeric_value or 0
+            
+            old_totals.delete(synchronize_session=False)
+            if totals:
+                self.session.execute(DailyTotal.__table__.insert(), [
+                    {'user_id': uid, 'record_type': record_type, 'day': day, 'count': count, 'total': total}
+                    for (uid, record_type, day), (count, total) in totals.items()
+                ])
+            self.session.commit()
+            for user_id in (user_ids if user_ids is not None else {uid for uid, _, _ in totals}):
+                self._bump_data_version(user_id, 'daily_totals')
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"重建每日计数器失败: {e}")
+            return False
+    
+    def _update_streak(self, user_id: int, record_type: str, day: date):
+        """用一条UPSERT语句增量更新连续打卡（O(1)，不读取历史记录）
+        
+        同一天重复打卡不变；last_day 为前一天时连续天数加一；否则从1重新开始。
+        早于 last_day 的日期被忽略（历史数据用 rebuild_streaks 重建）。
+        """
+        table = Streak.__table__
+        current = case(
+            (table.c.last_day >= day, table.c.current),
+            (table.c.last_day == day - timedelta(days=1), table.c.current + 1),
+            else_=1
+        )
+        stmt = sqlite_insert(table).values(
+            user_id=user_id, record_type=record_type, current=1, longest=1, last_day=day
+        ).on_conflict_do_update(
+            index_elements=['user_id', 'record_type'],
+            set_={'current': current,
+                  'longest': func.max(table.c.longest, current),
+                  'last_day': func.max(table.c.last_day, day)}
+        )
+        self.session.execute(stmt)
+    
+    def _detect_anomaly(self, record: HealthRecord):
+        """用新记录更新该指标的流式检测状态（O(1)），发现异常时写入异常表"""
+        row = self.session.get(AnomalyState, (record.user_id, record.record_type), populate_existing=True)
+        if row is None:
+            row = AnomalyState(user_id=record.user_id, record_type=record.record_type)
+            self.session.add(row)
+        state = json.loads(row.state) if row.state else new_state()
+        anomaly = update_state(state, record.numeric_value, ANOMALY_METRICS[record.record_type])
+        row.state = json.dumps(state)
+        if anomaly is not None:
+            self.session.flush()  # 取得记录id
+            self.session.add(Anomaly(
+                user_id=record.user_id, record_type=record.record_type, record_id=record.id,
+                date=record.date, value=record.numeric_value, **anomaly
+            ))
+    
+    def get_anomalies(self, days: int = 30, user_id: int = 1) -> List[Anomaly]:
+        """获取最近N天检测到的异常（时间倒序）"""
+        start_date = datetime.utcnow() - timedelta(days=days)
+        return self.session.query(Anomaly).filter(
+            Anomaly.user_id == user_id, Anomaly.date >= start_date
+        ).order_by(Anomaly.date.desc()).all()
+    
+    def rebuild_anomalies(self, user_ids: Optional[List[int]] = None) -> bool:
+        """在全部历史记录上向量化重新检测异常并重建检测状态（回填），user_ids为None时处理所有用户"""
+        try:
+            query = self.session.query(
+                HealthRecord.id, HealthRecord.user_id, HealthRecord.record_type,
+                HealthRecord.date, HealthRecord.numeric_value
+            ).filter(HealthRecord.record_type.in_(list(ANOMALY_METRICS)), HealthRecord.numeric_value.isnot(None))
+            old_anomalies = self.session.query(Anomaly)
+            old_states = self.session.query(AnomalyState)
+            if user_ids is not None:
+                query = query.filter(HealthRecord.user_id.in_(user_ids))
+                old_anomalies = old_anomalies.filter(Anomaly.user_id.in_(user_ids))
+                old_states = old_states.filter(AnomalyState.user_id.in_(user_ids))
+            rows = query.order_by(HealthRecord.user_id, HealthRecord.record_type,
+                                  HealthRecord.date, HealthRecord.id).all()
+            anomalies, states = detect_series({
+                'record_id': [r.id for r in rows],
+                'user_id': [r.user_id for r in rows],
+                'record_type': [r.record_type for r in rows],
+                'date': [r.date for r in rows],
+                'value': [r.numeric_value for r in rows],
+            })
+            
+            old_anomalies.delete(synchronize_session=False)
+            old_states.delete(synchronize_session=False)
+            if states:
+                self.session.execute(AnomalyState.__table__.insert(), [
+                    {'user_id': uid, 'record_type': record_type, 'state': json.dumps(state)}
+                    for (uid, record_type), state in states.items()
+                ])
+            if len(anomalies):
+                self.session.execute(Anomaly.__table__.insert(), [
+                    {'user_id': int(a.user_id), 'record_type': a.record_type, 'record_id': int(a.record_id),
+                     'date': a.date.to_pydatetime(), 'value': float(a.value), 'kind': a.kind,
+                     'score': float(a.score), 'baseline': float(a.baseline)}
+                    for a in anomalies.itertuples(index=False)
+                ])
+            self.session.commit()
+            for user_id in (user_ids if user_ids is not None else {uid for uid, _ in states}):
+                self._bump_data_version(user_id, 'anomalies')
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"重建异常检测失败: {e}")
+            return False
+    
+    def get_streaks(self, user_id: int = 1) -> Dict[str, Dict[str, Any]]:
+        """获取连续打卡统计：每种类型的 {current, longest, last_day}，current 已按本地今天判断是否中断"""
+        rows = self.session.query(
+            Streak.record_type, Streak.current, Streak.longest, Streak.last_day
+        ).filter(Streak.user_id == user_id).all()
+        today = local_today(self.get_user_timezone(user_id))
+        return streak_summary({row.record_type: row for row in rows}, today)
+    
+    def rebuild_streaks(self, user_ids: Optional[List[int]] = None) -> bool:
+        """由全部历史记录重建连续打卡（回填），user_ids为None时重建所有用户"""
+        try:
+            query = self.session.query(
+                HealthRecord.user_id, HealthRecord.record_type, HealthRecord.date
+            ).filter(HealthRecord.record_type.in_(STREAK_TYPES))
+            timezones = self.session.query(UserProfile.id, UserProfile.timezone)
+            delete = self.session.query(Streak)
+            if user_ids is not None:
+                query = query.filter(HealthRecord.user_id.in_(user_ids))
+                timezones = timezones.filter(UserProfile.id.in_(user_ids))
+                delete = delete.filter(Streak.user_id.in_(user_ids))
+            
+            rows = query.all()
+            records = {
+                'user_id': [r.user_id for r in rows],
+                'record_type': [r.record_type for r in rows],
+            }
+            tz_map = {uid: tz or DEFAULT_TIMEZONE for uid, tz in timezones}
+            records['day'] = to_local_days(records['user_id'], [r.date for r in rows], tz_map)
+            streaks = compute_streaks(records)
+            
+            delete.delete(synchronize_session=False)
+            if len(streaks):
+                self.session.execute(Streak.__table__.insert(), [
+                    {'user_id': int(row.user_id), 'record_type': row.record_type, 'current': int(row.current),
+                     'longest': int(row.longest), 'last_day': row.last_day.date()}
+                    for row in streaks.itertuples(index=False)
+                ])
+            self.session.commit()
+            for user_id in (user_ids if user_ids is not None else tz_map):
+                self._bump_data_version(user_id, 'streaks')
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"重建连续打卡失败: {e}")
+            return False
+    
     def get_health_records(self, record_type: str = None, days: int = 30, 
                           user_id: int = 1) -> List[HealthRecord]:
         """获取健康记录"""
@@ -150,6 +600,46 @@ class DatabaseManager:
         
         return query.order_by(HealthRecord.date.desc()).all()
     
+    def get_health_records_multi(self, record_types: List[str], days: int = 30,
+                                 user_id: int = 1) -> Dict[str, List[HealthRecord]]:
+        """一次查询获取多种类型最近N天的记录，按类型分组（每组按时间倒序）"""
+        start_date = datetime.utcnow() - timedelta(days=days)
+        records = self.session.query(HealthRecord).filter(
+            HealthRecord.user_id == user_id,
+            HealthRecord.record_type.in_(record_types),
+            HealthRecord.date >= start_date
+        ).order_by(HealthRecord.date.desc()).all()
+        
+        grouped: Dict[str, List[HealthRecord]] = {t: [] for t in record_types}
+        for record in records:
+            grouped[record.record_type].append(record)
+        return grouped
+    
+    def get_health_records_between(self, record_type: str, start: datetime, end: datetime,
+                                   user_id: int = 1) -> List[HealthRecord]:
+        """获取 [start, end) 范围内的健康记录（UTC时间，可使用复合索引）"""
+        query = self.session.query(HealthRecord).filter(HealthRecord.user_id == user_id)
+        if record_type:
+            query = query.filter(HealthRecord.record_type == record_type)
+        query = query.filter(HealthRecord.date >= start, HealthRecord.date < end)
+        return query.order_by(HealthRecord.date.desc()).all()
+    
+    def get_records_for_local_days(self, record_type: str = None, n_days: int = 1,
+                                   user_id: int = 1) -> List[HealthRecord]:
+        """获取用户本地时区下包含今天在内最近n个自然日的记录"""
+        start, end = last_n_days_bounds_utc(self.get_user_timezone(user_id), n_days)
+        return self.get_health_records_between(record_type, start, end, user_id)
+    
+    def count_records_between(self, record_type: str, start: datetime, end: datetime,
+                              user_id: int = 1) -> int:
+        """统计 [start, end) 范围内的记录数"""
+        return self.session.query(HealthRecord).filter(
+            HealthRecord.user_id == user_id,
+            HealthRecord.record_type == record_type,
+            HealthRecord.date >= start,
+            HealthRecord.date < end
+        ).count()
+    
     def get_latest_record(self, record_type: str, user_id: int = 1) -> Optional[HealthRecord]:
         """获取最新的某类型记录"""
         return self.session.query(HealthRecord).filter_by(
@@ -160,8 +650,8 @@ class DatabaseManager:
     # 目标管理相关操作
     def create_goal(self, title: str, description: str, category: str, 
                    target_value: float, unit: str, deadline: datetime, 
-                   user_id: int = 1) -> bool:
-        """创建新目标"""
+                   user_id: int = 1, metric: Optional[str] = None) -> bool:
+        """创建新目标（指定metric时进度根据健康记录自动更新）"""
         try:
             goal = Goal(
                 user_id=user_id,
@@ -172,14 +662,149 @@ class DatabaseManager:
                 unit=unit,
                 deadline=deadline
             )
+            if metric is not None:
+                self._start_goal_metric(goal, metric)
             self.session.add(goal)
+            self.session.flush()  # 取得目标id
+            self._add_progress_event(goal)
             self.session.commit()
+            self._goal_subscriptions.pop(user_id, None)
+            self._bump_data_version(user_id, 'goals')
             return True
         except Exception as e:
             self.session.rollback()
             print(f"创建目标失败: {e}")
             return False
     
+    def _start_goal_metric(self, goal: Goal, metric: str):
+        """为绑定指标的新目标设置基线和初始进度（以目标建立时已有的记录为起点）"""
+        spec = GOAL_METRICS[metric]
+        tz_name = self.get_user_timezone(goal.user_id)
+        latest_value, period_count = None, 0
+        if spec['kind'] == 'period_count':
+            period_count = self.count_records_between(
+                spec['record_type'], *period_bounds_utc(tz_name, spec['period']), user_id=goal.user_id)
+        elif spec['kind'] in ('decrease', 'increase'):
+            latest = self.get_latest_record(spec['record_type'], goal.user_id)
+            latest_value = latest.numeric_value if latest else None
+        baseline, state, current = start_goal(metric, local_today(tz_name), latest_value, period_count,
+                                              goal.target_value)
+        goal.metric, goal.baseline, goal.state, goal.current_value = metric, baseline, json.dumps(state), current
+    
+    def _get_goal_subscriptions(self, user_id: int) -> Dict[str, List[int]]:
+        """记录类型 -> 订阅该类型的活跃目标id（带缓存，每个用户只查询一次）"""
+        if user_id not in self._goal_subscriptions:
+            subscriptions: Dict[str, List[int]] = {}
+            for goal_id, metric in self.session.query(Goal.id, Goal.metric).filter(
+                Goal.user_id == user_id, Goal.status == 'active', Goal.metric.isnot(None)
+            ):
+                record_type = metric_record_type(metric)
+                if record_type:
+                    subscriptions.setdefault(record_type, []).append(goal_id)
+            self._goal_subscriptions[user_id] = subscriptions
+        return self._goal_subscriptions[user_id]
+    
+    def _sync_goal_progress(self, user_id: int, record_type: str, numeric_value: Optional[float],
+                            day: date) -> bool:
+        """用新记录增量更新订阅了该记录类型的目标（只读写相关目标），返回是否有目标变化"""
+        changed = False
+        for goal_id in self._get_goal_subscriptions(user_id).get(record_type, ()):
+            goal = self.session.get(Goal, goal_id)
+            if goal is None or goal.status != 'active':
+                continue
+            state = json.loads(goal.state) if goal.state else {}
+            baseline, current = apply_record(goal.metric, goal.baseline, state, numeric_value, day, goal.target_value)
+            if current is None:
+                continue
+            goal.baseline, goal.state, goal.current_value = baseline, json.dumps(state), current
+            self._add_progress_event(goal)
+            if goal_reached(goal.metric, state, current, goal.target_value, goal_span_days(goal)):
+                goal.status = 'completed'
+                goal.completed_at = datetime.utcnow()
+                self._goal_subscriptions.pop(user_id, None)
+            changed = True
+        return changed
+    
+    def _add_progress_event(self, goal: Goal):
+        """在当前事务中追加一条进度历史"""
+        self.session.add(GoalProgressEvent(goal_id=goal.id, at=datetime.utcnow(), value=goal.current_value or 0.0))
+    
+    def get_goal_progress_events(self, goal_ids: List[int], user_id: int = 1) -> Dict[str, List[Any]]:
+        """一次查询读取用户一组目标的进度历史: 列字典 {goal_id, at, value}，按目标和时间排序"""
+        rows = self.session.query(
+            GoalProgressEvent.goal_id, GoalProgressEvent.at, GoalProgressEvent.value
+        ).join(Goal, Goal.id == GoalProgressEvent.goal_id).filter(
+            GoalProgressEvent.goal_id.in_(goal_ids), Goal.user_id == user_id
+        ).order_by(
+            GoalProgressEvent.goal_id, GoalProgressEvent.at, GoalProgressEvent.id
+        ).all() if goal_ids else []
+        return {
+            'goal_id': [r.goal_id for r in rows],
+            'at': [r.at for r in rows],
+            'value': [r.value for r in rows],
+        }
+    
+    def get_goal_progress_series(self, goal_id: int, user_id: int = 1) -> pd.DataFrame:
+        """目标的进度时间序列（供图表使用）: 以UTC时间 at 为索引、float64 列 value 的数据框"""
+        rows = self.session.query(GoalProgressEvent.at, GoalProgressEvent.value).join(
+            Goal, Goal.id == GoalProgressEvent.goal_id
+        ).filter(
+            GoalProgressEvent.goal_id == goal_id, Goal.user_id == user_id
+        ).order_by(GoalProgressEvent.at, GoalProgressEvent.id).all()
+        return self._progress_frame([r.at for r in rows], [r.value for r in rows])
+    
+    @staticmethod
+    def _progress_frame(at: List[Any], values: List[float]) -> pd.DataFrame:
+        """进度事件 -> 以UTC时间 at 为索引、float64 列 value 的数据框"""
+        at = np.array(at, dtype='datetime64[us]')
+        values = np.asarray(values, dtype=np.float64)
+        return pd.DataFrame({'value': values}, index=pd.DatetimeIndex(at, name='at'))
+    
+    @classmethod
+    def split_goal_progress_events(cls, events: Dict[str, List[Any]]) -> Dict[int, pd.DataFrame]:
+        """把 get_goal_progress_events 的列字典按目标切分为进度时间序列（不再查询数据库）
+        
+        事件已按目标和时间排序，每个目标是一段连续的切片。没有历史的目标不在结果中。
+        """
+        goal_ids = np.asarray(events.get('goal_id', []), dtype=np.int64)
+        if not len(goal_ids):
+            return {}
+        at = np.array(events['at'], dtype='datetime64[us]')
+        values = np.asarray(events['value'], dtype=np.float64)
+        starts = np.flatnonzero(np.r_[True, goal_ids[1:] != goal_ids[:-1]])
+        ends = np.r_[starts[1:], len(goal_ids)]
+        return {int(goal_ids[s]): cls._progress_frame(at[s:e], values[s:e]) for s, e in zip(starts, ends)}
+    
+    def seed_goal_progress_events(self, user_ids: Optional[List[int]] = None) -> bool:
+        """为没有进度历史的已有目标补写历史（回填），user_ids为None时处理所有用户
+        
+        历史无法重建，只补写可以确定的点：累积型目标在建立时刻记为0，并在当前时刻记录当前进度；
+        周期计数等非累积型目标只记录当前进度。已有历史的目标不受影响。
+        """
+        try:
+            query = self.session.query(Goal).filter(
+                ~Goal.id.in_(self.session.query(GoalProgressEvent.goal_id).distinct())
+            )
+            if user_ids is not None:
+                query = query.filter(Goal.user_id.in_(user_ids))
+            now = datetime.utcnow()
+            events, seeded_users = [], set()
+            for goal in query:
+                if forecastable(goal) and goal.created_at is not None:
+                    events.append({'goal_id': goal.id, 'at': goal.created_at, 'value': 0.0})
+                events.append({'goal_id': goal.id, 'at': now, 'value': goal.current_value or 0.0})
+                seeded_users.add(goal.user_id)
+            if events:
+                self.session.execute(GoalProgressEvent.__table__.insert(), events)
+            self.session.commit()
+            for user_id in seeded_users:
+                self._bump_data_version(user_id, 'goals')
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"补写目标进度历史失败: {e}")
+            return False
+    
     def get_active_goals(self, user_id: int = 1) -> List[Goal]:
         """获取活跃目标"""
         return self.session.query(Goal).filter_by(
@@ -187,12 +812,89 @@ class DatabaseManager:
             status='active'
         ).order_by(Goal.deadline.asc()).all()
     
+    def get_goals_due_within(self, days: int, user_id: int = 1, now_utc: Optional[datetime] = None) -> List[Goal]:
+        """截止日期在用户本地今天起days天内（含已逾期）的活跃目标，按截止日期排序
+        
+        截止条件换算为UTC边界（days+1天后的本地零点），使用 (user_id, status, deadline) 索引做范围查询。
+        """
+        tz_name = self.get_user_timezone(user_id)
+        end = day_start_utc(local_today(tz_name, now_utc) + timedelta(days=days + 1), tz_name)
+        return self.session.query(Goal).filter(
+            Goal.user_id == user_id, Goal.status == 'active', Goal.deadline < end
+        ).order_by(Goal.deadline.asc()).all()
+    
+    def get_completed_goals(self, limit: int = 10, offset: int = 0, user_id: int = 1) -> List[Goal]:
+        """分页获取已完成目标（按完成时间倒序，使用 (user_id, status, completed_at) 索引）"""
+        return self.session.query(Goal).filter(
+            Goal.user_id == user_id, Goal.status == 'completed'
+        ).order_by(Goal.completed_at.desc(), Goal.id.desc()).limit(limit).offset(offset).all()
+    
+    def get_goal_stats(self, months: int = 12, user_id: int = 1) -> Dict[str, Any]:
+        """目标统计（三条分组SQL，不加载目标对象）
+        
+        Returns:
+            by_status: 状态 -> 目标数
+            avg_progress: 活跃目标的平均完成度（%）
+            by_category: 分类 -> 已完成目标数
+            avg_days: 已完成目标的平均用时（天）
+            by_month: 用户本地月份（'YYYY-MM'）-> 完成数，包含本月在内最近months个月
+            month_completed: 本月完成数
+        """
+        tz_name = self.get_user_timezone(user_id)
+        today = local_today(tz_name)
+        status_rows = self.session.query(
+            Goal.status, func.count(Goal.id),
+            func.avg(case((Goal.target_value > 0, self._goal_progress_expr(today) * 100.0 / Goal.target_value), else_=0))
+        ).filter(Goal.user_id == user_id).group_by(Goal.status).all()
+        
+        completed = (Goal.user_id == user_id, Goal.status == 'completed')
+        days_taken = func.cast(func.julianday(Goal.completed_at) - func.julianday(Goal.created_at), Integer)
+        category_rows = self.session.query(
+            Goal.category, func.count(Goal.id), func.sum(days_taken)
+        ).filter(*completed).group_by(Goal.category).all()
+        
+        # 本地月份的UTC起点（从本月向前），用CASE把完成时间分到各月
+        month = period_start(today, 'month')
+        buckets = []
+        for _ in range(months):
+            buckets.append((day_start_utc(month, tz_name), month.strftime('%Y-%m')))
+            month = period_start(month - timedelta(days=1), 'month')
+        bucket = case(*[(Goal.completed_at >= start, label) for start, label in buckets])
+        month_rows = self.session.query(bucket, func.count(Goal.id)).filter(
+            *completed, Goal.completed_at >= buckets[-1][0]
+        ).group_by(bucket).all()
+        
+        by_month = {label: 0 for _, label in buckets}
+        by_month.update(dict(month_rows))
+        total_completed = sum(count for _, count, _ in category_rows)
+        return {
+            'by_status': {status: count for status, count, _ in status_rows},
+            'avg_progress': next((avg or 0.0 for status, _, avg in status_rows if status == 'active'), 0.0),
+            'by_category': {category: count for category, count, _ in category_rows},
+            'avg_days': sum(days or 0 for _, _, days in category_rows) / total_completed if total_completed else 0.0,
+            'by_month': by_month,
+            'month_completed': by_month[buckets[0][1]],
+        }
+    
+    @staticmethod
+    def _goal_progress_expr(today: date):
+        """SQL表达式：目标在本地 today 的进度（与 goal_metrics.current_progress 一致，
+        周期计数指标的 state.period 不是当前周期时为0）"""
+        stale = [
+            ((Goal.metric == metric)
+             & (func.coalesce(func.json_extract(Goal.state, '$.period'), '') != period_start(today, spec['period']).isoformat()),
+             0.0)
+            for metric, spec in GOAL_METRICS.items() if spec['kind'] == 'period_count'
+        ]
+        return case(*stale, else_=Goal.current_value) if stale else Goal.current_value
+    
     def update_goal_progress(self, goal_id: int, current_value: float) -> bool:
         """更新目标进度"""
         try:
             goal = self.session.query(Goal).filter_by(id=goal_id).first()
             if goal:
                 goal.current_value = current_value
+                self._add_progress_event(goal)
                 
                 # 检查是否完成
                 if current_value >= goal.target_value:
@@ -200,6 +902,8 @@ class DatabaseManager:
                     goal.completed_at = datetime.utcnow()
                 
                 self.session.commit()
+                self._goal_subscriptions.pop(goal.user_id, None)
+                self._bump_data_version(goal.user_id, 'goals')
                 return True
             return False
         except Exception as e:
@@ -207,45 +911,185 @@ class DatabaseManager:
             print(f"更新目标进度失败: {e}")
             return False
     
-    def get_dashboard_stats(self, user_id: int = 1) -> Dict[str, Any]:
-        """获取仪表板统计数据"""
+    def update_goal_status(self, goal_id: int, status: str) -> bool:
+        """更新目标状态（active, completed, paused, cancelled）"""
         try:
-            # 获取最新体重
+            goal = self.session.query(Goal).filter_by(id=goal_id).first()
+            if goal:
+                goal.status = status
+                self.session.commit()
+                self._goal_subscriptions.pop(goal.user_id, None)
+                self._bump_data_version(goal.user_id, 'goals')
+                return True
+            return False
+        except Exception as e:
+            self.session.rollback()
+            print(f"更新目标状态失败: {e}")
+            return False
+    
+    def get_metric_stats(self, record_type: str, user_id: int = 1) -> Dict[str, Any]:
+        """获取单项指标卡片的数据（仅查询该指标，供局部刷新使用）"""
+        if record_type == 'weight':
             latest_weight = self.get_latest_record('weight', user_id)
-            
-            # 获取今日运动记录
-            today = datetime.utcnow().date()
-            today_exercises = self.session.query(HealthRecord).filter(
-                HealthRecord.user_id == user_id,
-                HealthRecord.record_type == 'exercise',
-                HealthRecord.date >= today
-            ).count()
-            
-            # 获取本周运动次数
-            week_start = datetime.utcnow() - timedelta(days=7)
-            week_exercises = self.session.query(HealthRecord).filter(
-                HealthRecord.user_id == user_id,
-                HealthRecord.record_type == 'exercise',
-                HealthRecord.date >= week_start
-            ).count()
-            
-            # 获取最新心情
+            return {'current_weight': latest_weight.numeric_value if latest_weight else 0}
+        if record_type == 'exercise':
+            # 今日与最近7天的运动次数（按用户本地时区的自然日计算）
+            tz_name = self.get_user_timezone(user_id)
+            return {
+                'today_exercises': self.get_daily_totals(user_id).get('exercise', {}).get('count', 0),
+                'week_exercises': self.count_records_between(
+                    'exercise', *last_n_days_bounds_utc(tz_name, 7), user_id=user_id),
+            }
+        if record_type == 'mood':
             latest_mood = self.get_latest_record('mood', user_id)
+            return {'latest_mood': latest_mood.numeric_value if latest_mood else 5}
+        return {}
+    
+    def get_dashboard_snapshot(self, days: int = 30, user_id: int = 1) -> DashboardSnapshot:
+        """一次性加载仪表板所需数据：最近N天的记录（附带每种类型的最新记录）、活跃目标、连续打卡、
+        异常和今日计数器
+        
+        每张表只执行一条查询，仪表板各区域从返回的快照派生数据。
+        """
+        now = datetime.utcnow()
+        start_date = now - timedelta(days=days)
+        
+        # 每种类型的最新记录可能早于窗口，用 (类型, 最新时间) 子查询一并取出
+        latest_dates = self.session.query(
+            HealthRecord.record_type, func.max(HealthRecord.date)
+        ).filter(HealthRecord.user_id == user_id).group_by(HealthRecord.record_type)
+        records = self.session.query(HealthRecord).filter(
+            HealthRecord.user_id == user_id,
+            or_(HealthRecord.date >= start_date,
+                tuple_(HealthRecord.record_type, HealthRecord.date).in_(latest_dates))
+        ).order_by(HealthRecord.date.desc()).all()
+        
+        snapshot = DashboardSnapshot(
+            user_id=user_id,
+            days=days,
+            timezone=self.get_user_timezone(user_id),
+            loaded_at=now,
+            active_goals=self.get_active_goals(user_id),
+            streaks=self.get_streaks(user_id),
+            anomalies=self.get_anomalies(days, user_id),
+            daily_totals=self.get_daily_totals(user_id),
+            daily_targets=self.get_daily_targets(user_id),
+            version=self.get_data_version(user_id)
+        )
+        for record in records:
+            snapshot.latest.setdefault(record.record_type, record)
+            if record.date >= start_date:
+                snapshot.records.setdefault(record.record_type, []).append(record)
+        return snapshot
+    
+    def get_dashboard_stats(self, user_id: int = 1) -> Dict[str, Any]:
+        """获取仪表板统计数据"""
+        try:
+            stats: Dict[str, Any] = {}
+            for record_type in ('weight', 'exercise', 'mood'):
+                stats.update(self.get_metric_stats(record_type, user_id))
             
             # 获取活跃目标数量
-            active_goals_count = len(self.get_active_goals(user_id))
-            
-            return {
-                'current_weight': latest_weight.numeric_value if latest_weight else 0,
-                'today_exercises': today_exercises,
-                'week_exercises': week_exercises,
-                'latest_mood': latest_mood.numeric_value if latest_mood else 5,
-                'active_goals': active_goals_count
-            }
+            stats['active_goals'] = len(self.get_active_goals(user_id))
+            return stats
         except Exception as e:
             print(f"获取仪表板数据失败: {e}")
             return {}
     
+    # 每日摘要相关操作
+    def get_user_ids(self) -> List[int]:
+        """获取所有用户id"""
+        return [row[0] for row in self.session.query(UserProfile.id).order_by(UserProfile.id)]
+    
+    def get_digest_inputs(self, user_ids: List[int], since: datetime) -> Dict[str, Any]:
+        """批量读取一组用户计算每日摘要所需的数据（每张表一条查询）
+        
+        Returns:
+            records: (id, user_id, record_type, date, numeric_value) 元组列表，只含since之后的数值记录
+            timezones: user_id -> 时区
+            goals: user_id -> 活跃目标行（id, current_value, target_value, deadline, metric, state）
+        """
+        records = self.session.query(
+            HealthRecord.id, HealthRecord.user_id, HealthRecord.record_type, HealthRecord.date,
+            HealthRecord.numeric_value
+        ).filter(
+            HealthRecord.user_id.in_(user_ids),
+            HealthRecord.date >= since,
+            HealthRecord.numeric_value.isnot(None)
+        ).all()
+        timezones = {uid: tz or DEFAULT_TIMEZONE for uid, tz in self.session.query(
+            UserProfile.id, UserProfile.timezone
+        ).filter(UserProfile.id.in_(user_ids))}
+        goals: Dict[int, List[Any]] = {}
+        for goal in self.session.query(
+            Goal.id, Goal.user_id, Goal.current_value, Goal.target_value, Goal.deadline, Goal.metric, Goal.state
+        ).filter(Goal.user_id.in_(user_ids), Goal.status == 'active'):
+            goals.setdefault(goal.user_id, []).append(goal)
+        return {'records': records, 'timezones': timezones, 'goals': goals}
+    
+    def save_daily_digests(self, digests: List[Dict[str, Any]]) -> bool:
+        """批量写入每日摘要（同一用户同一天已存在时覆盖）"""
+        if not digests:
+            return True
+        try:
+            rows = [{**d, 'insights': json.dumps(d['insights'], ensure_ascii=False)} for d in digests]
+            stmt = sqlite_insert(UserDailyDigest.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'day'],
+                set_={c: stmt.excluded[c] for c in rows[0] if c not in ('user_id', 'day')}
+            )
+            self.session.execute(stmt, rows)
+            self.session.commit()
+            for user_id in {d['user_id'] for d in digests}:
+                self._bump_data_version(user_id, 'digest')
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"保存每日摘要失败: {e}")
+            return False
+    
+    def get_daily_digest(self, day: date, user_id: int = 1) -> Optional[UserDailyDigest]:
+        """获取用户某个本地自然日的摘要"""
+        return self.session.get(UserDailyDigest, (user_id, day))
+    
+    # 目标提醒相关操作
+    def save_goal_reminders(self, reminders: List[Dict[str, Any]]) -> bool:
+        """批量写入目标提醒（同一目标同一天已提醒过时忽略）"""
+        if not reminders:
+            return True
+        try:
+            stmt = sqlite_insert(GoalReminder.__table__).on_conflict_do_nothing(
+                index_elements=['user_id', 'goal_id', 'day'])
+            self.session.execute(stmt, reminders)
+            self.session.commit()
+            for user_id in {r['user_id'] for r in reminders}:
+                self._bump_data_version(user_id, 'reminders')
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"保存目标提醒失败: {e}")
+            return False
+    
+    def get_unread_reminders(self, user_id: int = 1) -> List[GoalReminder]:
+        """获取未读的目标提醒（最新的在前）"""
+        return self.session.query(GoalReminder).filter(
+            GoalReminder.user_id == user_id, GoalReminder.read.is_(False)
+        ).order_by(GoalReminder.id.desc()).all()
+    
+    def mark_reminders_read(self, user_id: int = 1) -> bool:
+        """将用户的提醒全部标记为已读"""
+        try:
+            self.session.query(GoalReminder).filter(
+                GoalReminder.user_id == user_id, GoalReminder.read.is_(False)
+            ).update({'read': True}, synchronize_session=False)
+            self.session.commit()
+            self._bump_data_version(user_id, 'reminders')
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"标记提醒已读失败: {e}")
+            return False
+    
     def close(self):
         """关闭数据库连接"""
         self.session.close()
@@ -0,0 +1,154 @@
+"""
+数据库读缓存模块 - 按用户和查询签名缓存 DatabaseManager 的读取结果，写入时精确失效
+
+CachedDatabase 是 DatabaseManager 的透明代理：下表中的读取方法走缓存，其余属性和方法
+（写入、会话、数据版本等）直接转发。写入提交后 DatabaseManager 通知写入监听器，
+只清除依赖该用户该数据范围的缓存条目。
+
+未使用 st.cache_data：它会序列化返回值并在所有会话间共享，而ORM对象绑定在各会话
+自己的数据库会话上，不能跨会话共享。
+"""
+import inspect
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Set, Tuple
+
+from core.calendar_utils import local_today
+from core.anomaly import ANOMALY_METRICS
+from core.database import DatabaseManager
+from core.streaks import STREAK_TYPES
+
+# 不限记录类型的查询所依赖的数据范围，任何记录写入都会使其失效
+ANY_RECORD = '*records'
+# 非记录类型的数据范围
+NON_RECORD_SCOPES = ('profile', 'goals', 'digest', 'streaks', 'anomalies', 'daily_totals', 'reminders')
+_MISSING = object()
+
+
+def _record_scope(args: Dict[str, Any]) -> Tuple[str, ...]:
+    """记录查询依赖的数据范围"""
+    return (args.get('record_type') or ANY_RECORD,)
+
+
+# 缓存的读取方法 -> 根据调用参数计算依赖的数据范围
+# 按本地自然日统计的查询还依赖用户档案中的时区
+# get_unread_reminders 不缓存：提醒由后台线程通过另一个数据库连接写入，本进程的写入监听器感知不到
+CACHED_READS: Dict[str, Callable[[Dict[str, Any]], Tuple[str, ...]]] = {
+    'get_user_profile': lambda args: ('profile',),
+    'get_dashboard_stats': lambda args: ('weight', 'exercise', 'mood', 'goals', 'profile', 'daily_totals'),
+    'get_metric_stats': lambda args: (args['record_type'], 'profile', 'daily_totals'),
+    'get_active_goals': lambda args: ('goals',),
+    'get_completed_goals': lambda args: ('goals',),
+    'get_goal_stats': lambda args: ('goals', 'profile'),
+    'get_goals_due_within': lambda args: ('goals', 'profile'),
+    'get_goal_progress_events': lambda args: ('goals',),
+    'get_goal_progress_series': lambda args: ('goals',),
+    'get_health_records': _record_scope,
+    'get_health_records_multi': lambda args: tuple(args['record_types']),
+    'get_health_records_between': _record_scope,
+    'get_records_for_local_days': lambda args: _record_scope(args) + ('profile',),
+    'count_records_between': _record_scope,
+    'get_latest_record': _record_scope,
+    'get_dashboard_snapshot': lambda args: (ANY_RECORD, 'goals', 'profile', 'streaks', 'anomalies', 'daily_totals'),
+    'get_daily_totals': lambda args: (ANY_RECORD, 'daily_totals', 'profile'),
+    'get_anomalies': lambda args: tuple(ANOMALY_METRICS) + ('anomalies',),
+    'get_streaks': lambda args: STREAK_TYPES + ('streaks', 'profile'),
+    'get_daily_digest': lambda args: ('digest',),
+}
+
+
+def _freeze(value: Any) -> Any:
+    """将参数转换为可哈希的缓存键"""
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class CachedDatabase:
+    """带读缓存的数据库代理类
+
+    缓存键为 (方法名, 调用参数, 用户本地日期)，日期保证按天滚动的查询跨天后重新执行；
+    条目按LRU淘汰，并按 (user_id, 数据范围) 建立反向索引用于写入失效。
+    """
+
+    def __init__(self, db: DatabaseManager, maxsize: int = 512):
+        self.db = db
+        self.maxsize = maxsize
+        # 缓存键 -> (查询结果, 登记的反向索引键)
+        self._entries: "OrderedDict[Tuple, Tuple[Any, Tuple]]" = OrderedDict()
+        self._index: Dict[Tuple[int, str], Set[Tuple]] = {}
+        self._signatures = {name: inspect.signature(getattr(DatabaseManager, name)) for name in CACHED_READS}
+        self.hits: Dict[str, int] = {name: 0 for name in CACHED_READS}
+        self.misses: Dict[str, int] = {name: 0 for name in CACHED_READS}
+        self.invalidations = 0
+        db.add_write_listener(self.invalidate)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.db, name)
+        if name in CACHED_READS:
+            return lambda *args, **kwargs: self._cached_call(name, attr, args, kwargs)
+        return attr
+
+    def _cached_call(self, name: str, method: Callable, args: tuple, kwargs: dict):
+        """按参数签名查找缓存，未命中时执行查询并登记依赖的数据范围"""
+        bound = self._signatures[name].bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        arguments.pop('self', None)
+        user_id = arguments.get('user_id', 1)
+        key = (name, _freeze(arguments), local_today(self.db.get_user_timezone(user_id)))
+
+        entry = self._entries.get(key, _MISSING)
+        if entry is not _MISSING:
+            self._entries.move_to_end(key)
+            self.hits[name] += 1
+            return entry[0]
+
+        self.misses[name] += 1
+        result = method(*args, **kwargs)
+        index_keys = tuple((user_id, scope) for scope in CACHED_READS[name](arguments))
+        self._entries[key] = (result, index_keys)
+        for index_key in index_keys:
+            self._index.setdefault(index_key, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+        return result
+
+    def _drop(self, key: Tuple):
+        """删除缓存条目，并从它登记的所有反向索引集合中移除（空集合一并删除）"""
+        _, index_keys = self._entries.pop(key)
+        for index_key in index_keys:
+            keys = self._index.get(index_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[index_key]
+
+    def invalidate(self, user_id: int, scope: str):
+        """写入监听器：清除依赖该用户该数据范围的缓存条目"""
+        scopes = [scope] if scope in NON_RECORD_SCOPES else [scope, ANY_RECORD]
+        for s in scopes:
+            for key in list(self._index.get((user_id, s), ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._index.clear()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """缓存命中统计（总体和按方法）"""
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'entries': len(self._entries),
+            'invalidations': self.invalidations,
+            'methods': {
+                name: {'hits': self.hits[name], 'misses': self.misses[name]}
+                for name in CACHED_READS if self.hits[name] or self.misses[name]
+            },
+        }
@@ -0,0 +1,168 @@
+"""
+每日摘要模块 - 本周统计、健康洞察和目标激励消息的计算，供夜间批处理和页面实时计算共用
+
+夜间批处理（daily_digest.py）为所有用户预先计算当天的摘要写入 user_daily_digest 表，
+当天打开页面时只需读取一行。摘要记录了计算时的数据指纹（最新记录id、活跃目标指纹），
+用户之后记录了新数据或更新了目标时指纹不再匹配，页面回退为实时计算。记录指纹在批处理和页面两侧
+用同一个过滤条件计算（最近 RECORD_KEY_DAYS 个本地自然日内的数值记录），同一天内两侧结果一致。
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core.calendar_utils import DEFAULT_TIMEZONE, days_until, last_n_days_bounds_utc, local_today, utc_now
+from core.goal_metrics import current_progress
+from core.insights import InsightEngine, build_feature_frame, daily_rollups, records_to_frame
+
+# 洞察特征最长窗口30天 + 今天，再多取一天覆盖时区差
+DIGEST_DAYS = 32
+# 距截止日期不超过该天数的目标视为即将到期
+URGENT_GOAL_DAYS = 7
+# 记录指纹窗口（本地自然日）：仪表板快照的30天滚动窗口在夏令时切换时也能完整覆盖
+RECORD_KEY_DAYS = 28
+
+
+def record_key_start(tz_name: str = DEFAULT_TIMEZONE, now_utc: Optional[datetime] = None) -> datetime:
+    """记录指纹窗口的开始时刻（UTC），同一本地自然日内不变"""
+    return last_n_days_bounds_utc(tz_name, RECORD_KEY_DAYS, now_utc)[0]
+
+
+def records_key(records: Iterable[Any], since: datetime) -> int:
+    """记录指纹：since之后最新数值记录的id（记录只增不改，有新的数值记录时必然变化）"""
+    return max((r.id for r in records if r.numeric_value is not None and r.date >= since), default=0)
+
+
+def frame_records_key(records: pd.DataFrame, timezones: Dict[int, str], user_ids: Sequence[int],
+                      now_utc: Optional[datetime] = None) -> Dict[int, int]:
+    """批量计算记录指纹（与 records_key 的过滤条件相同）
+
+    Args:
+        records: 包含 id, user_id, date(UTC) 列的数值记录数据框
+    """
+    since = {uid: record_key_start(timezones.get(uid, DEFAULT_TIMEZONE), now_utc) for uid in user_ids}
+    if records.empty:
+        return {}
+    in_window = records["date"] >= records["user_id"].map(since)
+    return {int(uid): int(key) for uid, key in records.loc[in_window].groupby("user_id")["id"].max().items()}
+
+
+def goals_key(active_goals: Iterable[Any]) -> str:
+    """活跃目标指纹：目标id、进度、目标值和截止时间的摘要"""
+    parts = sorted(f"{g.id}:{g.current_value}:{g.target_value}:{g.deadline}" for g in active_goals)
+    return hashlib.sha1(";".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def motivation_message(active_goals: Sequence[Any], tz_name: str = DEFAULT_TIMEZONE,
+                       now_utc: Optional[datetime] = None) -> str:
+    """根据活跃目标的截止时间和进度生成激励消息"""
+    if not active_goals:
+        return "🎯 设定一个新目标，开始你的成长之旅！"
+
+    # 检查即将到期的目标
+    urgent_goals = [g for g in active_goals if days_until(g.deadline, tz_name, now_utc) <= URGENT_GOAL_DAYS]
+    if urgent_goals:
+        return f"⏰ 有 {len(urgent_goals)} 个目标即将到期，加油冲刺！"
+
+    # 检查进度良好的目标
+    today = local_today(tz_name, now_utc)
+    good_progress_goals = [g for g in active_goals
+                           if g.target_value and (current_progress(g, today) / g.target_value * 100) >= 75]
+    if good_progress_goals:
+        return f"🚀 有 {len(good_progress_goals)} 个目标进展顺利，继续保持！"
+
+    return "💪 每一步努力都在让你更接近目标，继续前进！"
+
+
+def format_week_stats(digest: Dict[str, Any]) -> Dict[str, str]:
+    """摘要中的本周统计 -> 页面展示文本"""
+    avg_mood = digest.get("week_avg_mood")
+    return {
+        "运动次数": f"{digest.get('week_exercise_count', 0)} 次",
+        "平均心情": f"{avg_mood:.1f}/10" if avg_mood else "无记录",
+    }
+
+
+def compute_digests(records: pd.DataFrame, timezones: Dict[int, str],
+                    goals_by_user: Dict[int, List[Any]], user_ids: Sequence[int],
+                    engine: Optional[InsightEngine] = None, now_utc: Optional[datetime] = None,
+                    record_keys: Optional[Dict[int, int]] = None) -> List[Dict[str, Any]]:
+    """批量计算一组用户的当日摘要
+
+    所有用户的记录一起做日汇总、构建一个特征矩阵并一次求值全部洞察规则；
+    本周统计直接取自特征矩阵（最近7个本地自然日的运动次数和心情均值）。
+
+    Args:
+        records: 包含 user_id, record_type, date(UTC), value 列的数据框
+        timezones: user_id -> 时区，未提供的用户使用默认时区
+        goals_by_user: user_id -> 活跃目标列表
+        record_keys: user_id -> 记录指纹（见 records_key），未提供时为0
+    """
+    engine = engine or InsightEngine()
+    now_utc = now_utc or utc_now()
+    record_keys = record_keys or {}
+    today = {uid: local_today(timezones.get(uid, DEFAULT_TIMEZONE), now_utc) for uid in user_ids}
+
+    rollups = daily_rollups(records, timezones)
+    frame = build_feature_frame(rollups, today, user_ids=user_ids)
+    insights = engine.messages(frame)
+    exercise_count = frame["exercise_count_7d"].to_numpy()
+    avg_mood = frame["mood_mean_7d"].to_numpy()
+
+    digests = []
+    for i, uid in enumerate(frame.index):
+        tz_name = timezones.get(uid, DEFAULT_TIMEZONE)
+        goals = goals_by_user.get(uid, [])
+        digests.append({
+            "user_id": int(uid),
+            "day": today[uid],
+            "timezone": tz_name,
+            "week_exercise_count": int(exercise_count[i]),
+            "week_avg_mood": None if np.isnan(avg_mood[i]) else float(avg_mood[i]),
+            "insights": insights[uid],
+            "motivation": motivation_message(goals, tz_name, now_utc),
+            "record_key": int(record_keys.get(uid, 0)),
+            "goals_key": goals_key(goals),
+            "computed_at": now_utc,
+        })
+    return digests
+
+
+def user_digest(records: Sequence[Any], active_goals: Sequence[Any], user_id: int = 1,
+                tz_name: str = DEFAULT_TIMEZONE, engine: Optional[InsightEngine] = None,
+                now_utc: Optional[datetime] = None) -> Dict[str, Any]:
+    """单个用户的当日摘要（页面实时计算时使用）"""
+    now_utc = now_utc or utc_now()
+    return compute_digests(records_to_frame(records, user_id), {user_id: tz_name},
+                           {user_id: list(active_goals)}, [user_id], engine, now_utc,
+                           {user_id: records_key(records, record_key_start(tz_name, now_utc))})[0]
+
+
+def load_digests(db, user_ids: Sequence[int], engine: Optional[InsightEngine] = None,
+                 now_utc: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """从数据库读取一组用户的输入并计算摘要（批处理工作进程中执行）"""
+    now_utc = now_utc or utc_now()
+    inputs = db.get_digest_inputs(user_ids, now_utc - timedelta(days=DIGEST_DAYS))
+    records = pd.DataFrame(inputs["records"], columns=["id", "user_id", "record_type", "date", "value"])
+    record_keys = frame_records_key(records, inputs["timezones"], user_ids, now_utc)
+    return compute_digests(records.drop(columns="id"), inputs["timezones"], inputs["goals"], list(user_ids),
+                           engine, now_utc, record_keys)
+
+
+def digest_from_row(row: Any) -> Dict[str, Any]:
+    """user_daily_digest 表的一行 -> 摘要字典"""
+    return {
+        "user_id": row.user_id,
+        "day": row.day,
+        "timezone": row.timezone,
+        "week_exercise_count": row.week_exercise_count,
+        "week_avg_mood": row.week_avg_mood,
+        "insights": json.loads(row.insights or "[]"),
+        "motivation": row.motivation,
+        "record_key": row.record_key,
+        "goals_key": row.goals_key,
+        "computed_at": row.computed_at,
+    }
@@ -0,0 +1,90 @@
+"""
+降采样模块 - 在保持曲线形状的前提下限制每条图表轨迹的点数
+
+- lttb: Largest-Triangle-Three-Buckets，适合折线趋势
+- minmax: 每个区间保留最小值和最大值，适合需要保留峰值的数据
+"""
+from typing import Any, Sequence, Tuple
+
+import numpy as np
+
+DOWNSAMPLE_MODES = ("lttb", "minmax")
+
+
+def _as_float(x: Sequence[Any]) -> np.ndarray:
+    """将数值或时间序列转换为浮点数组（时间按秒计）"""
+    arr = np.asarray(x)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype("datetime64[s]").astype(np.int64).astype(float)
+    return arr.astype(float)
+
+
+def lttb_indices(x: Sequence[Any], y: Sequence[float], n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets降采样，返回保留点的下标（升序，包含首尾点）"""
+    xf = _as_float(x)
+    yf = np.asarray(y, dtype=float)
+    n = len(yf)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # 首尾点固定，中间n-2个点均分到n_out-2个区间
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # 每个区间的平均点（作为下一区间的第三个顶点）
+    counts = np.diff(edges)
+    x_avg = np.add.reduceat(xf[1:n - 1], edges[:-1] - 1) / counts
+    y_avg = np.add.reduceat(yf[1:n - 1], edges[:-1] - 1) / counts
+    x_avg = np.append(x_avg, xf[-1])
+    y_avg = np.append(y_avg, yf[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 三角形面积（省略常数1/2）: 上一个选中点、本区间候选点、下一区间平均点
+        areas = np.abs(
+            (xf[prev] - x_avg[i + 1]) * (yf[lo:hi] - yf[prev])
+            - (xf[prev] - xf[lo:hi]) * (y_avg[i + 1] - yf[prev])
+        )
+        prev = lo + int(np.argmax(areas))
+        selected[i + 1] = prev
+    return selected
+
+
+def minmax_indices(y: Sequence[float], n_out: int) -> np.ndarray:
+    """按区间保留最小值和最大值，返回保留点的下标（升序，包含首尾点）"""
+    yf = np.asarray(y, dtype=float)
+    n = len(yf)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    buckets = (n_out - 2) // 2
+    bucket_ids = (np.arange(n) * buckets) // n
+    # 按 (区间, 数值) 排序后，每个区间的首元素为最小值、末元素为最大值
+    order = np.lexsort((yf, bucket_ids))
+    sorted_ids = bucket_ids[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    lasts = np.r_[firsts[1:] - 1, n - 1]
+    keep = np.concatenate(([0, n - 1], order[firsts], order[lasts]))
+    return np.unique(keep)
+
+
+def downsample_indices(x: Sequence[Any], y: Sequence[float], max_points: int,
+                       mode: str = "lttb") -> np.ndarray:
+    """按指定模式计算降采样下标；点数未超过上限时返回全部下标"""
+    n = len(y)
+    if not max_points or n <= max_points:
+        return np.arange(n)
+    if mode == "lttb":
+        return lttb_indices(x, y, max_points)
+    if mode == "minmax":
+        return minmax_indices(y, max_points)
+    raise ValueError(f"未知的降采样模式: {mode}（可选: {', '.join(DOWNSAMPLE_MODES)}）")
+
+
+def downsample(x: Sequence[Any], y: Sequence[float], max_points: int,
+               mode: str = "lttb") -> Tuple[np.ndarray, np.ndarray]:
+    """降采样 (x, y) 序列"""
+    idx = downsample_indices(x, y, max_points, mode)
+    return np.asarray(x)[idx], np.asarray(y)[idx]
@@ -0,0 +1,156 @@
+"""
+目标预测模块 - 由进度历史拟合进度速度，预测完成日期和按期完成所需的每日进度
+
+所有目标在一次向量化计算中完成：每个目标的进度事件按 goal 下标分组，用 np.bincount 求出
+加权最小二乘所需的各项和，直接得到每个目标的截距和斜率（进度/天）。稳健拟合用IRLS：
+每轮按残差计算Huber权重，离群的手动更新（如误输入）只得到很小的权重。
+
+只预测累积型进度（手动更新的目标和体重变化类指标）；按周期计数、滑动平均类指标的进度
+会周期性回落，不做线性外推。
+
+进度事件来自 DatabaseManager.get_goal_progress_events 的列字典 {goal_id, at, value}。
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from core.goal_metrics import GOAL_METRICS
+
+HUBER_K = 1.345          # Huber权重的阈值（以残差尺度为单位）
+MAD_SCALE = 1.4826       # MAD -> 正态分布标准差的换算系数
+IRLS_ITERATIONS = 5      # 稳健拟合的迭代次数
+MIN_EVENTS = 2           # 至少需要的进度事件数
+MIN_SPREAD_DAYS = 0.25   # 事件时间标准差的下限（约为两条事件相隔半天），避免同一时刻的多次更新得到无意义的斜率
+MAX_FORECAST_DAYS = 3650  # 预测完成日期的上限（更慢视为无法完成）
+# 不做线性外推的指标类型
+NON_CUMULATIVE_KINDS = ("period_count", "window_mean")
+
+
+def forecastable(goal: Any) -> bool:
+    """目标进度是否为累积型（可以线性外推）"""
+    spec = GOAL_METRICS.get(goal.metric) if goal.metric else None
+    return spec is None or spec["kind"] not in NON_CUMULATIVE_KINDS
+
+
+def _group_median(index: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """每组非负数值的中位数（排序后按组取中间位置，空组为NaN）
+
+    排序键为 组下标 + 数值/略大于最大值的数（落在 [组下标, 组下标+1) 内），一次 argsort
+    即按组、组内按数值排好，比 np.lexsort 快一个数量级。
+    """
+    top = values.max() * (1 + 1e-6) if len(values) else 1.0
+    order = np.argsort(index + values / (top if top > 0 else 1.0))
+    count = np.bincount(index, minlength=n_groups)
+    start = np.concatenate(([0], np.cumsum(count)[:-1]))
+    sorted_values = values[order]
+    lower = np.clip(start + (count - 1) // 2, 0, max(len(values) - 1, 0))
+    upper = np.clip(start + count // 2, 0, max(len(values) - 1, 0))
+    if not len(values):
+        return np.full(n_groups, np.nan)
+    return np.where(count > 0, (sorted_values[lower] + sorted_values[upper]) / 2, np.nan)
+
+
+def fit_progress(index: np.ndarray, t: np.ndarray, y: np.ndarray, n_goals: int,
+                 robust: bool = True) -> Dict[str, np.ndarray]:
+    """对每个目标拟合 y = intercept + slope * t（t 的单位为天）
+
+    Args:
+        index: 每个事件所属目标的下标 (0..n_goals-1)
+        t, y: 事件时间和进度值
+        robust: 是否用Huber权重的IRLS降低离群点的影响
+
+    Returns:
+        intercept（各目标事件平均时刻的拟合值）, slope, count, spread（事件时间的标准差，天）数组，
+        事件不足的目标斜率为NaN
+    """
+    count = np.bincount(index, minlength=n_goals)
+    # 以各目标事件的平均时刻为时间原点，改善数值条件
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_mean = np.where(count > 0, np.bincount(index, t, n_goals) / count, 0.0)
+    t = t - t_mean[index]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread = np.where(count > 0, np.sqrt(np.bincount(index, t * t, n_goals) / count), 0.0)
+
+    weights = np.ones(len(t))
+    iterations = IRLS_ITERATIONS if robust else 1
+    for iteration in range(iterations):
+        sw = np.bincount(index, weights, n_goals)
+        swt = np.bincount(index, weights * t, n_goals)
+        swy = np.bincount(index, weights * y, n_goals)
+        swtt = np.bincount(index, weights * t * t, n_goals)
+        swty = np.bincount(index, weights * t * y, n_goals)
+        denom = sw * swtt - swt * swt
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(denom > 1e-12, (sw * swty - swt * swy) / denom, np.nan)
+            intercept = (swy - slope * swt) / sw
+        if iteration == iterations - 1:
+            break
+
+        residual = np.abs(y - (intercept[index] + slope[index] * t))
+        # 残差尺度：每个目标残差绝对值的中位数（MAD）换算为标准差，不受离群点影响
+        scale = MAD_SCALE * _group_median(index, residual, n_goals)
+        scale = np.where(np.isfinite(scale) & (scale > 1e-9), scale, np.inf)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = np.minimum(1.0, HUBER_K * scale[index] / residual)
+        weights = np.where(np.isfinite(weights), weights, 1.0)
+
+    valid = (count >= MIN_EVENTS) & (spread >= MIN_SPREAD_DAYS)
+    slope = np.where(valid, slope, np.nan)
+    return {"intercept": intercept, "slope": slope, "count": count, "spread": spread}
+
+
+def forecast_goals(goals: Sequence[Any], events: Dict[str, Sequence[Any]],
+                   now_utc: Optional[datetime] = None, robust: bool = True) -> Dict[int, Dict[str, Any]]:
+    """一次性预测一组目标的完成情况
+
+    Args:
+        goals: 活跃目标（id, current_value, target_value, deadline, metric）
+        events: 进度事件列字典 {goal_id, at(UTC), value}
+        now_utc: 预测时刻，默认当前时间
+
+    Returns:
+        goal_id -> {rate: 拟合的每日进度, projected: 预计完成时间(UTC)或None,
+                    required_rate: 按期完成所需的每日进度, on_track: 是否能按期完成或None（无法预测）}
+    """
+    now_utc = now_utc or datetime.utcnow()
+    goals = [g for g in goals if forecastable(g)]
+    if not goals:
+        return {}
+
+    # 事件的 goal_id -> 目标下标
+    ids = np.array([goal.id for goal in goals], dtype=np.int64)
+    order = np.argsort(ids)
+    goal_ids = np.asarray(events.get("goal_id", []), dtype=np.int64)
+    at = np.asarray(events.get("at", []), dtype="datetime64[s]")
+    values = np.asarray(events.get("value", []), dtype=float)
+    found = np.clip(np.searchsorted(ids[order], goal_ids), 0, len(ids) - 1)
+    lookup = np.where(ids[order][found] == goal_ids, order[found], -1)
+    keep = (lookup >= 0) & np.isfinite(values)
+    t = (at[keep] - np.datetime64(now_utc, "s")).astype(np.float64) / 86400.0
+    fit = fit_progress(lookup[keep], t, values[keep], len(goals), robust)
+
+    # 剩余进度、剩余天数、所需每日进度和预计完成天数（按目标向量化）
+    current = np.array([goal.current_value or 0.0 for goal in goals], dtype=float)
+    target = np.array([goal.target_value or 0.0 for goal in goals], dtype=float)
+    deadline = np.array([goal.deadline or now_utc for goal in goals], dtype="datetime64[s]")
+    has_deadline = np.array([goal.deadline is not None for goal in goals])
+    rate = fit["slope"]
+    remaining = target - current
+    days_left = (deadline - np.datetime64(now_utc, "s")).astype(np.float64) / 86400.0
+    required_rate = remaining / np.maximum(days_left, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_needed = np.where(remaining <= 0, 0.0, np.where(rate > 0, remaining / rate, np.inf))
+    reachable = days_needed <= MAX_FORECAST_DAYS
+    predicted = np.isfinite(rate) | (remaining <= 0)
+    on_track = reachable & (~has_deadline | (days_needed <= days_left))
+
+    forecasts = {}
+    for i, goal in enumerate(goals):
+        forecasts[goal.id] = {
+            "rate": float(rate[i]) if np.isfinite(rate[i]) else None,
+            "projected": now_utc + timedelta(days=float(days_needed[i])) if predicted[i] and reachable[i] else None,
+            "required_rate": float(required_rate[i]) if has_deadline[i] else None,
+            "on_track": bool(on_track[i]) if predicted[i] else None,
+        }
+    return forecasts
@@ -0,0 +1,158 @@
+"""
+目标指标模块 - 绑定到健康记录的目标进度定义和增量计算
+
+目标可以绑定一个指标（Goal.metric），此后进度不再需要手动填写：添加匹配类型的健康记录时，
+DatabaseManager 通过 记录类型 -> 订阅目标 的索引只更新相关目标，每个目标用固定大小的JSON
+状态（Goal.state）以O(1)算出新的进度:
+    decrease     相对建立目标时基线的下降量（如减重）
+    increase     相对基线的上升量
+    period_count 当前本地自然日/周内的记录条数（跨周期后从0重新计数）；单个周期达标只计入
+                 达标周期数，期限内的完整周期都达标才算完成目标
+    window_mean  最近N条记录数值的平均值（记录满N条前不判定完成）
+
+饮水、睡眠等指标的记录类型目前在应用内没有录入入口，绑定这些指标的目标仍需手动更新进度
+（见 auto_synced）。
+"""
+import json
+from datetime import date
+from typing import Any, Dict, Optional, Tuple
+
+from core.calendar_utils import period_start
+
+# 指标 -> 名称、来源记录类型、计算方式及参数
+GOAL_METRICS: Dict[str, Dict[str, Any]] = {
+    "weight_loss": {"label": "体重下降量", "record_type": "weight", "kind": "decrease", "unit": "kg"},
+    "weight_gain": {"label": "体重增加量", "record_type": "weight", "kind": "increase", "unit": "kg"},
+    "exercise_weekly": {"label": "本周运动次数", "record_type": "exercise", "kind": "period_count",
+                        "period": "week", "unit": "次/周"},
+    "water_daily": {"label": "今日饮水杯数", "record_type": "water", "kind": "period_count",
+                    "period": "day", "unit": "杯/天"},
+    "sleep_avg": {"label": "近7晚平均睡眠", "record_type": "sleep", "kind": "window_mean",
+                  "window": 7, "unit": "小时/天"},
+}
+
+# period_count 指标的周期长度（天）
+PERIOD_DAYS = {"day": 1, "week": 7}
+
+# 应用内可以录入的记录类型（仪表板的快速记录表单）
+RECORDED_TYPES = ("weight", "exercise", "mood")
+
+
+def metric_record_type(metric: Optional[str]) -> Optional[str]:
+    """指标对应的记录类型（未绑定或未知指标返回None）"""
+    spec = GOAL_METRICS.get(metric) if metric else None
+    return spec["record_type"] if spec else None
+
+
+def auto_synced(metric: Optional[str]) -> bool:
+    """指标的来源记录能否在应用内录入（否则目标进度只能手动更新）"""
+    return metric_record_type(metric) in RECORDED_TYPES
+
+
+def start_goal(metric: str, today: date, latest_value: Optional[float] = None,
+               period_count: int = 0, target: Optional[float] = None) -> Tuple[Optional[float], Dict[str, Any], float]:
+    """建立目标时的初始进度
+
+    Args:
+        metric: 指标
+        today: 用户本地今天
+        latest_value: 来源记录类型的最新数值（作为 decrease/increase 的基线）
+        period_count: 当前周期内已有的记录条数（period_count 指标）
+        target: 目标数值（period_count 指标判断当前周期是否已达标）
+
+    Returns:
+        (基线, 状态, 当前进度)
+    """
+    spec = GOAL_METRICS[metric]
+    if spec["kind"] == "period_count":
+        met = 1 if target is not None and period_count >= target else 0
+        state = {"period": period_start(today, spec["period"]).isoformat(), "count": period_count, "met": met}
+        return None, state, float(period_count)
+    if spec["kind"] == "window_mean":
+        return None, {"values": []}, 0.0
+    return latest_value, {}, 0.0
+
+
+def apply_record(metric: str, baseline: Optional[float], state: Dict[str, Any],
+                 value: Optional[float], day: date,
+                 target: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+    """用一条新记录更新目标状态（原地修改），返回 (基线, 新进度)；记录不影响进度时新进度为None
+
+    Args:
+        baseline: 目标基线，decrease/increase 指标尚无基线时以本条记录为基线
+        value: 记录数值（period_count 指标不需要）
+        day: 记录的用户本地日期
+        target: 目标数值，period_count 指标的周期计数首次达到该值时达标周期数加一
+    """
+    spec = GOAL_METRICS[metric]
+    kind = spec["kind"]
+    if kind == "period_count":
+        period = period_start(day, spec["period"]).isoformat()
+        if state.get("period") != period:
+            state["period"], state["count"] = period, 0
+        state["count"] += 1
+        if target is not None and state["count"] - 1 < target <= state["count"]:
+            state["met"] = state.get("met", 0) + 1
+        return baseline, float(state["count"])
+    if value is None:
+        return baseline, None
+    if kind == "window_mean":
+        values = state.setdefault("values", [])
+        values.append(value)
+        del values[:-spec["window"]]
+        return baseline, sum(values) / len(values)
+    if baseline is None:
+        return value, 0.0
+    change = baseline - value if kind == "decrease" else value - baseline
+    return baseline, max(change, 0.0)
+
+
+def required_periods(metric: str, span_days: int) -> int:
+    """period_count 指标在目标期限（span_days 天）内需要达标的周期数：期限内完整周期的个数，至少1个"""
+    return max(1, span_days // PERIOD_DAYS[GOAL_METRICS[metric]["period"]])
+
+
+def current_progress(goal: Any, today: date) -> float:
+    """目标在用户本地 today 的进度
+
+    周期计数指标的状态只在新记录到达时更新，记录所在的周期结束后（过了本地零点或周一）
+    当前周期还没有记录，进度按0计算。
+    """
+    value = goal.current_value or 0.0
+    metric = getattr(goal, "metric", None)
+    spec = GOAL_METRICS.get(metric) if metric else None
+    if spec is None or spec["kind"] != "period_count":
+        return value
+    state = json.loads(goal.state) if goal.state else {}
+    return value if state.get("period") == period_start(today, spec["period"]).isoformat() else 0.0
+
+
+def goal_span_days(goal: Any) -> int:
+    """目标期限：建立到截止的天数，四舍五入（缺少时间时为0）"""
+    if goal.deadline is None or goal.created_at is None:
+        return 0
+    return round((goal.deadline - goal.created_at).total_seconds() / 86400)
+
+
+def periods_met(goal: Any) -> Optional[Tuple[int, int]]:
+    """周期计数目标的 (已达标周期数, 需要达标的周期数)，其他目标返回None"""
+    spec = GOAL_METRICS.get(goal.metric) if goal.metric else None
+    if spec is None or spec["kind"] != "period_count":
+        return None
+    state = json.loads(goal.state) if goal.state else {}
+    return state.get("met", 0), required_periods(goal.metric, goal_span_days(goal))
+
+
+def goal_reached(metric: str, state: Dict[str, Any], current: float, target: float, span_days: int) -> bool:
+    """绑定指标的目标是否已完成
+
+    Args:
+        current: 当前进度
+        span_days: 目标期限（建立到截止的天数）
+    """
+    spec = GOAL_METRICS[metric]
+    if spec["kind"] == "period_count":
+        return state.get("met", 0) >= required_periods(metric, span_days)
+    if spec["kind"] == "window_mean" and len(state.get("values", [])) < spec["window"]:
+        return False
+    return current >= target
@@ -0,0 +1,259 @@
+"""
+健康洞察规则引擎 - 声明式规则，在按日汇总得到的 用户×特征 矩阵上一次向量化求值
+
+流程:
+    记录 -> daily_rollups() 每用户每类型每个本地自然日的 count/sum/mean
+         -> build_feature_frame() 用户×特征 矩阵（窗口计数/均值/变化/斜率、连续天数、异常分数）
+         -> InsightEngine.evaluate() 所有规则的所有条件一次广播比较
+
+规则格式:
+    {"id": "exercise_low",
+     "when": [("exercise_count_7d", "<", 3)],        # 条件之间为"且"，特征缺失(NaN)时条件不成立
+     "message": "🏃 本周运动{exercise_count_7d:.0f}次，建议增加到每周3-5次",  # 可引用特征
+     "priority": 0}                                   # 越大越靠前，相同时保持定义顺序
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core.calendar_utils import DEFAULT_TIMEZONE, local_today, to_local_days
+
+INSIGHT_METRICS = ("weight", "exercise", "mood", "sleep", "water")
+FEATURE_WINDOWS = (7, 14, 30)
+# 计算异常分数时作为基线的天数（不含最新一天）
+ANOMALY_BASELINE_DAYS = 30
+
+# 比较运算 -> 向量化函数（NaN参与比较结果为False）
+OPS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": lambda a, b: np.not_equal(a, b) & ~np.isnan(a),
+    "abs>": lambda a, b: np.abs(a) > b,
+    "abs<": lambda a, b: np.abs(a) < b,
+}
+_OP_CODES = {op: i for i, op in enumerate(OPS)}
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"id": "exercise_low", "when": [("exercise_count_7d", "<", 3)],
+     "message": "🏃 本周运动次数较少，建议增加到每周3-5次运动"},
+    {"id": "exercise_great", "when": [("exercise_count_7d", ">=", 5)],
+     "message": "🎉 本周运动频率很棒，继续保持！"},
+    {"id": "exercise_streak", "when": [("exercise_streak", ">=", 3)],
+     "message": "🔥 已连续{exercise_streak:.0f}天运动，保持节奏！"},
+    {"id": "mood_low", "when": [("mood_mean_7d", "<", 5)],
+     "message": "😟 最近心情偏低，建议多做一些放松活动"},
+    {"id": "mood_good", "when": [("mood_mean_7d", ">=", 7)],
+     "message": "😊 最近心情不错，保持积极的生活态度！"},
+    {"id": "mood_dropping", "when": [("mood_slope_14d", "<", -0.2), ("mood_days_14d", ">=", 5)],
+     "message": "📉 近两周心情呈下降趋势，记得照顾好自己"},
+    {"id": "mood_anomaly", "when": [("mood_zscore", "<", -2)],
+     "message": "⚠️ 今天的心情明显低于平时，需要聊聊吗？"},
+    {"id": "weight_up", "when": [("weight_change_14d", ">", 1)],
+     "message": "⚖️ 近期体重增加了{weight_change_14d:.1f}kg，注意饮食和运动平衡"},
+    {"id": "weight_down", "when": [("weight_change_14d", "<", -1)],
+     "message": "⚖️ 近期体重减少了{weight_abs_change_14d:.1f}kg，注意饮食和运动平衡"},
+    {"id": "sleep_short", "when": [("sleep_mean_7d", "<", 6)],
+     "message": "😴 最近平均睡眠不足6小时，尽量早点休息"},
+    {"id": "water_low", "when": [("water_count_7d", ">", 0), ("water_sum_7d", "<", 28)],
+     "message": "💧 本周饮水偏少，建议每天8杯水"},
+]
+
+FALLBACK_INSIGHT = "📊 继续记录数据，我们将为您提供更多个性化建议"
+
+
+def records_to_frame(records: Iterable[Any], user_id: Optional[int] = None) -> pd.DataFrame:
+    """将健康记录转换为 (user_id, record_type, date, value) 数据框，忽略没有数值的记录"""
+    rows = [(user_id if user_id is not None else r.user_id, r.record_type, r.date, r.numeric_value)
+            for r in records if r.numeric_value is not None]
+    return pd.DataFrame(rows, columns=["user_id", "record_type", "date", "value"])
+
+
+def daily_rollups(records: pd.DataFrame, timezones: Optional[Dict[int, str]] = None,
+                  default_timezone: str = DEFAULT_TIMEZONE) -> pd.DataFrame:
+    """按用户本地自然日汇总记录
+
+    Args:
+        records: 包含 user_id, record_type, date(UTC), value 列的数据框
+        timezones: user_id -> 时区，未提供的用户使用default_timezone
+
+    Returns:
+        user_id, record_type, day(datetime64[D]), count, sum, mean 列的数据框
+    """
+    if records.empty:
+        return pd.DataFrame(columns=["user_id", "record_type", "day", "count", "sum", "mean"])
+
+    days = to_local_days(records["user_id"].to_numpy(), records["date"].to_numpy(dtype="datetime64[s]"),
+                         timezones, default_timezone)
+
+    grouped = records.assign(day=days).groupby(["user_id", "record_type", "day"], sort=True)["value"]
+    rollups = grouped.agg(["count", "sum"]).reset_index()
+    rollups["mean"] = rollups["sum"] / rollups["count"]
+    return rollups
+
+
+def build_feature_frame(rollups: pd.DataFrame, today: Any,
+                        metrics: Sequence[str] = INSIGHT_METRICS,
+                        windows: Sequence[int] = FEATURE_WINDOWS,
+                        user_ids: Optional[Sequence[int]] = None) -> pd.DataFrame:
+    """由日汇总构建 用户×特征 矩阵
+
+    today可以是单个日期，或 user_id -> 本地日期 的映射（各用户时区不同）。
+    每个指标m、窗口w生成的特征:
+        m_count_wd  记录条数（无记录为0）      m_days_wd    有记录的天数（无记录为0）
+        m_sum_wd    数值之和                    m_mean_wd    记录均值
+        m_change_wd 窗口内末日均值 - 首日均值   m_abs_change_wd 其绝对值
+        m_slope_wd  日均值对日期的回归斜率（每天）
+    以及 m_last 最新日均值、m_streak 截至今天（或昨天）的连续记录天数、
+    m_zscore 最新日均值相对之前ANOMALY_BASELINE_DAYS天日均值的标准分数。
+    """
+    if user_ids is None:
+        user_ids = np.unique(rollups["user_id"].to_numpy()) if len(rollups) else []
+    index = pd.Index(user_ids, name="user_id")
+    features: Dict[str, pd.Series] = {}
+
+    if len(rollups):
+        if isinstance(today, dict):
+            today_days = rollups["user_id"].map(today).to_numpy(dtype="datetime64[D]")
+        else:
+            today_days = np.datetime64(today, "D")
+        age = (today_days - rollups["day"].to_numpy(dtype="datetime64[D]")).astype(np.int64)
+        rollups = rollups.assign(age=age)
+        rollups = rollups[rollups["age"] >= 0]
+
+    for metric in metrics:
+        rows = rollups[rollups["record_type"] == metric] if len(rollups) else rollups
+        for w in windows:
+            features.update(_window_features(rows, metric, w))
+        features.update(_recency_features(rows, metric))
+
+    frame = pd.DataFrame(features).reindex(index)
+    counts = [c for c in frame.columns if "_count_" in c or "_days_" in c or c.endswith("_streak")]
+    frame[counts] = frame[counts].fillna(0)
+    return frame
+
+
+def _window_features(rows: pd.DataFrame, metric: str, w: int) -> Dict[str, pd.Series]:
+    """单个窗口的计数、均值、变化和斜率特征"""
+    names = [f"{metric}_{stat}_{w}d" for stat in ("count", "days", "sum", "mean", "change", "abs_change", "slope")]
+    if rows.empty:
+        return {name: pd.Series(dtype=float) for name in names}
+
+    win = rows[rows["age"] < w].sort_values(["user_id", "age"])
+    g = win.groupby("user_id")
+    count = g["count"].sum()
+    total = g["sum"].sum()
+    # 窗口内末日（age最小）与首日（age最大）的日均值之差
+    change = g["mean"].first() - g["mean"].last()
+
+    # 日均值对日期的最小二乘斜率: x = -age（越近越大）
+    x = -win["age"].astype(float)
+    y = win["mean"]
+    sums = pd.DataFrame({"user_id": win["user_id"], "x": x, "y": y, "xy": x * y, "xx": x * x}).groupby("user_id").sum()
+    n = g.size()
+    denom = n * sums["xx"] - sums["x"] ** 2
+    slope = (n * sums["xy"] - sums["x"] * sums["y"]) / denom.where(denom > 0)
+
+    return dict(zip(names, (count, n, total, total / count, change, change.abs(), slope)))
+
+
+def _recency_features(rows: pd.DataFrame, metric: str) -> Dict[str, pd.Series]:
+    """最新值、连续天数和异常分数"""
+    names = (f"{metric}_last", f"{metric}_streak", f"{metric}_zscore")
+    if rows.empty:
+        return {name: pd.Series(dtype=float) for name in names}
+
+    ordered = rows.sort_values(["user_id", "age"])
+    g = ordered.groupby("user_id")
+    last = g["mean"].first()
+
+    # 按age升序排列后，连续天数内的第i天满足 age == 首个age + i（首个age须为0或1）
+    first_age = g["age"].transform("first")
+    position = g.cumcount()
+    in_streak = (ordered["age"] == first_age + position) & (first_age <= 1)
+    streak = in_streak.groupby(ordered["user_id"]).sum()
+
+    # 最新一天相对之前基线期的标准分数
+    latest_age = g["age"].transform("first")
+    baseline = ordered[(ordered["age"] > latest_age) & (ordered["age"] <= latest_age + ANOMALY_BASELINE_DAYS)]
+    stats = baseline.groupby("user_id")["mean"].agg(["mean", "std"])
+    std = stats["std"].where(stats["std"] > 0)
+    zscore = (last.reindex(stats.index) - stats["mean"]) / std
+
+    return dict(zip(names, (last, streak, zscore)))
+
+
+class InsightEngine:
+    """洞察规则引擎
+
+    规则在初始化时编译为按规则连续排列的条件数组: 特征列下标、运算码、阈值。
+    求值时先对 用户×条件 做一次广播比较（每种运算一次），再用 logical_and.reduceat
+    按规则分段归约，所有条件成立即触发。
+    """
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None):
+        self.rules = list(rules if rules is not None else DEFAULT_RULES)
+        conditions = [(r_idx, feature, op, value)
+                      for r_idx, rule in enumerate(self.rules)
+                      for feature, op, value in rule["when"]]
+        for _, feature, op, _ in conditions:
+            if op not in OPS:
+                raise ValueError(f"未知的比较运算: {op}（可选: {', '.join(OPS)}）")
+
+        self.features = sorted({feature for _, feature, _, _ in conditions})
+        column = {feature: i for i, feature in enumerate(self.features)}
+        self._feature_idx = np.array([column[f] for _, f, _, _ in conditions], dtype=np.int64)
+        self._op_codes = np.array([_OP_CODES[op] for _, _, op, _ in conditions], dtype=np.int64)
+        self._thresholds = np.array([float(v) for _, _, _, v in conditions])
+        # 每条规则的条件在数组中的起始位置（没有条件的规则不触发）
+        n_conditions = np.array([len(rule["when"]) for rule in self.rules], dtype=np.int64)
+        self._has_conditions = n_conditions > 0
+        self._starts = (np.cumsum(n_conditions) - n_conditions)[self._has_conditions]
+        priorities = np.array([rule.get("priority", 0) for rule in self.rules])
+        self._order = np.argsort(-priorities, kind="stable")
+        # 消息中引用了特征的规则（其余规则不需要为每个用户取出特征值）
+        self._templated = ["{" in rule["message"] for rule in self.rules]
+
+    def evaluate(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """对所有用户求值所有规则，返回 用户×规则id 的布尔矩阵（缺失的特征视为NaN）"""
+        X = frame.reindex(columns=self.features).to_numpy(dtype=float)
+        values = X[:, self._feature_idx]
+        passed = np.zeros(values.shape, dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for op, code in _OP_CODES.items():
+                mask = self._op_codes == code
+                if mask.any():
+                    passed[:, mask] = OPS[op](values[:, mask], self._thresholds[mask])
+        fired = np.zeros((len(X), len(self.rules)), dtype=bool)
+        if len(X) and len(self._starts):
+            fired[:, self._has_conditions] = np.logical_and.reduceat(passed, self._starts, axis=1)
+        return pd.DataFrame(fired, index=frame.index, columns=[rule["id"] for rule in self.rules])
+
+    def messages(self, frame: pd.DataFrame, fallback: Optional[str] = FALLBACK_INSIGHT) -> Dict[Any, List[str]]:
+        """每个用户触发的洞察文本（按优先级排序），无洞察时使用fallback"""
+        fired = self.evaluate(frame).to_numpy()[:, self._order]
+        columns, values = list(frame.columns), frame.to_numpy(dtype=float)
+        result: Dict[Any, List[str]] = {}
+        for row, user_id in enumerate(frame.index):
+            texts, features = [], None
+            for i in self._order[fired[row]]:
+                message = self.rules[i]["message"]
+                if self._templated[i]:
+                    if features is None:
+                        features = dict(zip(columns, values[row]))
+                    message = message.format(**features)
+                texts.append(message)
+            result[user_id] = texts or ([fallback] if fallback else [])
+        return result
+
+
+def user_insights(records: Iterable[Any], user_id: int = 1, timezone: str = DEFAULT_TIMEZONE,
+                  engine: Optional[InsightEngine] = None, now_utc=None) -> List[str]:
+    """单个用户的洞察（渲染时使用）"""
+    engine = engine or InsightEngine()
+    rollups = daily_rollups(records_to_frame(records, user_id), {user_id: timezone})
+    frame = build_feature_frame(rollups, local_today(timezone, now_utc), user_ids=[user_id])
+    return engine.messages(frame)[user_id]
@@ -0,0 +1,312 @@
+"""
+营养计算模块 - 基于本地食物成分表计算热量/宏量营养素并生成餐食计划
+"""
+import csv
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+FOOD_TABLE_PATH = Path(__file__).with_name("food_table.csv")
+
+# 活动水平系数（同时兼容档案中的中文选项和工具调用中的英文等级）
+ACTIVITY_FACTORS = {
+    "久坐": 1.2,
+    "轻度活跃": 1.375,
+    "中度活跃": 1.55,
+    "高度活跃": 1.725,
+    "sedentary": 1.2,
+    "beginner": 1.375,
+    "light": 1.375,
+    "intermediate": 1.55,
+    "moderate": 1.55,
+    "advanced": 1.725,
+    "active": 1.725,
+}
+DEFAULT_ACTIVITY_FACTOR = 1.375
+
+# 餐次及其占全天热量的比例
+MEAL_SLOTS = [
+    ("breakfast", "早餐", 0.25),
+    ("lunch", "午餐", 0.35),
+    ("dinner", "晚餐", 0.30),
+    ("snack", "加餐", 0.10),
+]
+
+# 饮食偏好关键词 -> 需要排除的食物标签
+DIETARY_EXCLUSIONS = {
+    "纯素": {"meat", "fish", "egg", "dairy"},
+    "vegan": {"meat", "fish", "egg", "dairy"},
+    "素食": {"meat", "fish"},
+    "vegetarian": {"meat", "fish"},
+    "无乳糖": {"dairy"},
+    "乳糖不耐": {"dairy"},
+    "lactose": {"dairy"},
+    "无麸质": {"gluten"},
+    "gluten": {"gluten"},
+    "坚果过敏": {"nut"},
+    "nut allergy": {"nut"},
+    "海鲜过敏": {"fish"},
+}
+
+# 每餐最多选择的食物数量和可选份量
+MAX_ITEMS_PER_MEAL = 4
+PORTIONS = np.array([0.5, 1.0, 1.5])
+# 同一食物在一周内重复出现的惩罚，用于增加餐食多样性
+VARIETY_PENALTY = 0.15
+# 求解前对目标取整的粒度（热量kcal, 蛋白质/碳水/脂肪g），目标相近的用户共享同一求解结果
+TARGET_QUANTUM = np.array([25.0, 2.5, 2.5, 2.5])
+
+
+def _profile_value(profile: Any, key: str, default: Any = None) -> Any:
+    """从UserProfile对象或用户数据字典中读取字段"""
+    if profile is None:
+        return default
+    if isinstance(profile, dict):
+        value = profile.get(key)
+    else:
+        value = getattr(profile, key, None)
+    return default if value in (None, "") else value
+
+
+def parse_number(value: Any, default: float) -> float:
+    """宽松解析数值：数字直接使用，文本取其中第一个数字（如 "70kg"、"175 cm"），无法解析时返回默认值"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) if math.isfinite(value) else default
+    match = re.search(r"\d+(?:\.\d+)?", str(value)) if value is not None else None
+    return float(match.group()) if match else default
+
+
+def _profile_number(profile: Any, key: str, default: float) -> float:
+    """读取数值字段（工具调用的用户数据可能是 "70kg" 之类的自由文本）"""
+    return parse_number(_profile_value(profile, key, default), default)
+
+
+def _goal_of(profile: Any) -> str:
+    """读取健身目标（档案字段为fitness_goal，工具数据为primary_goal）"""
+    goal = _profile_value(profile, "primary_goal") or _profile_value(profile, "fitness_goal", "general fitness")
+    return str(goal).lower()
+
+
+def calculate_bmr(weight: float, height: float, age: float, gender: Optional[str]) -> float:
+    """Mifflin-St Jeor公式计算基础代谢率 (kcal/天)"""
+    base = 10 * weight + 6.25 * height - 5 * age
+    gender = (gender or "").lower()
+    if gender in ("男", "male", "m"):
+        return base + 5
+    if gender in ("女", "female", "f"):
+        return base - 161
+    # 未设置性别时取两者平均
+    return base - 78
+
+
+def calculate_tdee(profile: Any) -> Dict[str, float]:
+    """根据用户档案计算基础代谢和每日总能量消耗"""
+    weight = _profile_number(profile, "weight", 65.0)
+    height = _profile_number(profile, "height", 170.0)
+    age = _profile_number(profile, "age", 25)
+    gender = _profile_value(profile, "gender")
+    activity_level = str(_profile_value(profile, "activity_level", "")).lower()
+
+    bmr = calculate_bmr(weight, height, age, gender)
+    factor = ACTIVITY_FACTORS.get(activity_level, DEFAULT_ACTIVITY_FACTOR)
+    return {"bmr": bmr, "tdee": bmr * factor, "activity_factor": factor}
+
+
+def macro_targets(profile: Any) -> Dict[str, float]:
+    """根据目标计算每日热量和宏量营养素目标"""
+    energy = calculate_tdee(profile)
+    weight = _profile_number(profile, "weight", 65.0)
+    goal = _goal_of(profile)
+
+    if "weight loss" in goal or "减重" in goal:
+        calories = energy["tdee"] - 400
+        protein_per_kg = 1.8
+    elif "muscle gain" in goal or "增肌" in goal or "力量" in goal:
+        calories = energy["tdee"] + 300
+        protein_per_kg = 2.0
+    else:
+        calories = energy["tdee"]
+        protein_per_kg = 1.2
+
+    # 热量不低于基础代谢
+    calories = max(calories, energy["bmr"])
+    protein = protein_per_kg * weight
+    fat = calories * 0.25 / 9
+    carbs = max(calories - protein * 4 - fat * 9, 0) / 4
+
+    return {
+        "bmr": round(energy["bmr"]),
+        "tdee": round(energy["tdee"]),
+        "calories": round(calories),
+        "protein": round(protein, 1),
+        "carbs": round(carbs, 1),
+        "fat": round(fat, 1),
+    }
+
+
+def excluded_tags(dietary_preferences: Optional[str]) -> set:
+    """解析饮食偏好文本，返回需要排除的食物标签"""
+    text = (dietary_preferences or "").lower()
+    excluded = set()
+    for keyword, tags in DIETARY_EXCLUSIONS.items():
+        if keyword in text:
+            excluded |= tags
+    return excluded
+
+
+class FoodTable:
+    """食物成分表（按列存储为NumPy数组）"""
+
+    def __init__(self, names: List[str], servings: List[str], nutrients: np.ndarray,
+                 slot_mask: np.ndarray, tags: List[set]):
+        self.names = np.array(names, dtype=object)
+        self.servings = np.array(servings, dtype=object)
+        # 每份营养素: [热量kcal, 蛋白质g, 碳水g, 脂肪g]
+        self.nutrients = nutrients
+        # 可用餐次: (食物数, 餐次数)
+        self.slot_mask = slot_mask
+        self.tags = tags
+
+    @classmethod
+    def load(cls, path: Path = FOOD_TABLE_PATH) -> "FoodTable":
+        """从CSV文件加载食物成分表"""
+        slot_index = {slot: i for i, (slot, _, _) in enumerate(MEAL_SLOTS)}
+        names, servings, rows, slots, tags = [], [], [], [], []
+
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                names.append(row["name"])
+                servings.append(row["serving"])
+                rows.append([float(row["calories"]), float(row["protein"]),
+                             float(row["carbs"]), float(row["fat"])])
+                mask = np.zeros(len(MEAL_SLOTS), dtype=bool)
+                for slot in row["slots"].split("|"):
+                    if slot in slot_index:
+                        mask[slot_index[slot]] = True
+                slots.append(mask)
+                tags.append({t for t in row["tags"].split("|") if t})
+
+        return cls(names, servings, np.array(rows, dtype=float), np.array(slots), tags)
+
+    def __len__(self):
+        return len(self.names)
+
+    def allowed_mask(self, excluded: set) -> np.ndarray:
+        """返回未被饮食限制排除的食物掩码"""
+        if not excluded:
+            return np.ones(len(self), dtype=bool)
+        return np.array([not (tags & excluded) for tags in self.tags], dtype=bool)
+
+
+@lru_cache(maxsize=1)
+def load_default_food_table() -> FoodTable:
+    """加载并缓存默认食物成分表，同一进程内所有规划器共享"""
+    return FoodTable.load()
+
+
+class MealPlanEngine:
+    """餐食计划引擎 - 贪心选择食物和份量以逼近每餐的营养目标"""
+
+    def __init__(self, food_table: Optional[FoodTable] = None, cache_size: int = 4096):
+        self.food_table = food_table or load_default_food_table()
+        # 每种食物在各份量下的营养素: (食物数, 份量数, 4)
+        self.portion_nutrients = self.food_table.nutrients[:, None, :] * PORTIONS[None, :, None]
+        self._solve_week = lru_cache(maxsize=cache_size)(self._solve_week_uncached)
+
+    def plan(self, profile: Any, days: int = 7,
+             dietary_preferences: Optional[str] = None) -> Dict[str, Any]:
+        """生成多日餐食计划"""
+        table = self.food_table
+        targets = macro_targets(profile)
+        if dietary_preferences is None:
+            dietary_preferences = _profile_value(profile, "dietary_preferences", "")
+        allowed = table.allowed_mask(excluded_tags(dietary_preferences))
+
+        daily_target = np.array([targets["calories"], targets["protein"],
+                                 targets["carbs"], targets["fat"]])
+        quantized = tuple(np.round(daily_target / TARGET_QUANTUM) * TARGET_QUANTUM)
+        week_picks = self._solve_week(quantized, allowed.tobytes(), days)
+
+        plan_days = []
+        for day, day_picks in enumerate(week_picks, 1):
+            meals = []
+            day_totals = np.zeros(4)
+            for (slot, label, _), picks in zip(MEAL_SLOTS, day_picks):
+                items = []
+                meal_totals = np.zeros(4)
+                for food_idx, portion_idx in picks:
+                    nutrients = self.portion_nutrients[food_idx, portion_idx]
+                    meal_totals += nutrients
+                    items.append({
+                        "name": table.names[food_idx],
+                        "serving": table.servings[food_idx],
+                        "portion": float(PORTIONS[portion_idx]),
+                        **self._nutrient_dict(nutrients),
+                    })
+                day_totals += meal_totals
+                meals.append({"slot": slot, "meal": label, "items": items,
+                              "totals": self._nutrient_dict(meal_totals)})
+            plan_days.append({"day": day, "meals": meals, "totals": self._nutrient_dict(day_totals)})
+
+        return {"targets": targets, "days": plan_days}
+
+    def _solve_week_uncached(self, daily_target: tuple, allowed_bytes: bytes, days: int) -> tuple:
+        """求解多日餐单，返回每天每餐选中的（食物, 份量）下标"""
+        table = self.food_table
+        daily_target = np.array(daily_target)
+        allowed = np.frombuffer(allowed_bytes, dtype=bool)
+        usage = np.zeros(len(table))
+
+        week_picks = []
+        for _ in range(days):
+            day_picks = []
+            for slot_idx, (_, _, share) in enumerate(MEAL_SLOTS):
+                candidates = allowed & table.slot_mask[:, slot_idx]
+                picks = self._solve_meal(daily_target * share, self.portion_nutrients, candidates, usage)
+                for food_idx, _ in picks:
+                    usage[food_idx] += 1
+                day_picks.append(tuple(picks))
+            week_picks.append(tuple(day_picks))
+        return tuple(week_picks)
+
+    def _solve_meal(self, target: np.ndarray, portion_nutrients: np.ndarray,
+                    candidates: np.ndarray, usage: np.ndarray) -> List[tuple]:
+        """贪心求解单餐：每步在所有（食物, 份量）组合中选择使误差下降最多的一项"""
+        scale = np.where(target > 0, target, 1.0)
+        current = np.zeros(4)
+        current_error = float(np.sum((target / scale) ** 2))
+        available = candidates.copy()
+        picks = []
+
+        for _ in range(MAX_ITEMS_PER_MEAL):
+            if not available.any():
+                break
+            residual = (target - current)[None, None, :] - portion_nutrients
+            errors = np.sum((residual / scale) ** 2, axis=2)
+            errors += (VARIETY_PENALTY * usage)[:, None]
+            errors[~available] = np.inf
+
+            food_idx, portion_idx = np.unravel_index(np.argmin(errors), errors.shape)
+            if errors[food_idx, portion_idx] >= current_error:
+                break
+
+            current = current + portion_nutrients[food_idx, portion_idx]
+            current_error = float(np.sum(((target - current) / scale) ** 2))
+            available[food_idx] = False
+            picks.append((int(food_idx), int(portion_idx)))
+
+        return picks
+
+    @staticmethod
+    def _nutrient_dict(values: np.ndarray) -> Dict[str, float]:
+        """将营养素向量转换为字典"""
+        return {
+            "calories": round(float(values[0])),
+            "protein": round(float(values[1]), 1),
+            "carbs": round(float(values[2]), 1),
+            "fat": round(float(values[3]), 1),
+        }
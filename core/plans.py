@@ -0,0 +1,271 @@
+"""
+结构化计划模块 - 健身/营养/心理健康计划的类型化表示
+
+计划对象可以：
+- to_markdown(): 渲染为界面展示用的Markdown
+- to_compact_json(): 序列化为供LLM阅读的紧凑JSON（不含排版和固定提示语）
+- part_fingerprints() / diff(): 按组成部分计算指纹，便于独立缓存和比较
+"""
+import hashlib
+import json
+from abc import abstractmethod
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+def _fingerprint(value: Any) -> str:
+    """计算任意可JSON序列化数据的短指纹"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class PlanBase(BaseModel):
+    """计划基类"""
+    model_config = ConfigDict(frozen=True)
+
+    kind: str
+    notes: List[str] = []
+
+    @abstractmethod
+    def to_markdown(self) -> str:
+        """渲染为Markdown"""
+
+    @abstractmethod
+    def compact(self) -> Dict[str, Any]:
+        """供LLM使用的紧凑表示"""
+
+    def to_compact_json(self) -> str:
+        """序列化紧凑表示（无多余空白，保留中文）"""
+        return json.dumps(self.compact(), ensure_ascii=False, separators=(",", ":"))
+
+    def part_fingerprints(self) -> Dict[str, str]:
+        """每个顶层字段的指纹"""
+        data = self.model_dump(mode="json")
+        return {name: _fingerprint(value) for name, value in data.items()}
+
+    def fingerprint(self) -> str:
+        """整个计划的指纹"""
+        return _fingerprint(self.part_fingerprints())
+
+    def diff(self, other: "PlanBase") -> List[str]:
+        """返回与另一份计划不同的顶层字段名"""
+        mine, theirs = self.part_fingerprints(), other.part_fingerprints()
+        return [name for name in mine if mine[name] != theirs.get(name)]
+
+
+# ---------- 健身计划 ----------
+
+class Exercise(BaseModel):
+    """单个运动"""
+    model_config = ConfigDict(frozen=True)
+
+    name: str
+    instructions: str
+    equipment: str = "None"
+
+
+class ExerciseBlock(BaseModel):
+    """一组训练（如有氧、某肌群力量训练）"""
+    model_config = ConfigDict(frozen=True)
+
+    title: str
+    frequency: Optional[str] = None
+    exercises: List[Exercise] = []
+
+
+FOCUS_TITLES = {
+    "weight_loss": "🔥 **减重专项计划**",
+    "muscle_gain": "💪 **增肌专项计划**",
+    "endurance": "🏃 **耐力提升计划**",
+    "general": "🌟 **综合健身计划**",
+}
+
+
+class WorkoutPlan(PlanBase):
+    """健身计划"""
+    kind: Literal["workout"] = "workout"
+    goal: str
+    level: str
+    duration_minutes: float
+    focus: Literal["weight_loss", "muscle_gain", "endurance", "general"]
+    schedule: List[str] = []
+    blocks: List[ExerciseBlock] = []
+
+    def to_markdown(self) -> str:
+        lines = [
+            f"🏋️ **个性化健身计划** (基于目标: {self.goal})",
+            f"⏱️ **建议时长**: {self.duration_minutes:g}分钟",
+            f"📊 **难度等级**: {self.level}",
+            "",
+            FOCUS_TITLES[self.focus],
+            "",
+        ]
+        if self.schedule:
+            lines.append("**每周训练安排**:")
+            lines.extend(self.schedule)
+            lines.append("")
+        for block in self.blocks:
+            header = f"**{block.title} ({block.frequency})**:" if block.frequency else f"**{block.title}**:"
+            lines.append(header)
+            for i, exercise in enumerate(block.exercises, 1):
+                lines.append(f"{i}. {exercise.name}: {exercise.instructions}")
+            lines.append("")
+        lines.append("⚠️ **注意事项**:")
+        lines.extend(f"- {note}" for note in self.notes)
+        return "\n".join(lines)
+
+    def compact(self) -> Dict[str, Any]:
+        data = {
+            "goal": self.goal,
+            "level": self.level,
+            "minutes": self.duration_minutes,
+            "focus": self.focus,
+            "blocks": [
+                {"t": b.title, "f": b.frequency, "x": [e.name for e in b.exercises]}
+                for b in self.blocks
+            ],
+        }
+        if self.schedule:
+            data["schedule"] = self.schedule
+        return data
+
+
+# ---------- 营养计划 ----------
+
+class MacroTargets(BaseModel):
+    """每日热量和宏量营养素目标"""
+    model_config = ConfigDict(frozen=True)
+
+    bmr: int
+    tdee: int
+    calories: int
+    protein: float
+    carbs: float
+    fat: float
+
+
+class NutrientTotals(BaseModel):
+    """营养素合计"""
+    model_config = ConfigDict(frozen=True)
+
+    calories: int
+    protein: float
+    carbs: float
+    fat: float
+
+
+class FoodItem(NutrientTotals):
+    """餐单中的一种食物"""
+    name: str
+    serving: str
+    portion: float
+
+
+class Meal(BaseModel):
+    """一餐"""
+    model_config = ConfigDict(frozen=True)
+
+    slot: str
+    meal: str
+    items: List[FoodItem] = []
+    totals: NutrientTotals
+
+
+class DayMenu(BaseModel):
+    """一天的餐单"""
+    model_config = ConfigDict(frozen=True)
+
+    day: int
+    meals: List[Meal]
+    totals: NutrientTotals
+
+
+class MealSuggestion(BaseModel):
+    """餐次建议"""
+    model_config = ConfigDict(frozen=True)
+
+    meal: str
+    suggestion: str
+
+
+class NutritionPlan(PlanBase):
+    """营养计划"""
+    kind: Literal["nutrition"] = "nutrition"
+    strategy: str
+    targets: MacroTargets
+    principles: List[str] = []
+    meal_suggestions: List[MealSuggestion] = []
+    days: List[DayMenu] = []
+    dietary_preferences: str = ""
+
+    def to_markdown(self) -> str:
+        t = self.targets
+        lines = [
+            "🍎 **个性化营养计划**",
+            "",
+            f"🎯 **{self.strategy}**",
+            "",
+            f"🔥 **每日热量目标**: {t.calories} kcal (基础代谢 {t.bmr} kcal, 总消耗 {t.tdee} kcal)",
+            f"🥩 **宏量营养素**: 蛋白质 {t.protein:.0f}g | 碳水 {t.carbs:.0f}g | 脂肪 {t.fat:.0f}g",
+            "",
+            "**营养原则:**",
+        ]
+        lines.extend(f"{i}. {p}" for i, p in enumerate(self.principles, 1))
+        lines.append("")
+        lines.append("**每日餐食建议:**")
+        lines.extend(f"**{m.meal}**: {m.suggestion}" for m in self.meal_suggestions)
+
+        for day in self.days:
+            lines.append("")
+            lines.append(f"**第{day.day}天餐单** (约 {day.totals.calories} kcal, "
+                         f"蛋白质 {day.totals.protein:.0f}g):")
+            for meal in day.meals:
+                foods = "、".join(f"{item.name}×{item.portion:g}({item.serving})" for item in meal.items)
+                lines.append(f"- {meal.meal}: {foods or '自由选择'} ({meal.totals.calories} kcal)")
+
+        if self.dietary_preferences:
+            lines.append("")
+            lines.append(f"**个人偏好考虑**: {self.dietary_preferences}")
+
+        lines.append("")
+        lines.extend(self.notes)
+        return "\n".join(lines)
+
+    def compact(self) -> Dict[str, Any]:
+        t = self.targets
+        data = {
+            "strategy": self.strategy,
+            "kcal": t.calories,
+            "macros_g": [t.protein, t.carbs, t.fat],
+            "days": [
+                {m.meal: [f"{i.name}×{i.portion:g}" for i in m.items] for m in day.meals}
+                for day in self.days
+            ],
+        }
+        if self.dietary_preferences:
+            data["prefs"] = self.dietary_preferences
+        return data
+
+
+# ---------- 心理健康建议 ----------
+
+class WellnessPlan(PlanBase):
+    """心理健康建议"""
+    kind: Literal["wellness"] = "wellness"
+    tips: List[str] = []
+    techniques: List[str] = []
+
+    def to_markdown(self) -> str:
+        lines = ["🧘 **心理健康指导**", "", "**今日健康贴士:**"]
+        lines.extend(f"{i}. {tip}" for i, tip in enumerate(self.tips, 1))
+        lines.append("")
+        lines.append("**压力缓解技巧:**")
+        lines.extend(f"{i}. {tech}" for i, tech in enumerate(self.techniques, 1))
+        lines.append("")
+        lines.append("🔔 **重要提醒:**")
+        lines.extend(f"- {note}" for note in self.notes)
+        return "\n".join(lines)
+
+    def compact(self) -> Dict[str, Any]:
+        return {"tips": self.tips, "techniques": self.techniques}
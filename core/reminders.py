@@ -0,0 +1,182 @@
+"""
+目标提醒模块 - 按截止日期提醒即将到期的目标
+
+ReminderScheduler 用小顶堆保存每个开启提醒的用户下一次提醒的UTC时间。后台线程持有自己的
+DatabaseManager（独立会话），睡眠到堆顶时间后只处理到期的用户：用截止日期索引查询该用户
+REMINDER_DAYS 天内到期（含已逾期）的活跃目标并写入 goal_reminders 表，写入成功后才把该用户
+下一天的提醒时间放回堆中；查询或写入失败（如数据库被锁）时 RETRY_SECONDS 秒后重试，当天的提醒
+不会丢失。全程不扫描所有目标；同一目标同一天只提醒一次（唯一索引），重启后不会重复。
+
+用户修改提醒设置时调用 schedule() 更新堆；旧的堆条目不删除，弹出时与 _next 对比后丢弃。
+"""
+import heapq
+import threading
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core.calendar_utils import days_until, local_now, local_to_utc, local_today, utc_now
+
+REMINDER_DAYS = 3                 # 提醒截止日期在N天内的目标
+DEFAULT_REMINDER_TIME = "09:00"   # 默认提醒时间（用户本地时间）
+MAX_WAIT_SECONDS = 300            # 后台线程最长睡眠时间，防止系统时间调整后错过提醒
+RETRY_SECONDS = 60                # 触发失败后的重试间隔
+
+
+def parse_reminder_time(value: Optional[str]) -> time:
+    """"HH:MM" -> time（无效时使用默认提醒时间）"""
+    try:
+        return datetime.strptime(value or "", "%H:%M").time()
+    except ValueError:
+        return datetime.strptime(DEFAULT_REMINDER_TIME, "%H:%M").time()
+
+
+def next_fire_time(reminder_time: str, tz_name: Optional[str], now_utc: Optional[datetime] = None) -> datetime:
+    """now_utc 之后第一个用户本地 reminder_time 对应的UTC时间"""
+    now_utc = now_utc or utc_now()
+    local = local_now(tz_name, now_utc)
+    fire_at = datetime.combine(local.date(), parse_reminder_time(reminder_time))
+    if fire_at <= local:
+        fire_at += timedelta(days=1)
+    return local_to_utc(fire_at, tz_name)
+
+
+def reminder_message(goal: Any, tz_name: Optional[str], now_utc: Optional[datetime] = None) -> str:
+    """单个目标的提醒文本"""
+    days_left = days_until(goal.deadline, tz_name, now_utc)
+    if days_left < 0:
+        return f"⏰ 目标「{goal.title}」已逾期 {-days_left} 天"
+    if days_left == 0:
+        return f"🚨 目标「{goal.title}」今天截止"
+    return f"⚠️ 目标「{goal.title}」还剩 {days_left} 天截止"
+
+
+class ReminderScheduler:
+    """目标提醒调度器（堆按下一次提醒时间排序，后台线程触发到期提醒）"""
+
+    def __init__(self, db_path: str = "data/health_assistant.db", days: int = REMINDER_DAYS):
+        self.db_path = db_path
+        self.days = days
+        self._heap: List[Tuple[datetime, int]] = []
+        # user_id -> 当前有效的下一次提醒时间及 (时区, 提醒时间)，堆中与之不符的条目已过期
+        self._next: Dict[int, datetime] = {}
+        self._settings: Dict[int, Tuple[str, str]] = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self.fired = 0
+
+    def schedule(self, user_id: int, tz_name: str, reminder_time: str, enabled: bool = True,
+                 now_utc: Optional[datetime] = None):
+        """设置或取消用户的每日提醒"""
+        with self._cond:
+            if not enabled:
+                self._next.pop(user_id, None)
+                self._settings.pop(user_id, None)
+            else:
+                fire_at = next_fire_time(reminder_time, tz_name, now_utc)
+                self._next[user_id] = fire_at
+                self._settings[user_id] = (tz_name, reminder_time)
+                heapq.heappush(self._heap, (fire_at, user_id))
+            self._cond.notify()
+
+    def load(self, schedules: Sequence[Tuple[int, str, str]], now_utc: Optional[datetime] = None):
+        """批量设置提醒: (user_id, 时区, 提醒时间) 列表"""
+        for user_id, tz_name, reminder_time in schedules:
+            self.schedule(user_id, tz_name, reminder_time, now_utc=now_utc)
+
+    def next_due(self) -> Optional[datetime]:
+        """最近一次待触发的提醒时间（丢弃堆顶的过期条目）"""
+        with self._cond:
+            return self._peek()
+
+    def _peek(self) -> Optional[datetime]:
+        while self._heap and self._next.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now_utc: datetime) -> List[Tuple[int, str, str, datetime]]:
+        """弹出所有已到时间的用户: (user_id, 时区, 提醒时间, 弹出的提醒时间)，处理完成后再由 _reschedule 放回堆中"""
+        due = []
+        with self._cond:
+            while self._peek() is not None and self._heap[0][0] <= now_utc:
+                fire_at, user_id = heapq.heappop(self._heap)
+                tz_name, reminder_time = self._settings[user_id]
+                due.append((user_id, tz_name, reminder_time, fire_at))
+        return due
+
+    def _reschedule(self, user_id: int, popped_at: datetime, fire_at: datetime):
+        """把用户的下一次提醒放回堆中（处理期间用户修改或关闭了提醒时保留新的设置）"""
+        with self._cond:
+            if self._next.get(user_id) != popped_at:
+                return
+            self._next[user_id] = fire_at
+            heapq.heappush(self._heap, (fire_at, user_id))
+            self._cond.notify()
+
+    def run_due(self, db: Any, now_utc: Optional[datetime] = None) -> int:
+        """触发所有已到时间的提醒，返回写入的提醒条数
+
+        Args:
+            db: DatabaseManager（后台线程中为线程自己的实例）
+        """
+        now_utc = now_utc or utc_now()
+        count = 0
+        for user_id, tz_name, reminder_time, popped_at in self._pop_due(now_utc):
+            try:
+                goals = db.get_goals_due_within(self.days, user_id=user_id, now_utc=now_utc)
+                day = local_today(tz_name, now_utc)
+                saved = db.save_goal_reminders([
+                    {'user_id': user_id, 'goal_id': goal.id, 'day': day,
+                     'message': reminder_message(goal, tz_name, now_utc)}
+                    for goal in goals
+                ])
+            except Exception as e:
+                db.session.rollback()
+                print(f"触发目标提醒失败: {e}")
+                saved = False
+            if saved:
+                count += len(goals)
+                self._reschedule(user_id, popped_at, next_fire_time(reminder_time, tz_name, now_utc))
+            else:
+                self._reschedule(user_id, popped_at, now_utc + timedelta(seconds=RETRY_SECONDS))
+        self.fired += count
+        return count
+
+    def start(self):
+        """启动后台提醒线程（守护线程，已启动时不重复启动）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="goal-reminders", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止后台提醒线程"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """后台线程：使用独立的数据库会话，睡眠到下一次提醒时间后触发到期提醒"""
+        from core.database import DatabaseManager
+        db = DatabaseManager(self.db_path)
+        try:
+            self.load(db.get_reminder_schedules())
+            while True:
+                with self._cond:
+                    if self._stopped:
+                        return
+                    next_due = self._peek()
+                    wait = MAX_WAIT_SECONDS if next_due is None else (next_due - utc_now()).total_seconds()
+                    if wait > 0:
+                        self._cond.wait(min(wait, MAX_WAIT_SECONDS))
+                        continue
+                try:
+                    self.run_due(db)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"触发目标提醒失败: {e}")
+        finally:
+            db.close()
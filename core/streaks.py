@@ -0,0 +1,80 @@
+"""
+连续打卡模块 - 按用户本地自然日统计每种记录的当前/最长连续天数
+
+增量更新: 每次添加记录时，DatabaseManager 用一条UPSERT语句更新 streaks 表中对应的一行
+（O(1)，不读取历史记录）。记录时间总是当前时间，同一用户同一类型的打卡日期单调不减；
+早于最近打卡日期的日期会被忽略，导入历史数据后用 backfill.py 重建。
+回填: compute_streaks() 在全部历史记录上向量化计算。
+"""
+from datetime import date
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# 统计连续打卡的记录类型
+STREAK_TYPES = ("exercise", "water", "mood")
+
+STREAK_LABELS = {
+    "exercise": "🏃 连续运动",
+    "water": "💧 连续饮水",
+    "mood": "😊 连续记录心情",
+}
+
+
+def current_streak(current: int, last_day: Optional[date], today: date) -> int:
+    """截至今天仍有效的连续天数：今天或昨天打过卡时连续仍在进行，否则已中断"""
+    if last_day is None:
+        return 0
+    return current if (today - last_day).days <= 1 else 0
+
+
+def compute_streaks(days: Any) -> pd.DataFrame:
+    """由打卡日期计算每个 (用户, 类型) 的连续天数
+
+    Args:
+        days: 包含 user_id, record_type, day(datetime64[D]) 列的数据框（或列字典），允许重复
+
+    Returns:
+        user_id, record_type, current, longest, last_day 列的数据框；
+        current 为截至最近打卡日期的连续天数（是否已中断由 current_streak 按当天判断）
+    """
+    columns = ["user_id", "record_type", "current", "longest", "last_day"]
+    days = pd.DataFrame(days)
+    if days.empty:
+        return pd.DataFrame(columns=columns)
+
+    d = days[["user_id", "record_type", "day"]].drop_duplicates().sort_values(["user_id", "record_type", "day"])
+    user = d["user_id"].to_numpy()
+    record_type = d["record_type"].to_numpy()
+    day = d["day"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+    # 换了 (用户, 类型) 或与前一天不相邻时开始新的一段连续
+    new_run = np.ones(len(d), dtype=bool)
+    new_run[1:] = (user[1:] != user[:-1]) | (record_type[1:] != record_type[:-1]) | (np.diff(day) != 1)
+    run_id = np.cumsum(new_run)
+
+    runs = pd.DataFrame({"run": run_id, "user_id": user, "record_type": record_type, "day": day})
+    runs = runs.groupby("run", sort=True).agg(
+        user_id=("user_id", "first"), record_type=("record_type", "first"),
+        length=("day", "size"), end=("day", "last"))
+    result = runs.groupby(["user_id", "record_type"], sort=True).agg(
+        current=("length", "last"), longest=("length", "max"), last_day=("end", "last")).reset_index()
+    result["last_day"] = result["last_day"].to_numpy().astype("datetime64[D]")
+    return result[columns]
+
+
+def streak_summary(rows: Dict[str, Any], today: date) -> Dict[str, Dict[str, Any]]:
+    """streaks 表中一个用户的各行 -> 每种类型的 {current, longest, last_day}（未打卡的类型为0）"""
+    summary = {}
+    for record_type in STREAK_TYPES:
+        row = rows.get(record_type)
+        if row is None:
+            summary[record_type] = {"current": 0, "longest": 0, "last_day": None}
+            continue
+        summary[record_type] = {
+            "current": current_streak(row.current, row.last_day, today),
+            "longest": row.longest,
+            "last_day": row.last_day,
+        }
+    return summary
@@ -0,0 +1,124 @@
+"""
+趋势计算模块 - 基于真实时间戳的线性趋势、滑动平均和指数平滑（NumPy向量化）
+"""
+from datetime import datetime
+from typing import Any, Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_DAY = 86400.0
+_EPOCH = datetime(1970, 1, 1)
+
+
+def datetimes_to_array(datetimes: Sequence[datetime]) -> np.ndarray:
+    """将（无时区的）datetime列表转换为datetime64[s]数组"""
+    # 逐个转换datetime对象到datetime64很慢，先计算相对纪元的秒数再整体转换
+    seconds = np.fromiter(((d - _EPOCH).total_seconds() for d in datetimes), dtype=float, count=len(datetimes))
+    return seconds.astype(np.int64).astype("datetime64[s]")
+
+
+def records_to_arrays(records: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """将健康记录转换为按时间升序排列的 (时间, 数值) 数组，忽略没有数值的记录"""
+    valid = [r for r in records if r.numeric_value is not None]
+    dates = datetimes_to_array([r.date for r in valid])
+    values = np.fromiter((r.numeric_value for r in valid), dtype=float, count=len(valid))
+    order = np.argsort(dates, kind="stable")
+    return dates[order], values[order]
+
+
+def to_day_numbers(dates: Sequence[Any]) -> np.ndarray:
+    """将时间转换为以天为单位的浮点数（自1970-01-01起）"""
+    seconds = np.asarray(dates, dtype="datetime64[s]").astype(np.int64)
+    return seconds / SECONDS_PER_DAY
+
+
+def linear_trend(dates: Sequence[Any], values: Sequence[float], with_stats: bool = False) -> Dict[str, Any]:
+    """对真实时间做最小二乘线性回归
+
+    Returns:
+        slope_per_day: 每天的变化量
+        intercept: 第一个时间点处的拟合值
+        fitted: 每个时间点的拟合值
+        r_value / p_value / std_err: 仅在 with_stats=True 时计算（需要scipy）
+    """
+    x = to_day_numbers(dates)
+    y = np.asarray(values, dtype=float)
+    result = {"slope_per_day": 0.0, "intercept": float(y[0]) if len(y) else 0.0, "fitted": y.copy()}
+    if len(x) < 2:
+        return result
+
+    # 以第一个时间点为原点，再对均值中心化以保证数值稳定
+    x = x - x[0]
+    x_mean, y_mean = x.mean(), y.mean()
+    xc, yc = x - x_mean, y - y_mean
+    sxx = float(np.dot(xc, xc))
+    if sxx == 0:
+        return result
+
+    slope = float(np.dot(xc, yc)) / sxx
+    intercept = y_mean - slope * x_mean
+    result.update(slope_per_day=slope, intercept=float(intercept), fitted=intercept + slope * x)
+
+    if with_stats:
+        # 只有需要显著性检验时才导入scipy
+        from scipy import stats
+        syy = float(np.dot(yc, yc))
+        n = len(x)
+        r = float(np.dot(xc, yc)) / np.sqrt(sxx * syy) if syy > 0 else 0.0
+        dof = n - 2
+        if dof > 0 and abs(r) < 1:
+            t_stat = r * np.sqrt(dof / (1 - r * r))
+            p_value = float(2 * stats.t.sf(abs(t_stat), dof))
+            std_err = float(np.sqrt((1 - r * r) * syy / sxx / dof))
+        else:
+            p_value, std_err = 0.0, 0.0
+        result.update(r_value=r, p_value=p_value, std_err=std_err)
+
+    return result
+
+
+def rolling_mean(dates: Sequence[Any], values: Sequence[float], window_days: float = 7) -> np.ndarray:
+    """按时间窗口计算滑动平均（每个点取其之前window_days天内的记录），dates需升序"""
+    seconds = np.asarray(dates, dtype="datetime64[s]").astype(np.int64)
+    y = np.asarray(values, dtype=float)
+    if len(y) == 0:
+        return y
+
+    window = int(window_days * SECONDS_PER_DAY)
+    # 每个点窗口起始位置：第一个时间 > t - window 的下标
+    starts = np.searchsorted(seconds, seconds - window, side="right")
+    cumsum = np.concatenate(([0.0], np.cumsum(y)))
+    ends = np.arange(1, len(y) + 1)
+    return (cumsum[ends] - cumsum[starts]) / (ends - starts)
+
+
+def ewma(dates: Sequence[Any], values: Sequence[float], halflife_days: float = 7) -> np.ndarray:
+    """按真实时间间隔计算指数加权移动平均（记录间隔不均匀时仍按天衰减），dates需升序"""
+    y = np.asarray(values, dtype=float)
+    if len(y) == 0:
+        return y
+    times = pd.DatetimeIndex(np.asarray(dates, dtype="datetime64[ns]"))
+    return pd.Series(y).ewm(halflife=pd.Timedelta(days=halflife_days), times=times).mean().to_numpy()
+
+
+def weekly_change(trend: Dict[str, Any]) -> float:
+    """趋势对应的每周变化量"""
+    return trend["slope_per_day"] * 7
+
+
+def correlation(x: Sequence[float], y: Sequence[float], min_points: int = 3) -> Dict[str, Any]:
+    """两个序列的皮尔逊相关系数，忽略任一方为NaN的位置
+
+    Returns:
+        r: 相关系数（样本不足或方差为0时为None）
+        n: 参与计算的样本数
+    """
+    xf = np.asarray(x, dtype=float)
+    yf = np.asarray(y, dtype=float)
+    mask = ~(np.isnan(xf) | np.isnan(yf))
+    xf, yf = xf[mask], yf[mask]
+    n = int(mask.sum())
+    if n < min_points or xf.std() == 0 or yf.std() == 0:
+        return {"r": None, "n": n}
+    return {"r": float(np.corrcoef(xf, yf)[0, 1]), "n": n}
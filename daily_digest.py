@@ -0,0 +1,114 @@
+"""
+每日摘要批处理 - 夜间为所有用户预先计算本周统计、健康洞察和目标激励消息
+
+用法:
+    python daily_digest.py --db data/health_assistant.db --workers 4
+
+每个工作进程持有自己的数据库连接，按用户id分块读取数据并计算摘要；
+主进程负责写入 user_daily_digest 表（SQLite只有一个写入者，避免锁竞争）。
+吞吐量统计输出到stderr。
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 每个工作进程内共享的数据库连接和规则引擎（规则只编译一次）
+_db = None
+_engine = None
+
+
+def _init_worker(db_path: str):
+    """初始化工作进程的数据库连接和规则引擎"""
+    global _db, _engine
+    from core.database import DatabaseManager
+    from core.insights import InsightEngine
+    _db = DatabaseManager(db_path)
+    _engine = InsightEngine()
+
+
+def _digest_chunk(db_path: str, user_ids: List[int], now_utc: datetime) -> List[Dict[str, Any]]:
+    """计算一批用户的摘要（在工作进程中执行）"""
+    from core.digest import load_digests
+    if _db is None:
+        _init_worker(db_path)
+    return load_digests(_db, user_ids, _engine, now_utc)
+
+
+def _chunked(user_ids: Sequence[int], size: int) -> Iterator[List[int]]:
+    """按固定大小切分用户id"""
+    for i in range(0, len(user_ids), size):
+        yield list(user_ids[i:i + size])
+
+
+def run_daily_digest(db_path: str, workers: Optional[int] = None, chunksize: int = 1000,
+                     now_utc: Optional[datetime] = None, user_ids: Optional[Sequence[int]] = None) -> int:
+    """计算并保存所有用户的当日摘要，返回处理的用户数
+
+    Args:
+        db_path: SQLite数据库路径
+        workers: 工作进程数，默认等于CPU核数；为0时在当前进程内顺序计算
+        chunksize: 每个任务包含的用户数
+        now_utc: 计算时刻（UTC），默认当前时间；各用户的"今天"按各自时区确定
+        user_ids: 只处理这些用户，默认所有用户
+    """
+    from core.calendar_utils import utc_now
+    from core.database import DatabaseManager
+
+    now_utc = now_utc or utc_now()
+    db = DatabaseManager(db_path)
+    try:
+        if user_ids is None:
+            user_ids = db.get_user_ids()
+        count = 0
+
+        if workers == 0:
+            for chunk in _chunked(user_ids, chunksize):
+                digests = _digest_chunk(db_path, chunk, now_utc)
+                db.save_daily_digests(digests)
+                count += len(digests)
+            return count
+
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(db_path,)) as executor:
+            # 只保留有限数量的在途任务，结果按完成顺序依次写入
+            pending = deque()
+            for chunk in _chunked(user_ids, chunksize):
+                pending.append(executor.submit(_digest_chunk, db_path, chunk, now_utc))
+                if len(pending) >= workers * 2:
+                    digests = pending.popleft().result()
+                    db.save_daily_digests(digests)
+                    count += len(digests)
+            while pending:
+                digests = pending.popleft().result()
+                db.save_daily_digests(digests)
+                count += len(digests)
+        return count
+    finally:
+        db.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="预先计算所有用户的每日摘要")
+    parser.add_argument("--db", default="data/health_assistant.db", help="数据库文件路径")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，0表示不使用进程池")
+    parser.add_argument("--chunksize", type=int, default=1000, help="每个任务包含的用户数")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = run_daily_digest(args.db, args.workers, args.chunksize)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"✅ 生成 {count} 份每日摘要, 用时 {elapsed:.2f}s, {rate:.0f} 用户/秒", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,18 @@
 """
 import streamlit as st
 import os
-from datetime import datetime
 from dotenv import load_dotenv
 
 # 导入核心模块
 from core.database import DatabaseManager
+from core.db_cache import CachedDatabase
+from core.calendar_utils import COMMON_TIMEZONES
+from core.daily_targets import DAILY_TARGETS
+from core.reminders import ReminderScheduler, parse_reminder_time
 from modules.visualization import HealthVisualizer
 from modules.dashboard import Dashboard
 from modules.goals import GoalManager
+from modules.figure_cache import FigureCache, IMAGE_FORMATS, image_renderer_available
 from agents import HealthAssistant
 
 # 加载环境变量
@@ -48,23 +52,49 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_reminder_scheduler(db_path: str) -> ReminderScheduler:
+    """进程内唯一的目标提醒调度器（后台线程使用自己的数据库会话）"""
+    scheduler = ReminderScheduler(db_path)
+    scheduler.start()
+    return scheduler
+
+def reschedule_reminders():
+    """提醒设置或时区变化后更新调度器中当前用户的提醒时间"""
+    settings = st.session_state.db.get_reminder_settings()
+    st.session_state.reminders.schedule(1, settings['timezone'], settings['time'], settings['enabled'])
+
 def initialize_app():
     """初始化应用"""
     # 初始化数据库
     if 'db' not in st.session_state:
-        st.session_state.db = DatabaseManager()
+        # 读取走按用户和查询签名的缓存，写入时按数据范围失效
+        st.session_state.db = CachedDatabase(DatabaseManager())
+    
+    # 目标到期提醒
+    if 'reminders' not in st.session_state:
+        st.session_state.reminders = get_reminder_scheduler(st.session_state.db.db_path)
     
     # 初始化可视化工具
     if 'visualizer' not in st.session_state:
         st.session_state.visualizer = HealthVisualizer()
     
+    # 图表按用户时区显示时间和划分自然日
+    st.session_state.visualizer.timezone = st.session_state.db.get_user_timezone()
+    
+    # 初始化图表缓存
+    if 'figure_cache' not in st.session_state:
+        st.session_state.figure_cache = FigureCache(st.session_state.db)
+    
     # 初始化仪表板
     if 'dashboard' not in st.session_state:
-        st.session_state.dashboard = Dashboard(st.session_state.db, st.session_state.visualizer)
+        st.session_state.dashboard = Dashboard(st.session_state.db, st.session_state.visualizer,
+                                               st.session_state.figure_cache)
     
     # 初始化目标管理器
     if 'goal_manager' not in st.session_state:
-        st.session_state.goal_manager = GoalManager(st.session_state.db, st.session_state.visualizer)
+        st.session_state.goal_manager = GoalManager(st.session_state.db, st.session_state.visualizer,
+                                                    st.session_state.figure_cache)
     
     # 初始化健康助手
     if 'health_assistant' not in st.session_state:
@@ -102,9 +132,19 @@ def render_sidebar():
         motivation = st.session_state.goal_manager.get_motivation_message()
         st.info(motivation)
         
+        # 目标到期提醒
+        reminders = st.session_state.db.get_unread_reminders()
+        if reminders:
+            st.markdown("### 🔔 目标提醒")
+            for reminder in reminders[:5]:
+                st.warning(reminder.message)
+            if st.button("知道了", key="dismiss_reminders", use_container_width=True):
+                st.session_state.db.mark_reminders_read()
+                st.rerun()
+        
         # 快速统计
         st.markdown("### 📈 快速统计")
-        stats = st.session_state.db.get_dashboard_stats()
+        stats = st.session_state.dashboard.snapshot().stats()
         
         if stats.get('current_weight', 0) > 0:
             st.metric("当前体重", f"{stats['current_weight']:.1f} kg")
@@ -206,18 +246,44 @@ def render_profile_page():
                 dietary_preferences = st.text_area("饮食偏好", value=user_profile.dietary_preferences or "",
                                                   placeholder="素食、无乳糖、无麸质等...")
                 
+                current_tz = st.session_state.db.get_user_timezone()
+                timezone_options = COMMON_TIMEZONES if current_tz in COMMON_TIMEZONES else [current_tz] + COMMON_TIMEZONES
+                timezone = st.selectbox("时区", timezone_options, index=timezone_options.index(current_tz),
+                                        help="用于计算“今天”“本周”“本月”的统计范围")
+                
                 if st.form_submit_button("更新健康偏好"):
                     preferences_data = {
                         'activity_level': activity_level,
                         'fitness_goal': fitness_goal,
                         'health_conditions': health_conditions,
-                        'dietary_preferences': dietary_preferences
+                        'dietary_preferences': dietary_preferences,
+                        'timezone': timezone
                     }
                     if st.session_state.db.update_user_profile(preferences_data):
+                        reschedule_reminders()
                         st.success("健康偏好更新成功！")
                         st.rerun()
                     else:
                         st.error("更新失败，请重试")
+        
+        st.subheader("每日目标")
+        with st.form("daily_targets_form"):
+            targets = st.session_state.db.get_daily_targets()
+            columns = st.columns(len(DAILY_TARGETS))
+            new_targets = {}
+            for column, (metric, spec) in zip(columns, DAILY_TARGETS.items()):
+                with column:
+                    new_targets[metric] = st.number_input(
+                        f"{spec['label']} ({spec['unit']}/天)", min_value=1.0, max_value=1000.0,
+                        value=float(targets[metric]), step=1.0
+                    )
+            
+            if st.form_submit_button("更新每日目标"):
+                if st.session_state.db.update_daily_targets(new_targets):
+                    st.success("每日目标更新成功！")
+                    st.rerun()
+                else:
+                    st.error("更新失败，请重试")
 
 def render_analytics_page():
     """渲染数据分析页面"""
@@ -226,8 +292,8 @@ def render_analytics_page():
     # 时间范围选择
     col1, col2 = st.columns([1, 3])
     with col1:
-        time_range = st.selectbox("时间范围", ["最近7天", "最近30天", "最近90天"])
-        days_map = {"最近7天": 7, "最近30天": 30, "最近90天": 90}
+        time_range = st.selectbox("时间范围", ["最近7天", "最近30天", "最近90天", "最近365天"])
+        days_map = {"最近7天": 7, "最近30天": 30, "最近90天": 90, "最近365天": 365}
         selected_days = days_map[time_range]
     
     # 数据类型选择
@@ -238,33 +304,41 @@ def render_analytics_page():
     
     st.markdown("---")
     
-    # 显示图表
-    if "体重" in data_types:
-        st.subheader("📈 体重趋势分析")
-        weight_records = st.session_state.db.get_health_records('weight', days=selected_days)
-        if weight_records:
-            weight_chart = st.session_state.visualizer.create_weight_trend_chart(weight_records)
-            st.plotly_chart(weight_chart, use_container_width=True)
-        else:
-            st.info("该时间范围内无体重数据")
+    # 显示图表（数据未变化时直接使用缓存的图表）
+    dashboard = st.session_state.dashboard
+    visualizer = st.session_state.visualizer
+    figure_cache = st.session_state.figure_cache
     
-    if "运动" in data_types:
-        st.subheader("🏃 运动频率分析")
-        exercise_records = st.session_state.db.get_health_records('exercise', days=selected_days)
-        if exercise_records:
-            exercise_chart = st.session_state.visualizer.create_exercise_frequency_chart(exercise_records)
-            st.plotly_chart(exercise_chart, use_container_width=True)
-        else:
-            st.info("该时间范围内无运动数据")
-    
-    if "心情" in data_types:
-        st.subheader("😊 心情变化分析")
-        mood_records = st.session_state.db.get_health_records('mood', days=selected_days)
-        if mood_records:
-            mood_chart = st.session_state.visualizer.create_mood_trend_chart(mood_records)
-            st.plotly_chart(mood_chart, use_container_width=True)
-        else:
-            st.info("该时间范围内无心情数据")
+    # 所选指标用一次查询加载，绘制共享时间轴的组合图（缩放联动）
+    type_map = {"体重": "weight", "运动": "exercise", "心情": "mood"}
+    record_types = [type_map[t] for t in data_types if t in type_map]
+    if record_types:
+        st.subheader("📈 健康指标综合分析")
+        load_records = dashboard.records_loader(selected_days, record_types)
+        figure_cache.render_chart(
+            'combined:' + ','.join(record_types), selected_days,
+            lambda: dashboard.build_combined_chart(load_records(), record_types),
+            "该时间范围内无所选数据",
+            scopes=record_types
+        )
+        if "运动" in data_types and "心情" in data_types:
+            st.caption("右侧面板按自然日配对每日平均心情与运动分钟数（无运动的日期记为0）")
+        
+        # 单项详细图表复用同一次查询的结果
+        detail_charts = {
+            'weight': ("📈 体重趋势详情", visualizer.create_weight_trend_chart),
+            'exercise': ("🏃 运动频率详情", visualizer.create_exercise_frequency_chart),
+            'mood': ("😊 心情变化详情", visualizer.create_mood_trend_chart),
+        }
+        for record_type in record_types:
+            label, create_chart = detail_charts[record_type]
+            with st.expander(label, expanded=False):
+                figure_cache.render_chart(
+                    record_type, selected_days,
+                    lambda rt=record_type, cc=create_chart: dashboard.build_record_chart(
+                        rt, selected_days, cc, load_records()),
+                    "该时间范围内无数据"
+                )
     
     # 健康洞察
     st.markdown("---")
@@ -303,12 +377,32 @@ def render_settings_page():
         theme = st.selectbox("主题", ["浅色", "深色", "自动"])
         language = st.selectbox("语言", ["中文", "English"])
         
+        st.subheader("低带宽模式")
+        figure_cache = st.session_state.figure_cache
+        figure_cache.lite_mode = st.checkbox(
+            "轻量模式（图表显示为静态图片）", value=figure_cache.lite_mode,
+            help="在服务端将图表渲染为压缩图片，无需加载交互式图表组件，适合手机和网络较差时使用")
+        figure_cache.image_format = st.radio(
+            "图片格式", list(IMAGE_FORMATS), index=IMAGE_FORMATS.index(figure_cache.image_format),
+            horizontal=True, disabled=not figure_cache.lite_mode)
+        if figure_cache.lite_mode and not image_renderer_available():
+            st.warning("未安装kaleido，仍将显示交互式图表（pip install kaleido）")
+        cache_stats = figure_cache.stats()
+        st.caption(f"已缓存图片 {cache_stats['image_bytes'] / 1024:.1f} KB，"
+                   f"图片命中 {cache_stats['image_hits']} 次 / 生成 {cache_stats['image_misses']} 次")
+        
         st.subheader("通知设置")
-        enable_reminders = st.checkbox("启用提醒", value=True)
-        reminder_time = st.time_input("提醒时间", value=datetime.strptime("09:00", "%H:%M").time())
+        reminder_settings = st.session_state.db.get_reminder_settings()
+        enable_reminders = st.checkbox("启用提醒", value=reminder_settings['enabled'],
+                                       help="每天在提醒时间检查即将到期（3天内）和已逾期的目标")
+        reminder_time = st.time_input("提醒时间", value=parse_reminder_time(reminder_settings['time']))
         
         if st.button("保存应用设置"):
-            st.success("应用设置已保存")
+            if st.session_state.db.update_reminder_settings(enable_reminders, reminder_time.strftime("%H:%M")):
+                reschedule_reminders()
+                st.success("应用设置已保存")
+            else:
+                st.error("保存失败，请重试")
     
     with tab3:
         st.subheader("数据管理")
@@ -326,6 +420,31 @@ def render_settings_page():
             if st.button("清除所有数据", type="secondary"):
                 st.warning("此操作将删除所有数据，请谨慎操作！")
         
+        st.markdown("---")
+        st.subheader("缓存统计")
+        db_stats = st.session_state.db.cache_stats()
+        fig_stats = st.session_state.figure_cache.stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("查询缓存命中率", f"{db_stats['hit_rate']:.0%}",
+                      help=f"命中 {db_stats['hits']} 次 / 查询 {db_stats['misses']} 次")
+        with col2:
+            st.metric("图表缓存命中率", f"{fig_stats['hit_rate']:.0%}",
+                      help=f"命中 {fig_stats['hits']} 次 / 构建 {fig_stats['misses']} 次")
+        with col3:
+            st.metric("写入失效条目", db_stats['invalidations'])
+        if db_stats['methods']:
+            st.dataframe(
+                [{"查询": name, "命中": m['hits'], "未命中": m['misses'],
+                  "命中率": f"{m['hits'] / (m['hits'] + m['misses']):.0%}"}
+                 for name, m in db_stats['methods'].items()],
+                hide_index=True
+            )
+        if st.button("清空缓存"):
+            st.session_state.db.clear()
+            st.session_state.figure_cache.clear()
+            st.success("缓存已清空")
+        
         st.markdown("---")
         st.subheader("关于应用")
         st.info("""
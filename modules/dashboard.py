@@ -1,136 +1,241 @@
 """
 仪表板概览模块 - 显示用户当前状态和快速操作
 """
+import time
 import streamlit as st
-from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from streamlit.errors import StreamlitAPIException
+from typing import Dict, Any, List, Optional
+from core.anomaly import describe_anomaly
+from core.calendar_utils import days_until, local_today
+from core.daily_targets import daily_progress
+from core.dashboard_snapshot import DashboardSnapshot
 from core.database import DatabaseManager, Goal
-from modules.visualization import HealthVisualizer
+from core.digest import (digest_from_row, format_week_stats, goals_key, record_key_start, records_key,
+                         user_digest)
+from core.goal_metrics import current_progress
+from core.insights import InsightEngine
+from modules.visualization import HealthVisualizer, COMBINED_METRICS, METRIC_CARD_TYPES
+from modules.figure_cache import FigureCache
+
+# 仪表板趋势图表涉及的记录类型
+CHART_RECORD_TYPES = tuple(COMBINED_METRICS)
+# 仪表板数据快照覆盖的天数（图表、本周统计和洞察均在此范围内）
+SNAPSHOT_DAYS = 30
+# 健康洞察中提示最近几天检测到的异常
+ANOMALY_ALERT_DAYS = 7
+# 指标面板: 记录类型 -> (名称, 无数据提示)
+METRIC_PANELS = {
+    'weight': ("体重", "暂无体重记录，快去添加第一条记录吧！"),
+    'exercise': ("运动", "暂无运动记录，开始记录你的运动吧！"),
+    'mood': ("心情", "暂无心情记录，记录今天的心情吧！"),
+}
+
+# st.fragment 自 Streamlit 1.37 起可用；更早的版本退化为普通函数（每次操作整页重跑）
+_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda func: func)
+
+
+def _rerun_fragment():
+    """只重跑当前片段；不支持片段重跑的Streamlit版本或整页运行中改为整页重跑"""
+    try:
+        st.rerun(scope="fragment")
+    except (TypeError, StreamlitAPIException):
+        st.rerun()
+
 
 class Dashboard:
     """仪表板类"""
     
-    def __init__(self, db: DatabaseManager, visualizer: HealthVisualizer):
+    def __init__(self, db: DatabaseManager, visualizer: HealthVisualizer,
+                 figure_cache: Optional[FigureCache] = None):
         self.db = db
         self.visualizer = visualizer
+        self.figure_cache = figure_cache or FigureCache(db)
+        self._snapshot: Optional[DashboardSnapshot] = None
+        self.insight_engine = InsightEngine()
+        # (快照, 摘要) 和 ((user_id, 本地日期), 预计算的摘要行)
+        self._digest = None
+        self._stored_digest = None
+    
+    def snapshot(self) -> DashboardSnapshot:
+        """当前数据快照；数据版本或本地日期变化后重新加载（每张表一条查询）"""
+        current = self._snapshot
+        if (current is None or current.version != self.db.get_data_version()
+                or current.local_date != local_today(current.timezone)):
+            self._snapshot = self.db.get_dashboard_snapshot(SNAPSHOT_DAYS)
+        return self._snapshot
     
     def render_dashboard(self):
         """渲染主仪表板"""
         st.title("🏥 智能健康助手 - 今日概览")
         
-        # 获取统计数据
-        stats = self.db.get_dashboard_stats()
-        
-        # 显示指标卡片
-        self.visualizer.display_metric_cards(stats)
-        
-        st.markdown("---")
-        
-        # 布局：左侧图表，右侧快速操作
-        col1, col2 = st.columns([2, 1])
+        # 每个指标面板（指标卡片、趋势图和快速记录）是独立片段，
+        # 记录数据后只重跑对应面板，不再重新查询和渲染整个仪表板
+        st.subheader("📊 健康趋势")
+        tabs = st.tabs([label for label, _ in METRIC_PANELS.values()] + ["综合视图"])
         
-        with col1:
-            self._render_charts_section()
+        for tab, record_type in zip(tabs, METRIC_PANELS):
+            with tab:
+                self._render_metric_panel(record_type)
         
-        with col2:
-            self._render_quick_actions()
+        with tabs[-1]:
+            self._render_overview()
         
         st.markdown("---")
         
         # 底部：目标进度和本周总结
         self._render_goals_and_summary()
     
-    def _render_charts_section(self):
-        """渲染图表区域"""
-        st.subheader("📊 健康趋势")
+    @_fragment
+    def _render_metric_panel(self, record_type: str):
+        """渲染单项指标面板（独立片段）"""
+        label, empty_message = METRIC_PANELS[record_type]
+        panel = self.load_metric_panel(record_type)
         
-        # 图表选项卡
-        chart_tab1, chart_tab2, chart_tab3 = st.tabs(["体重趋势", "运动记录", "心情变化"])
+        cards = METRIC_CARD_TYPES[record_type]
+        for column, card in zip(st.columns(len(cards)), cards):
+            with column:
+                self.visualizer.display_metric_card(card, panel['stats'])
         
-        with chart_tab1:
-            weight_records = self.db.get_health_records('weight', days=30)
-            if weight_records:
-                weight_chart = self.visualizer.create_weight_trend_chart(weight_records)
-                st.plotly_chart(weight_chart, use_container_width=True)
-            else:
-                st.info("暂无体重记录，快去添加第一条记录吧！")
+        col1, col2 = st.columns([2, 1])
         
-        with chart_tab2:
-            exercise_records = self.db.get_health_records('exercise', days=30)
-            if exercise_records:
-                exercise_chart = self.visualizer.create_exercise_frequency_chart(exercise_records)
-                st.plotly_chart(exercise_chart, use_container_width=True)
-            else:
-                st.info("暂无运动记录，开始记录你的运动吧！")
+        with col1:
+            self.figure_cache.show_chart(panel['chart'], empty_message)
         
-        with chart_tab3:
-            mood_records = self.db.get_health_records('mood', days=30)
-            if mood_records:
-                mood_chart = self.visualizer.create_mood_trend_chart(mood_records)
-                st.plotly_chart(mood_chart, use_container_width=True)
-            else:
-                st.info("暂无心情记录，记录今天的心情吧！")
+        with col2:
+            st.markdown(f"**⚡ 记录{label}**")
+            self._render_quick_action(record_type)
+            self._show_action_timing(record_type)
+    
+    def load_metric_panel(self, record_type: str) -> Dict[str, Any]:
+        """加载单项指标面板的数据（不调用Streamlit）：指标卡片统计和趋势图
+        
+        片段重跑时只执行这里的查询：快照过期时重新加载一次，图表缓存未命中时由快照构建本指标的图表。
+        """
+        snapshot = self.snapshot()
+        create_chart = {
+            'weight': self.visualizer.create_weight_trend_chart,
+            'exercise': self.visualizer.create_exercise_frequency_chart,
+            'mood': self.visualizer.create_mood_trend_chart,
+        }[record_type]
+        return {
+            'stats': snapshot.metric_stats(record_type),
+            'chart': self.figure_cache.load_chart(
+                record_type, SNAPSHOT_DAYS,
+                lambda: self.build_record_chart(record_type, SNAPSHOT_DAYS, create_chart,
+                                                snapshot.records_by_type())
+            ),
+        }
+    
+    def _render_overview(self):
+        """渲染综合视图：全部指标卡片和组合图（整页重跑时刷新）"""
+        snapshot = self.snapshot()
+        self.visualizer.display_metric_cards(snapshot.stats())
+        self.figure_cache.render_chart(
+            'combined', SNAPSHOT_DAYS,
+            lambda: self.build_combined_chart(snapshot.records_by_type()),
+            "暂无健康记录，快去添加第一条记录吧！"
+        )
+        if st.button("🔄 刷新全部", key="refresh_dashboard"):
+            st.rerun()
+    
+    def records_loader(self, days: int, record_types: Optional[List[str]] = None):
+        """返回一个延迟加载函数：首次调用时一次查询取出所有图表类型的记录，之后复用结果"""
+        record_types = record_types or list(CHART_RECORD_TYPES)
+        loaded: Dict[str, List] = {}
+        
+        def load() -> Dict[str, List]:
+            if not loaded:
+                loaded.update(self.db.get_health_records_multi(record_types, days=days))
+            return loaded
+        return load
     
-    def _render_quick_actions(self):
-        """渲染快速操作区域"""
-        st.subheader("⚡ 快速操作")
+    def build_record_chart(self, record_type: str, days: int, create_chart,
+                           records_by_type: Optional[Dict[str, List]] = None):
+        """查询记录并构建图表，无记录时返回None（仅在图表缓存未命中时调用）"""
+        if records_by_type is not None:
+            records = records_by_type.get(record_type, [])
+        else:
+            records = self.db.get_health_records(record_type, days=days)
+        return create_chart(records) if records else None
+    
+    def build_combined_chart(self, records_by_type: Dict[str, List],
+                             record_types: Optional[List[str]] = None):
+        """构建多指标组合图，所选指标均无记录时返回None"""
+        record_types = record_types or list(CHART_RECORD_TYPES)
+        if not any(records_by_type.get(t) for t in record_types):
+            return None
+        return self.visualizer.create_combined_chart(records_by_type, record_types)
+    
+    def _render_quick_action(self, record_type: str):
+        """渲染单项快速记录表单，保存后只重跑所在片段"""
+        saved = None
         
-        # 快速记录体重
-        with st.expander("📏 记录体重", expanded=False):
+        if record_type == 'weight':
+            # 快速记录体重
             weight = st.number_input("体重 (kg)", min_value=30.0, max_value=200.0, step=0.1, key="quick_weight")
             if st.button("保存体重", key="save_weight"):
-                if self.db.add_health_record('weight', f"{weight} kg", weight):
-                    st.success("体重记录成功！")
-                    st.rerun()
-                else:
-                    st.error("记录失败，请重试")
-        
-        # 快速记录运动
-        with st.expander("🏃 记录运动", expanded=False):
+                self._start_action_timing(record_type)
+                saved = self.db.add_health_record('weight', f"{weight} kg", weight)
+        
+        elif record_type == 'exercise':
+            # 快速记录运动
             exercise_type = st.selectbox("运动类型", 
                                        ["跑步", "健身", "游泳", "瑜伽", "散步", "其他"],
                                        key="quick_exercise_type")
             duration = st.number_input("时长 (分钟)", min_value=1, max_value=300, step=1, key="quick_duration")
             if st.button("保存运动", key="save_exercise"):
                 exercise_value = f"{exercise_type} {duration}分钟"
-                if self.db.add_health_record('exercise', exercise_value, duration):
-                    st.success("运动记录成功！")
-                    st.rerun()
-                else:
-                    st.error("记录失败，请重试")
-        
-        # 快速记录心情
-        with st.expander("😊 记录心情", expanded=False):
+                self._start_action_timing(record_type)
+                saved = self.db.add_health_record('exercise', exercise_value, duration)
+        
+        elif record_type == 'mood':
+            # 快速记录心情
             mood_value = st.slider("心情指数", 1, 10, 5, key="quick_mood")
             mood_note = st.text_area("心情备注", placeholder="今天的感受...", key="quick_mood_note")
             if st.button("保存心情", key="save_mood"):
-                if self.db.add_health_record('mood', f"心情: {mood_value}/10", mood_value, mood_note):
-                    st.success("心情记录成功！")
-                    st.rerun()
-                else:
-                    st.error("记录失败，请重试")
-        
-        # 快速设定目标
-        with st.expander("🎯 设定目标", expanded=False):
-            if st.button("前往目标管理", key="goto_goals"):
-                st.session_state.page = "goals"
-                st.rerun()
+                self._start_action_timing(record_type)
+                saved = self.db.add_health_record('mood', f"心情: {mood_value}/10", mood_value, mood_note)
+        
+        if saved:
+            st.success(f"{METRIC_PANELS[record_type][0]}记录成功！")
+            _rerun_fragment()
+        elif saved is not None:
+            st.session_state.pop(f"action_timing_{record_type}", None)
+            st.error("记录失败，请重试")
+    
+    def _start_action_timing(self, record_type: str):
+        """记录快速操作开始时的时间和SQL语句数"""
+        st.session_state[f"action_timing_{record_type}"] = (time.perf_counter(), self.db.statement_count)
+    
+    def _show_action_timing(self, record_type: str):
+        """面板重跑结束时计算上一次快速记录（写入 + 刷新面板）的查询数和耗时"""
+        pending = st.session_state.pop(f"action_timing_{record_type}", None)
+        if pending is not None:
+            start, start_count = pending
+            st.session_state[f"action_cost_{record_type}"] = (
+                self.db.statement_count - start_count, (time.perf_counter() - start) * 1000
+            )
+        cost = st.session_state.get(f"action_cost_{record_type}")
+        if cost is not None:
+            st.caption(f"⏱️ 上次记录: {cost[0]} 次查询, {cost[1]:.0f} ms")
     
     def _render_goals_and_summary(self):
         """渲染目标和总结区域"""
+        snapshot = self.snapshot()
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("🎯 活跃目标")
-            active_goals = self.db.get_active_goals()
+            active_goals = snapshot.active_goals
             
             if active_goals:
                 # 显示前3个最紧急的目标
                 for goal in active_goals[:3]:
-                    progress = (goal.current_value / goal.target_value * 100) if goal.target_value > 0 else 0
+                    current = current_progress(goal, snapshot.local_date)
+                    progress = (current / goal.target_value * 100) if goal.target_value > 0 else 0
                     
-                    # 计算剩余天数
-                    days_left = (goal.deadline - datetime.utcnow()).days
+                    # 计算剩余天数（按本地自然日）
+                    days_left = days_until(goal.deadline, snapshot.timezone)
                     
                     with st.container():
                         st.write(f"**{goal.title}**")
@@ -141,63 +246,43 @@ class Dashboard:
                     st.caption(f"还有 {len(active_goals) - 3} 个目标...")
             else:
                 st.info("暂无活跃目标，去设定一个新目标吧！")
+            
+            if st.button("🎯 前往目标管理", key="goto_goals"):
+                st.session_state.page = "goals"
+                st.rerun()
         
         with col2:
             st.subheader("📅 本周总结")
             
             # 本周运动总结
-            week_records = self.db.get_health_records('exercise', days=7)
-            weekly_chart = self.visualizer.create_weekly_summary_chart(week_records)
-            st.plotly_chart(weekly_chart, use_container_width=True)
+            self.figure_cache.render_chart(
+                'weekly', 7,
+                lambda: self.visualizer.create_weekly_summary_chart(snapshot.local_days('exercise', 7)),
+                "暂无本周运动记录"
+            )
             
             # 本周统计
             week_stats = self._calculate_week_stats()
             for stat_name, stat_value in week_stats.items():
                 st.metric(stat_name, stat_value)
+        
+        # 连续打卡（添加记录时增量维护的计数）
+        st.subheader("🔥 连续打卡")
+        self.visualizer.display_streaks(snapshot.streaks)
     
     def _calculate_week_stats(self) -> Dict[str, str]:
-        """计算本周统计数据"""
-        # 获取本周记录
-        week_records = self.db.get_health_records(days=7)
-        
-        # 统计各类记录
-        exercise_count = len([r for r in week_records if r.record_type == 'exercise'])
-        mood_records = [r for r in week_records if r.record_type == 'mood']
-        
-        # 平均心情
-        avg_mood = 0
-        if mood_records:
-            avg_mood = sum(r.numeric_value for r in mood_records) / len(mood_records)
-        
-        return {
-            "运动次数": f"{exercise_count} 次",
-            "平均心情": f"{avg_mood:.1f}/10" if avg_mood > 0 else "无记录"
-        }
+        """计算本周统计数据（最近7个本地自然日）"""
+        return format_week_stats(self.digest())
     
     def render_progress_bars(self):
-        """渲染今日进度条"""
+        """渲染今日进度条（今日计数器 / 用户的每日目标）"""
         st.subheader("📈 今日进度")
         
-        # 获取今日目标完成情况
-        today = datetime.utcnow().date()
-        
-        # 运动目标 (假设每日目标是30分钟)
-        today_exercise = self.db.get_health_records('exercise', days=1)
-        total_exercise_time = sum(r.numeric_value for r in today_exercise if r.numeric_value)
-        exercise_progress = min(total_exercise_time / 30 * 100, 100)  # 目标30分钟
-        
-        st.write("🏃 运动目标 (30分钟)")
-        st.progress(exercise_progress / 100)
-        st.caption(f"已完成: {total_exercise_time:.0f}分钟 ({exercise_progress:.1f}%)")
-        
-        # 饮水目标 (假设每日8杯水)
-        today_water = self.db.get_health_records('water', days=1)
-        water_count = len(today_water)
-        water_progress = min(water_count / 8 * 100, 100)
-        
-        st.write("💧 饮水目标 (8杯)")
-        st.progress(water_progress / 100)
-        st.caption(f"已完成: {water_count}杯 ({water_progress:.1f}%)")
+        snapshot = self.snapshot()
+        for item in daily_progress(snapshot.daily_totals, snapshot.daily_targets):
+            st.write(f"{item['label']} ({item['target']:g}{item['unit']})")
+            st.progress(item['ratio'])
+            st.caption(f"已完成: {item['done']:g}{item['unit']} ({item['ratio'] * 100:.1f}%)")
     
     def render_health_insights(self):
         """渲染健康洞察"""
@@ -210,37 +295,37 @@ class Dashboard:
             st.info(insight)
     
     def _generate_insights(self) -> List[str]:
-        """生成健康洞察"""
-        insights = []
-        
-        # 分析运动频率
-        week_exercises = len(self.db.get_health_records('exercise', days=7))
-        if week_exercises < 3:
-            insights.append("🏃 本周运动次数较少，建议增加到每周3-5次运动")
-        elif week_exercises >= 5:
-            insights.append("🎉 本周运动频率很棒，继续保持！")
-        
-        # 分析心情趋势
-        mood_records = self.db.get_health_records('mood', days=7)
-        if mood_records:
-            avg_mood = sum(r.numeric_value for r in mood_records) / len(mood_records)
-            if avg_mood < 5:
-                insights.append("😟 最近心情偏低，建议多做一些放松活动")
-            elif avg_mood >= 7:
-                insights.append("😊 最近心情不错，保持积极的生活态度！")
-        
-        # 体重趋势分析
-        weight_records = self.db.get_health_records('weight', days=14)
-        if len(weight_records) >= 2:
-            recent_weight = weight_records[0].numeric_value
-            older_weight = weight_records[-1].numeric_value
-            weight_change = recent_weight - older_weight
-            
-            if abs(weight_change) > 1:
-                direction = "增加" if weight_change > 0 else "减少"
-                insights.append(f"⚖️ 近期体重{direction}了{abs(weight_change):.1f}kg，注意饮食和运动平衡")
-        
-        if not insights:
-            insights.append("📊 继续记录数据，我们将为您提供更多个性化建议")
-        
-        return insights
+        """生成健康洞察：最近一周检测到的异常在前，其后为规则引擎的洞察"""
+        anomalies = [describe_anomaly(a.record_type, a.kind, a.value, a.baseline)
+                     for a in self.snapshot().recent_anomalies(ANOMALY_ALERT_DAYS)]
+        return anomalies + self.digest()['insights']
+    
+    def digest(self) -> Dict[str, Any]:
+        """当日摘要（本周统计和健康洞察）
+        
+        优先使用夜间批处理预计算的摘要；其数据指纹与当前快照不一致（之后有新记录或
+        目标变化）时，在快照数据上实时计算（规则引擎在日汇总特征上求值）。
+        """
+        snapshot = self.snapshot()
+        if self._digest is not None and self._digest[0] is snapshot:
+            return self._digest[1]
+        
+        records = [r for records in snapshot.records.values() for r in records]
+        stored = self._load_stored_digest(snapshot)
+        since = record_key_start(snapshot.timezone, snapshot.loaded_at)
+        if (stored is not None and stored['record_key'] == records_key(records, since)
+                and stored['goals_key'] == goals_key(snapshot.active_goals)):
+            digest = stored
+        else:
+            digest = user_digest(records, snapshot.active_goals, snapshot.user_id, snapshot.timezone,
+                                 self.insight_engine, snapshot.loaded_at)
+        self._digest = (snapshot, digest)
+        return digest
+    
+    def _load_stored_digest(self, snapshot: DashboardSnapshot) -> Optional[Dict[str, Any]]:
+        """读取当天预计算的摘要（每个用户每天只查询一次）"""
+        key = (snapshot.user_id, snapshot.local_date)
+        if self._stored_digest is None or self._stored_digest[0] != key:
+            row = self.db.get_daily_digest(snapshot.local_date, snapshot.user_id)
+            self._stored_digest = (key, digest_from_row(row) if row is not None else None)
+        return self._stored_digest[1]
@@ -0,0 +1,185 @@
+"""
+图表缓存模块 - 按数据版本缓存序列化后的Plotly图表，数据未变化时跳过查询和图表构建
+
+轻量模式下在服务端将图表渲染为静态PNG/SVG图片（需要kaleido），同样按数据版本缓存，
+移动端和弱网环境无需加载Plotly前端和图表JSON。
+"""
+import io
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import plotly.graph_objects as go
+import streamlit as st
+
+from core.calendar_utils import local_today
+from core.database import DatabaseManager
+
+# 图表类型 -> 影响该图表的数据范围
+CHART_SCOPES = {
+    'weight': ('weight',),
+    'exercise': ('exercise',),
+    'mood': ('mood',),
+    'weekly': ('exercise',),
+    'goals': ('goals',),
+    'combined': ('weight', 'exercise', 'mood'),
+}
+
+# 轻量模式的图片格式和尺寸（面向手机屏幕）
+IMAGE_FORMATS = ('png', 'svg')
+LITE_IMAGE_WIDTH = 720
+PNG_COLORS = 64
+
+
+@lru_cache(maxsize=1)
+def image_renderer_available() -> bool:
+    """是否安装了静态图片渲染器kaleido"""
+    try:
+        import kaleido  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def figure_to_image(fig_json: str, fmt: str = 'png', width: int = LITE_IMAGE_WIDTH) -> bytes:
+    """将图表JSON渲染为静态图片；PNG额外压缩为调色板图片（图表颜色很少，几乎无损）"""
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"未知的图片格式: {fmt}（可选: {', '.join(IMAGE_FORMATS)}）")
+    fig = go.Figure(json.loads(fig_json))
+    height = fig.layout.height or 400
+    data = fig.to_image(format=fmt, width=width, height=height, scale=1)
+    if fmt == 'png':
+        data = _compress_png(data)
+    return data
+
+
+def _compress_png(data: bytes) -> bytes:
+    """量化为调色板PNG并优化压缩，未安装Pillow时原样返回"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    image = Image.open(io.BytesIO(data)).convert('RGB').quantize(colors=PNG_COLORS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue() if buffer.tell() < len(data) else data
+
+
+class FigureCache:
+    """图表缓存类
+
+    缓存键为 (user_id, 图表类型, 时间范围)，条目记录生成时的数据版本；
+    数据版本由 DatabaseManager 在写入时递增，版本不一致即视为失效。
+    """
+
+    def __init__(self, db: DatabaseManager, maxsize: int = 64):
+        self.db = db
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple, Tuple[Tuple, Optional[str]]]" = OrderedDict()
+        self._images: "OrderedDict[Tuple, Tuple[Tuple, Optional[bytes]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # 轻量模式：以静态图片代替交互式图表
+        self.lite_mode = False
+        self.image_format = 'png'
+        self.image_hits = 0
+        self.image_misses = 0
+
+    def _version(self, chart: str, user_id: int, scopes: Optional[Sequence[str]] = None) -> Tuple:
+        """当前数据版本（含用户时区和本地日期，跨天或修改时区时按天滚动的图表也会失效）"""
+        scopes = scopes or CHART_SCOPES.get(chart, (chart,))
+        tz_name = self.db.get_user_timezone(user_id)
+        return (tz_name, local_today(tz_name).isoformat()) + tuple(self.db.get_data_version(user_id, s) for s in scopes)
+
+    def get_figure_json(self, chart: str, days: int, builder: Callable[[], Optional[go.Figure]],
+                        user_id: int = 1, scopes: Optional[Sequence[str]] = None) -> Optional[str]:
+        """获取图表JSON，未命中时调用builder查询数据并构建图表；builder返回None表示无数据
+
+        scopes可覆盖图表依赖的数据范围（如组合图只包含部分指标时）。
+        """
+        key = (user_id, chart, days)
+        version = self._version(chart, user_id, scopes)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        fig = builder()
+        fig_json = fig.to_json() if fig is not None else None
+        self._store(self._entries, key, version, fig_json)
+        return fig_json
+
+    def get_figure_image(self, chart: str, days: int, builder: Callable[[], Optional[go.Figure]],
+                         user_id: int = 1, scopes: Optional[Sequence[str]] = None,
+                         fmt: Optional[str] = None) -> Optional[bytes]:
+        """获取图表的静态图片，数据版本不变时直接返回缓存的图片"""
+        fmt = fmt or self.image_format
+        key = (user_id, chart, days, fmt)
+        version = self._version(chart, user_id, scopes)
+
+        entry = self._images.get(key)
+        if entry is not None and entry[0] == version:
+            self._images.move_to_end(key)
+            self.image_hits += 1
+            return entry[1]
+
+        self.image_misses += 1
+        fig_json = self.get_figure_json(chart, days, builder, user_id, scopes)
+        image = figure_to_image(fig_json, fmt) if fig_json is not None else None
+        self._store(self._images, key, version, image)
+        return image
+
+    def _store(self, entries: OrderedDict, key: Tuple, version: Tuple, value):
+        """写入条目并按LRU淘汰"""
+        entries[key] = (version, value)
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def load_chart(self, chart: str, days: int, builder: Callable[[], Optional[go.Figure]],
+                   user_id: int = 1, scopes: Optional[Sequence[str]] = None) -> Tuple[str, Optional[Any]]:
+        """读取缓存的图表（不调用Streamlit），返回 (格式, 内容)：轻量模式下为图片格式和图片，
+        否则为 ('json', 图表JSON)；内容为None表示无数据"""
+        if self.lite_mode and image_renderer_available():
+            return self.image_format, self.get_figure_image(chart, days, builder, user_id, scopes)
+        return 'json', self.get_figure_json(chart, days, builder, user_id, scopes)
+
+    @staticmethod
+    def show_chart(loaded: Tuple[str, Optional[Any]], empty_message: str):
+        """显示 load_chart 读取的图表，无数据时显示提示"""
+        fmt, content = loaded
+        if content is None:
+            st.info(empty_message)
+        elif fmt == 'json':
+            st.plotly_chart(json.loads(content), use_container_width=True)
+        elif fmt == 'svg':
+            st.image(content.decode('utf-8'))
+        else:
+            st.image(content)
+
+    def render_chart(self, chart: str, days: int, builder: Callable[[], Optional[go.Figure]],
+                     empty_message: str, user_id: int = 1, scopes: Optional[Sequence[str]] = None):
+        """渲染缓存的图表，无数据时显示提示；轻量模式下显示静态图片"""
+        self.show_chart(self.load_chart(chart, days, builder, user_id, scopes), empty_message)
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._images.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self._entries),
+            'image_hits': self.image_hits,
+            'image_misses': self.image_misses,
+            'image_bytes': sum(len(v) for _, v in self._images.values() if v),
+        }
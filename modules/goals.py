@@ -2,26 +2,39 @@
 目标设定与跟踪模块 - SMART目标管理系统
 """
 import streamlit as st
+import pandas as pd
 from datetime import datetime, timedelta, date
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from core.calendar_utils import days_until, local_today, utc_to_local
 from core.database import DatabaseManager, Goal
+from core.digest import goals_key, motivation_message
+from core.goal_forecast import forecast_goals
+from core.goal_metrics import GOAL_METRICS, auto_synced, current_progress, periods_met
 from modules.visualization import HealthVisualizer
+from modules.figure_cache import FigureCache
+
+# 已完成目标列表每页显示的数量
+COMPLETED_PAGE_SIZE = 10
 
 class GoalManager:
     """目标管理类"""
     
-    def __init__(self, db: DatabaseManager, visualizer: HealthVisualizer):
+    def __init__(self, db: DatabaseManager, visualizer: HealthVisualizer,
+                 figure_cache: Optional[FigureCache] = None):
         self.db = db
         self.visualizer = visualizer
+        self.figure_cache = figure_cache or FigureCache(db)
         
-        # 预定义目标模板
+        # 预定义目标模板（metric 为绑定的指标，进度根据健康记录自动更新；
+        # 睡眠、饮水等应用内没有记录入口的目标仍手动更新）
         self.goal_templates = {
             "减重": {
                 "category": "weight",
                 "unit": "kg",
                 "description": "通过健康饮食和规律运动达到理想体重",
                 "default_target": 5.0,
-                "default_days": 90
+                "default_days": 90,
+                "metric": "weight_loss"
             },
             "增肌": {
                 "category": "fitness",
@@ -42,7 +55,8 @@ class GoalManager:
                 "unit": "次/周",
                 "description": "养成规律运动的习惯",
                 "default_target": 4.0,
-                "default_days": 30
+                "default_days": 30,
+                "metric": "exercise_weekly"
             },
             "睡眠质量": {
                 "category": "wellness",
@@ -83,34 +97,29 @@ class GoalManager:
     
     def _render_goal_stats(self):
         """渲染目标统计"""
-        active_goals = self.db.get_active_goals()
-        completed_goals = self.db.session.query(Goal).filter_by(status='completed').all()
+        stats = self.db.get_goal_stats()
         
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("活跃目标", len(active_goals))
+            st.metric("活跃目标", stats['by_status'].get('active', 0))
         
         with col2:
-            st.metric("已完成目标", len(completed_goals))
+            st.metric("已完成目标", stats['by_status'].get('completed', 0))
         
         with col3:
-            # 计算平均完成度
-            if active_goals:
-                avg_progress = sum(
-                    (goal.current_value / goal.target_value * 100) if goal.target_value > 0 else 0
-                    for goal in active_goals
-                ) / len(active_goals)
-                st.metric("平均进度", f"{avg_progress:.1f}%")
+            # 活跃目标的平均完成度
+            if stats['by_status'].get('active'):
+                st.metric("平均进度", f"{stats['avg_progress']:.1f}%")
             else:
                 st.metric("平均进度", "0%")
         
         with col4:
             # 本月完成的目标数
-            month_start = datetime.utcnow().replace(day=1)
-            month_completed = len([g for g in completed_goals 
-                                 if g.completed_at and g.completed_at >= month_start])
-            st.metric("本月完成", month_completed)
+            st.metric("本月完成", stats['month_completed'])
+        
+        # 习惯打卡：坚持天数是习惯类目标最直接的进度
+        self.visualizer.display_streaks(self.db.get_streaks())
     
     def _render_new_goal_form(self):
         """渲染新目标表单"""
@@ -139,6 +148,11 @@ class GoalManager:
                 target_value = st.number_input("目标数值", min_value=0.1, step=0.1)
                 unit = st.text_input("单位", placeholder="例如：kg, 次, 分钟")
                 deadline_days = st.number_input("完成期限（天）", min_value=1, max_value=365, value=30)
+                metric = st.selectbox(
+                    "进度来源",
+                    [None] + [m for m in GOAL_METRICS if auto_synced(m)],
+                    format_func=lambda m: "手动更新" if m is None else f"自动同步: {GOAL_METRICS[m]['label']}"
+                )
             else:
                 # 预设目标
                 template = self.goal_templates[goal_type]
@@ -158,6 +172,9 @@ class GoalManager:
                     max_value=365, 
                     value=template["default_days"]
                 )
+                metric = template.get("metric")
+                if metric:
+                    st.caption(f"🔗 进度将根据你的健康记录自动更新（{GOAL_METRICS[metric]['label']}）")
             
             # 计算截止日期
             deadline = datetime.utcnow() + timedelta(days=deadline_days)
@@ -174,7 +191,8 @@ class GoalManager:
                         category=category,
                         target_value=target_value,
                         unit=unit,
-                        deadline=deadline
+                        deadline=deadline,
+                        metric=metric
                     )
                     
                     if success:
@@ -197,23 +215,54 @@ class GoalManager:
             return
         
         # 显示目标进度图表
-        if len(active_goals) > 0:
-            goal_chart = self.visualizer.create_goal_progress_chart(active_goals)
-            st.plotly_chart(goal_chart, use_container_width=True)
+        self.figure_cache.render_chart(
+            'goals', 0,
+            lambda: self.visualizer.create_goal_progress_chart(active_goals, local_today(self.db.get_user_timezone())),
+            "暂无目标数据"
+        )
         
         st.markdown("---")
         
+        # 一次读取所有活跃目标的进度历史，批量预测完成日期
+        events = self.db.get_goal_progress_events([goal.id for goal in active_goals])
+        forecasts = forecast_goals(active_goals, events)
+        histories = DatabaseManager.split_goal_progress_events(events)
+        
         # 显示目标详情和操作
         for i, goal in enumerate(active_goals):
             with st.container():
-                self._render_goal_card(goal, i)
+                self._render_goal_card(goal, i, forecasts.get(goal.id), histories.get(goal.id))
                 st.markdown("---")
     
-    def _render_goal_card(self, goal: Goal, index: int):
-        """渲染单个目标卡片"""
+    def _render_forecast(self, goal: Goal, forecast: Optional[Dict[str, Any]]):
+        """渲染目标完成预测"""
+        if forecast is None:
+            return
+        tz_name = self.db.get_user_timezone()
+        required = forecast['required_rate']
+        if forecast['on_track'] is None:
+            if required is not None and required > 0:
+                st.caption(f"📐 需每天 +{required:.2f} {goal.unit} 才能按期完成（记录更多进度后显示预测）")
+            return
+        if forecast['projected'] is not None:
+            projected = utc_to_local(forecast['projected'], tz_name).strftime('%Y-%m-%d')
+            rate_text = f"当前每天 +{forecast['rate']:.2f} {goal.unit}" if forecast['rate'] else "已达成"
+            message = f"📈 预计 {projected} 完成（{rate_text}）"
+        else:
+            message = "📉 按当前进度无法完成"
+        if forecast['on_track']:
+            st.caption(f"{message}，✅ 可按期完成")
+        else:
+            st.caption(f"{message}，⚠️ 需每天 +{max(required or 0, 0):.2f} {goal.unit} 才能按期完成")
+    
+    def _render_goal_card(self, goal: Goal, index: int, forecast: Optional[Dict[str, Any]] = None,
+                          history: Optional[pd.DataFrame] = None):
+        """渲染单个目标卡片（history 为已批量读取的进度时间序列）"""
         # 计算进度和剩余时间
-        progress = (goal.current_value / goal.target_value * 100) if goal.target_value > 0 else 0
-        days_left = (goal.deadline - datetime.utcnow()).days
+        tz_name = self.db.get_user_timezone()
+        current = current_progress(goal, local_today(tz_name))
+        progress = (current / goal.target_value * 100) if goal.target_value > 0 else 0
+        days_left = days_until(goal.deadline, tz_name)
         
         # 目标状态颜色
         if progress >= 100:
@@ -248,7 +297,19 @@ class GoalManager:
             
             # 进度条
             st.progress(min(progress / 100, 1.0))
-            st.caption(f"进度: {goal.current_value:.1f}/{goal.target_value:.1f} {goal.unit} ({progress:.1f}%)")
+            st.caption(f"进度: {current:.1f}/{goal.target_value:.1f} {goal.unit} ({progress:.1f}%)")
+            periods = periods_met(goal)
+            if periods is not None:
+                st.caption(f"🗓️ 已达标周期: {periods[0]}/{periods[1]}（全部达标即完成目标）")
+            self._render_forecast(goal, forecast)
+            with st.expander("📈 进度历史"):
+                projected = forecast['projected'] if forecast else None
+                self.figure_cache.render_chart(
+                    f'goal_history_{goal.id}', 0,
+                    lambda: self.visualizer.create_goal_history_chart(
+                        history, goal, projected),
+                    "暂无进度历史", scopes=('goals',)
+                )
         
         with col2:
             st.markdown(f"**截止日期**")
@@ -259,12 +320,19 @@ class GoalManager:
         with col3:
             st.markdown("**操作**")
             
+            if auto_synced(goal.metric):
+                # 绑定指标的目标由健康记录自动更新进度
+                st.caption(f"🔗 自动同步: {GOAL_METRICS[goal.metric]['label']}")
+                if st.button("暂停", key=f"pause_btn_{goal.id}_{index}"):
+                    self._pause_goal(goal.id)
+                return
+            
             # 更新进度
             new_value = st.number_input(
                 "更新进度",
                 min_value=0.0,
                 max_value=goal.target_value * 1.5,  # 允许超出目标
-                value=goal.current_value,
+                value=current,
                 step=0.1,
                 key=f"goal_update_{goal.id}_{index}"
             )
@@ -288,19 +356,28 @@ class GoalManager:
         """渲染已完成目标"""
         st.subheader("已完成目标")
         
-        completed_goals = self.db.session.query(Goal).filter_by(status='completed').order_by(Goal.completed_at.desc()).all()
+        stats = self.db.get_goal_stats()
+        total = stats['by_status'].get('completed', 0)
         
-        if not completed_goals:
+        if not total:
             st.info("还没有完成的目标，继续努力吧！")
             return
         
         # 成就统计
-        self._render_achievement_stats(completed_goals)
+        self._render_achievement_stats(stats)
         
         st.markdown("---")
         
-        # 显示已完成目标列表
-        for goal in completed_goals[:10]:  # 只显示最近10个
+        # 分页显示已完成目标列表
+        pages = (total - 1) // COMPLETED_PAGE_SIZE + 1
+        page = 1
+        if pages > 1:
+            page = st.number_input("页码", min_value=1, max_value=pages, value=1, step=1,
+                                   key="completed_goals_page")
+            st.caption(f"共 {total} 个已完成目标，第 {page}/{pages} 页")
+        completed_goals = self.db.get_completed_goals(COMPLETED_PAGE_SIZE, (page - 1) * COMPLETED_PAGE_SIZE)
+        
+        for goal in completed_goals:
             with st.container():
                 col1, col2, col3 = st.columns([2, 1, 1])
                 
@@ -329,17 +406,15 @@ class GoalManager:
                 
                 st.markdown("---")
     
-    def _render_achievement_stats(self, completed_goals: List[Goal]):
+    def _render_achievement_stats(self, stats: Dict[str, Any]):
         """渲染成就统计"""
         col1, col2, col3, col4 = st.columns(4)
         
         # 按类别统计
-        category_counts = {}
-        for goal in completed_goals:
-            category_counts[goal.category] = category_counts.get(goal.category, 0) + 1
+        category_counts = stats['by_category']
         
         with col1:
-            st.metric("总完成数", len(completed_goals))
+            st.metric("总完成数", stats['by_status'].get('completed', 0))
         
         with col2:
             # 最多完成的类别
@@ -351,33 +426,19 @@ class GoalManager:
         
         with col3:
             # 本月完成数
-            month_start = datetime.utcnow().replace(day=1)
-            month_completed = len([g for g in completed_goals 
-                                 if g.completed_at and g.completed_at >= month_start])
-            st.metric("本月完成", month_completed)
+            st.metric("本月完成", stats['month_completed'])
         
         with col4:
             # 平均完成时间
-            if completed_goals:
-                avg_days = sum(
-                    (g.completed_at - g.created_at).days 
-                    for g in completed_goals if g.completed_at
-                ) / len(completed_goals)
-                st.metric("平均用时", f"{avg_days:.0f}天")
-            else:
-                st.metric("平均用时", "0天")
+            st.metric("平均用时", f"{stats['avg_days']:.0f}天")
     
     def _pause_goal(self, goal_id: int):
         """暂停目标"""
-        try:
-            goal = self.db.session.query(Goal).filter_by(id=goal_id).first()
-            if goal:
-                goal.status = 'paused'
-                self.db.session.commit()
-                st.success("目标已暂停")
-                st.rerun()
-        except Exception as e:
-            st.error(f"暂停失败: {e}")
+        if self.db.update_goal_status(goal_id, 'paused'):
+            st.success("目标已暂停")
+            st.rerun()
+        else:
+            st.error("暂停失败")
     
     def render_goal_quick_view(self):
         """渲染目标快速视图（用于仪表板）"""
@@ -387,12 +448,14 @@ class GoalManager:
             st.info("暂无活跃目标")
             return
         
-        # 显示最紧急的3个目标
-        urgent_goals = sorted(active_goals, key=lambda g: g.deadline)[:3]
+        # 显示最紧急的3个目标（活跃目标已按截止日期索引排序）
+        urgent_goals = active_goals[:3]
+        tz_name = self.db.get_user_timezone()
         
+        today = local_today(tz_name)
         for goal in urgent_goals:
-            progress = (goal.current_value / goal.target_value * 100) if goal.target_value > 0 else 0
-            days_left = (goal.deadline - datetime.utcnow()).days
+            progress = (current_progress(goal, today) / goal.target_value * 100) if goal.target_value > 0 else 0
+            days_left = days_until(goal.deadline, tz_name)
             
             with st.container():
                 st.write(f"**{goal.title}**")
@@ -407,21 +470,11 @@ class GoalManager:
                 st.markdown("---")
     
     def get_motivation_message(self) -> str:
-        """获取激励消息"""
+        """获取激励消息（活跃目标未变化时使用当日预计算的摘要）"""
         active_goals = self.db.get_active_goals()
+        tz_name = self.db.get_user_timezone()
         
-        if not active_goals:
-            return "🎯 设定一个新目标，开始你的成长之旅！"
-        
-        # 检查即将到期的目标
-        urgent_goals = [g for g in active_goals if (g.deadline - datetime.utcnow()).days <= 7]
-        if urgent_goals:
-            return f"⏰ 有 {len(urgent_goals)} 个目标即将到期，加油冲刺！"
-        
-        # 检查进度良好的目标
-        good_progress_goals = [g for g in active_goals 
-                              if (g.current_value / g.target_value * 100) >= 75]
-        if good_progress_goals:
-            return f"🚀 有 {len(good_progress_goals)} 个目标进展顺利，继续保持！"
-        
-        return "💪 每一步努力都在让你更接近目标，继续前进！"
+        stored = self.db.get_daily_digest(local_today(tz_name))
+        if stored is not None and stored.goals_key == goals_key(active_goals):
+            return stored.motivation
+        return motivation_message(active_goals, tz_name)
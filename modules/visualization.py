@@ -3,16 +3,45 @@
 """
 import plotly.graph_objects as go
 import plotly.express as px
+from plotly.subplots import make_subplots
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional
 import streamlit as st
 from core.database import HealthRecord
+from core.trends import records_to_arrays, linear_trend, rolling_mean, ewma, weekly_change, correlation
+from core.downsample import downsample_indices
+from core.bucketing import bucket_values, bucket_means, dates_to_days, record_dates, auto_freq
+from core.calendar_utils import DEFAULT_TIMEZONE, local_today, to_local_array
+from core.goal_metrics import current_progress
+from core.streaks import STREAK_LABELS, STREAK_TYPES
+
+FREQ_LABELS = {'D': '日', 'W': '周', 'M': '月'}
+# 指标卡片（统计字段名）及其对应的记录类型
+METRIC_CARDS = ('current_weight', 'today_exercises', 'week_exercises', 'latest_mood')
+METRIC_CARD_TYPES = {'weight': ('current_weight',), 'exercise': ('today_exercises', 'week_exercises'),
+                     'mood': ('latest_mood',)}
+# 组合图支持的指标及其纵轴标题（按子图自上而下的顺序）
+COMBINED_METRICS = {'weight': '体重 (kg)', 'exercise': '运动 (分钟)', 'mood': '心情 (1-10)'}
 
 class HealthVisualizer:
     """健康数据可视化类"""
     
-    def __init__(self):
+    # 各图表切换为WebGL渲染的点数阈值，以及柱状图改为按周分箱的柱数阈值
+    DEFAULT_WEBGL_THRESHOLDS = {'weight': 1000, 'mood': 1000}
+    DEFAULT_MAX_BARS = {'exercise': 90}
+    
+    def __init__(self, max_points: Optional[int] = 1500, downsample_mode: str = 'lttb',
+                 webgl_thresholds: Optional[Dict[str, int]] = None,
+                 max_bars: Optional[Dict[str, int]] = None, timezone: str = DEFAULT_TIMEZONE):
+        # 记录时间以UTC存储，绘图和按天分桶前转换到用户时区
+        self.timezone = timezone
+        # 每条轨迹的最大点数（None表示不降采样）及降采样模式（'lttb' 或 'minmax'）
+        self.max_points = max_points
+        self.downsample_mode = downsample_mode
+        self.webgl_thresholds = {**self.DEFAULT_WEBGL_THRESHOLDS, **(webgl_thresholds or {})}
+        self.max_bars = {**self.DEFAULT_MAX_BARS, **(max_bars or {})}
         self.colors = {
             'primary': '#1f77b4',
             'success': '#2ca02c',
@@ -23,48 +52,65 @@ class HealthVisualizer:
     
     def create_weight_trend_chart(self, weight_records: List[HealthRecord]) -> go.Figure:
         """创建体重变化趋势图"""
-        if not weight_records:
+        dates, weights = records_to_arrays(weight_records)
+        if len(weights) == 0:
             return self._empty_chart("暂无体重数据")
+        dates = to_local_array(dates, self.timezone)
         
-        # 准备数据
-        dates = [record.date.strftime('%Y-%m-%d') for record in weight_records]
-        weights = [record.numeric_value for record in weight_records]
+        # 平滑和趋势基于全部数据计算，绘图时只保留降采样后的点
+        idx = self._downsample_indices(dates, weights)
+        scatter = self._scatter_class('weight', len(idx))
         
         # 创建图表
         fig = go.Figure()
         
         # 添加折线图
-        fig.add_trace(go.Scatter(
-            x=dates,
-            y=weights,
-            mode='lines+markers',
+        fig.add_trace(scatter(
+            x=dates[idx],
+            y=weights[idx],
+            mode=self._line_mode(idx),
             name='体重 (kg)',
             line=dict(color=self.colors['primary'], width=3),
             marker=dict(size=8),
-            hovertemplate='日期: %{x}<br>体重: %{y:.1f} kg<extra></extra>'
+            hovertemplate='日期: %{x|%Y-%m-%d %H:%M}<br>体重: %{y:.1f} kg<extra></extra>'
         ))
         
-        # 添加趋势线
+        title = '体重变化趋势'
         if len(weights) > 1:
-            # 简单的线性趋势
-            from scipy import stats
-            import numpy as np
-            x_numeric = list(range(len(weights)))
-            slope, intercept, r_value, p_value, std_err = stats.linregress(x_numeric, weights)
-            trend_line = [slope * x + intercept for x in x_numeric]
+            # 7日滑动平均和指数平滑
+            fig.add_trace(scatter(
+                x=dates[idx],
+                y=rolling_mean(dates, weights, window_days=7)[idx],
+                mode='lines',
+                name='7日均值',
+                line=dict(color=self.colors['success'], width=2),
+                hovertemplate='7日均值: %{y:.1f} kg<extra></extra>'
+            ))
+            fig.add_trace(scatter(
+                x=dates[idx],
+                y=ewma(dates, weights, halflife_days=7)[idx],
+                mode='lines',
+                name='指数平滑',
+                line=dict(color=self.colors['info'], width=2),
+                visible='legendonly',
+                hovertemplate='指数平滑: %{y:.1f} kg<extra></extra>'
+            ))
             
+            # 基于真实日期的线性趋势，直线只需首尾两个点
+            trend = linear_trend(dates, weights)
             fig.add_trace(go.Scatter(
-                x=dates,
-                y=trend_line,
+                x=[dates[0], dates[-1]],
+                y=[trend['fitted'][0], trend['fitted'][-1]],
                 mode='lines',
                 name='趋势线',
                 line=dict(color=self.colors['warning'], width=2, dash='dash'),
                 hovertemplate='趋势: %{y:.1f} kg<extra></extra>'
             ))
+            title = f"体重变化趋势 (趋势: {weekly_change(trend):+.2f} kg/周)"
         
         # 设置布局
         fig.update_layout(
-            title='体重变化趋势',
+            title=title,
             xaxis_title='日期',
             yaxis_title='体重 (kg)',
             hovermode='x unified',
@@ -74,34 +120,36 @@ class HealthVisualizer:
         
         return fig
     
-    def create_exercise_frequency_chart(self, exercise_records: List[HealthRecord]) -> go.Figure:
-        """创建运动频率图表"""
+    def create_exercise_frequency_chart(self, exercise_records: List[HealthRecord],
+                                        freq: Optional[str] = None) -> go.Figure:
+        """创建运动频率图表
+        
+        freq为 'D'（按日）、'W'（按周）或 'M'（按月）；未指定时按柱数上限自动选择，
+        没有运动的日期补0。
+        """
         if not exercise_records:
             return self._empty_chart("暂无运动数据")
         
-        # 按日期统计运动次数
-        exercise_by_date = {}
-        for record in exercise_records:
-            date_str = record.date.strftime('%Y-%m-%d')
-            exercise_by_date[date_str] = exercise_by_date.get(date_str, 0) + 1
-        
-        dates = list(exercise_by_date.keys())
-        frequencies = list(exercise_by_date.values())
+        days = dates_to_days(to_local_array(record_dates(exercise_records), self.timezone))
+        start, end = days.min(), days.max()
+        freq = freq or auto_freq(start, end, self.max_bars['exercise'])
+        bucket_starts, counts = bucket_values(days, start, end, freq)
+        period = FREQ_LABELS[freq]
         
         # 创建柱状图
         fig = go.Figure()
         
         fig.add_trace(go.Bar(
-            x=dates,
-            y=frequencies,
+            x=bucket_starts.astype(str),
+            y=counts,
             name='运动次数',
             marker_color=self.colors['success'],
-            hovertemplate='日期: %{x}<br>运动次数: %{y}<extra></extra>'
+            hovertemplate=f'{period}: %{{x}}<br>运动次数: %{{y}}<extra></extra>'
         ))
         
         # 设置布局
         fig.update_layout(
-            title='运动频率统计',
+            title='运动频率统计' if freq == 'D' else f'运动频率统计 (按{period})',
             xaxis_title='日期',
             yaxis_title='运动次数',
             showlegend=False,
@@ -112,37 +160,37 @@ class HealthVisualizer:
     
     def create_mood_trend_chart(self, mood_records: List[HealthRecord]) -> go.Figure:
         """创建心情趋势图"""
-        if not mood_records:
+        dates, moods = records_to_arrays(mood_records)
+        if len(moods) == 0:
             return self._empty_chart("暂无心情数据")
-        
-        dates = [record.date.strftime('%Y-%m-%d') for record in mood_records]
-        moods = [record.numeric_value for record in mood_records]
+        dates = to_local_array(dates, self.timezone)
+        idx = self._downsample_indices(dates, moods)
+        scatter = self._scatter_class('mood', len(idx))
         
         # 创建图表
         fig = go.Figure()
         
         # 添加填充区域图
-        fig.add_trace(go.Scatter(
-            x=dates,
-            y=moods,
-            mode='lines+markers',
+        fig.add_trace(scatter(
+            x=dates[idx],
+            y=moods[idx],
+            mode=self._line_mode(idx),
             name='心情指数',
             line=dict(color=self.colors['info'], width=3),
             marker=dict(size=8),
             fill='tonexty',
             fillcolor='rgba(23, 190, 207, 0.1)',
-            hovertemplate='日期: %{x}<br>心情: %{y}/10<extra></extra>'
+            hovertemplate='日期: %{x|%Y-%m-%d %H:%M}<br>心情: %{y}/10<extra></extra>'
         ))
         
-        # 添加平均线
-        if moods:
-            avg_mood = sum(moods) / len(moods)
-            fig.add_hline(
-                y=avg_mood,
-                line_dash="dash",
-                line_color=self.colors['warning'],
-                annotation_text=f"平均: {avg_mood:.1f}"
-            )
+        # 添加平均线（基于全部数据）
+        avg_mood = float(moods.mean())
+        fig.add_hline(
+            y=avg_mood,
+            line_dash="dash",
+            line_color=self.colors['warning'],
+            annotation_text=f"平均: {avg_mood:.1f}"
+        )
         
         # 设置布局
         fig.update_layout(
@@ -156,10 +204,129 @@ class HealthVisualizer:
         
         return fig
     
-    def create_goal_progress_chart(self, goals: List) -> go.Figure:
-        """创建目标进度图表"""
+    def create_combined_chart(self, records_by_type: Dict[str, List[HealthRecord]],
+                              record_types: Optional[List[str]] = None) -> go.Figure:
+        """创建多指标组合图
+        
+        左侧为共享时间轴的子图（缩放和平移联动），同时选择心情和运动时在右侧
+        显示每日平均心情与当日运动分钟数的相关性面板。
+        """
+        record_types = [t for t in (record_types or COMBINED_METRICS) if t in COMBINED_METRICS]
+        if not any(records_by_type.get(t) for t in record_types):
+            return self._empty_chart("暂无数据")
+        
+        n_rows = len(record_types)
+        show_correlation = 'mood' in record_types and 'exercise' in record_types
+        titles = []
+        if show_correlation:
+            specs = [[{}, {'rowspan': n_rows}]] + [[{}, None] for _ in range(n_rows - 1)]
+            titles = [COMBINED_METRICS[record_types[0]], '心情 vs 运动时长'] + \
+                     [COMBINED_METRICS[t] for t in record_types[1:]]
+            fig = make_subplots(rows=n_rows, cols=2, specs=specs, column_widths=[0.7, 0.3],
+                                shared_xaxes=True, vertical_spacing=0.06, horizontal_spacing=0.08,
+                                subplot_titles=titles)
+        else:
+            fig = make_subplots(rows=n_rows, cols=1, shared_xaxes=True, vertical_spacing=0.06,
+                                subplot_titles=[COMBINED_METRICS[t] for t in record_types])
+        
+        for row, record_type in enumerate(record_types, start=1):
+            records = records_by_type.get(record_type) or []
+            if record_type == 'exercise':
+                self._add_exercise_minutes_trace(fig, records, row)
+            else:
+                self._add_metric_line_trace(fig, records, record_type, row)
+            fig.update_yaxes(title_text=COMBINED_METRICS[record_type], row=row, col=1)
+        
+        if show_correlation:
+            self._add_correlation_panel(fig, records_by_type.get('mood') or [],
+                                        records_by_type.get('exercise') or [])
+        
+        fig.update_layout(
+            title='健康指标综合视图',
+            hovermode='x',
+            showlegend=False,
+            height=max(400, 260 * n_rows)
+        )
+        return fig
+    
+    def _add_metric_line_trace(self, fig: go.Figure, records: List[HealthRecord], record_type: str, row: int):
+        """组合图中的数值折线子图（体重、心情）"""
+        dates, values = records_to_arrays(records)
+        if len(values) == 0:
+            return
+        dates = to_local_array(dates, self.timezone)
+        idx = self._downsample_indices(dates, values)
+        scatter = self._scatter_class(record_type, len(idx))
+        color = self.colors['primary'] if record_type == 'weight' else self.colors['info']
+        fig.add_trace(scatter(
+            x=dates[idx],
+            y=values[idx],
+            mode=self._line_mode(idx),
+            name=COMBINED_METRICS[record_type],
+            line=dict(color=color, width=2),
+            hovertemplate='%{x|%Y-%m-%d %H:%M}<br>%{y:.1f}<extra></extra>'
+        ), row=row, col=1)
+    
+    def _add_exercise_minutes_trace(self, fig: go.Figure, records: List[HealthRecord], row: int):
+        """组合图中的运动时长柱状子图（时间跨度较长时按周/月汇总）"""
+        if not records:
+            return
+        days = self._local_days(records)
+        minutes = np.array([r.numeric_value or 0 for r in records], dtype=float)
+        start, end = days.min(), days.max()
+        freq = auto_freq(start, end, self.max_bars['exercise'])
+        bucket_starts, totals = bucket_values(days, start, end, freq, weights=minutes)
+        fig.add_trace(go.Bar(
+            x=bucket_starts,
+            y=totals,
+            name='运动分钟',
+            marker_color=self.colors['success'],
+            hovertemplate=f'{FREQ_LABELS[freq]}: %{{x|%Y-%m-%d}}<br>运动: %{{y:.0f}}分钟<extra></extra>'
+        ), row=row, col=1)
+    
+    def _add_correlation_panel(self, fig: go.Figure, mood_records: List[HealthRecord],
+                               exercise_records: List[HealthRecord]):
+        """按本地自然日配对每日平均心情和运动分钟数（无运动记为0），计算相关系数"""
+        result = {'r': None, 'n': 0}
+        # 心情记录可能都没有数值（records_to_arrays 会将其忽略）
+        mood_dates, moods = records_to_arrays(mood_records)
+        if len(moods):
+            mood_days = dates_to_days(to_local_array(mood_dates, self.timezone))
+            exercise_days = self._local_days(exercise_records)
+            start = mood_days.min() if not len(exercise_days) else min(mood_days.min(), exercise_days.min())
+            end = mood_days.max() if not len(exercise_days) else max(mood_days.max(), exercise_days.max())
+            
+            _, daily_mood = bucket_means(mood_days, moods, start, end)
+            minutes = np.array([r.numeric_value or 0 for r in exercise_records], dtype=float)
+            _, daily_minutes = bucket_values(exercise_days, start, end, 'D', weights=minutes)
+            has_mood = ~np.isnan(daily_mood)
+            result = correlation(daily_minutes, daily_mood)
+            
+            fig.add_trace(go.Scatter(
+                x=daily_minutes[has_mood],
+                y=daily_mood[has_mood],
+                mode='markers',
+                name='每日心情',
+                marker=dict(color=self.colors['warning'], size=7, opacity=0.7),
+                hovertemplate='运动: %{x:.0f}分钟<br>平均心情: %{y:.1f}<extra></extra>'
+            ), row=1, col=2)
+        
+        label = f"r = {result['r']:.2f} (n={result['n']}天)" if result['r'] is not None else "数据不足"
+        # 相关性面板是第二个创建的子图，对应坐标轴 x2/y2
+        fig.add_annotation(text=label, xref='x2 domain', yref='y2 domain', x=0.02, y=0.98,
+                           xanchor='left', yanchor='top', showarrow=False)
+        fig.update_xaxes(title_text='运动分钟/天', row=1, col=2)
+        fig.update_yaxes(title_text='平均心情', range=[0, 10.5], row=1, col=2)
+    
+    def _local_days(self, records: List[HealthRecord]) -> np.ndarray:
+        """记录所在的本地自然日 (datetime64[D])"""
+        return dates_to_days(to_local_array(record_dates(records), self.timezone))
+    
+    def create_goal_progress_chart(self, goals: List, today: Optional[date] = None) -> go.Figure:
+        """创建目标进度图表（today 为用户本地日期，默认按图表时区计算）"""
         if not goals:
             return self._empty_chart("暂无目标数据")
+        today = today or local_today(self.timezone)
         
         goal_names = []
         progress_percentages = []
@@ -167,7 +334,7 @@ class HealthVisualizer:
         
         for goal in goals:
             goal_names.append(goal.title)
-            progress = (goal.current_value / goal.target_value * 100) if goal.target_value > 0 else 0
+            progress = (current_progress(goal, today) / goal.target_value * 100) if goal.target_value > 0 else 0
             progress_percentages.append(min(progress, 100))  # 限制在100%
             
             # 根据进度设置颜色
@@ -203,20 +370,68 @@ class HealthVisualizer:
         
         return fig
     
+    def create_goal_history_chart(self, series: Optional[pd.DataFrame], goal: Any,
+                                  projected: Optional[datetime] = None) -> go.Figure:
+        """创建单个目标的进度历史图（阶梯线，附目标线和预计完成的虚线）
+        
+        Args:
+            series: 进度时间序列（UTC时间索引，value列），来自 get_goal_progress_series 或
+                split_goal_progress_events；None表示没有历史
+            projected: 预计完成时间（UTC），有预测时从最后一个点连到目标值
+        """
+        if series is None or series.empty:
+            return self._empty_chart("暂无进度历史")
+        dates = to_local_array(series.index.to_numpy(), self.timezone)
+        values = series['value'].to_numpy()
+        
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=dates,
+            y=values,
+            mode='lines+markers',
+            line_shape='hv',
+            name='进度',
+            line=dict(color=self.colors['primary'], width=3),
+            hovertemplate=f'日期: %{{x|%Y-%m-%d %H:%M}}<br>进度: %{{y:.1f}} {goal.unit}<extra></extra>'
+        ))
+        if projected is not None and values[-1] < goal.target_value:
+            fig.add_trace(go.Scatter(
+                x=[dates[-1], to_local_array([projected], self.timezone)[0]],
+                y=[values[-1], goal.target_value],
+                mode='lines',
+                name='预计',
+                line=dict(color=self.colors['info'], dash='dot'),
+                hovertemplate='预计完成: %{x|%Y-%m-%d}<extra></extra>'
+            ))
+        fig.add_hline(
+            y=goal.target_value,
+            line_dash="dash",
+            line_color=self.colors['success'],
+            annotation_text=f"目标: {goal.target_value:g} {goal.unit}"
+        )
+        
+        fig.update_layout(
+            title=f'{goal.title} - 进度历史',
+            xaxis_title='日期',
+            yaxis_title=f'进度 ({goal.unit})',
+            showlegend=False,
+            height=300
+        )
+        
+        return fig
+    
     def create_weekly_summary_chart(self, records: List[HealthRecord]) -> go.Figure:
         """创建周度总结图表"""
-        # 准备一周的数据
-        today = datetime.now()
-        week_dates = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
-        week_labels = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+        # 准备最近7个本地自然日的数据
+        today = local_today(self.timezone)
+        week_start = today - timedelta(days=6)
+        exercise_records = [r for r in records if r.record_type == 'exercise']
         
         # 统计每天的运动次数
-        exercise_counts = []
-        for date_str in week_dates:
-            count = sum(1 for r in records if 
-                       r.record_type == 'exercise' and 
-                       r.date.strftime('%Y-%m-%d') == date_str)
-            exercise_counts.append(count)
+        local_dates = to_local_array(record_dates(exercise_records), self.timezone)
+        week_days, exercise_counts = bucket_values(local_dates, week_start, today, 'D')
+        weekday_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+        week_labels = [weekday_names[d.weekday()] for d in week_days.tolist()]
         
         # 创建图表
         fig = go.Figure()
@@ -241,6 +456,21 @@ class HealthVisualizer:
         
         return fig
     
+    def _downsample_indices(self, dates, values):
+        """按配置的点数上限计算降采样下标"""
+        return downsample_indices(dates, values, self.max_points, self.downsample_mode)
+    
+    def _scatter_class(self, chart: str, n_points: int):
+        """点数超过该图表的阈值时使用WebGL渲染（Scattergl），否则使用SVG（Scatter）"""
+        threshold = self.webgl_thresholds.get(chart)
+        if threshold is not None and n_points > threshold:
+            return go.Scattergl
+        return go.Scatter
+    
+    def _line_mode(self, idx) -> str:
+        """点数较多时只画线，避免标记重叠"""
+        return 'lines+markers' if len(idx) <= 200 else 'lines'
+    
     def _empty_chart(self, message: str) -> go.Figure:
         """创建空数据图表"""
         fig = go.Figure()
@@ -265,9 +495,28 @@ class HealthVisualizer:
     
     def display_metric_cards(self, stats: Dict[str, Any]):
         """显示指标卡片"""
-        col1, col2, col3, col4 = st.columns(4)
+        columns = st.columns(len(METRIC_CARDS))
+        
+        for column, card in zip(columns, METRIC_CARDS):
+            with column:
+                self.display_metric_card(card, stats)
+    
+    def display_streaks(self, streaks: Dict[str, Dict[str, Any]]):
+        """显示连续打卡卡片（当前连续天数，附最长纪录）"""
+        columns = st.columns(len(STREAK_TYPES))
         
-        with col1:
+        for column, record_type in zip(columns, STREAK_TYPES):
+            streak = streaks.get(record_type, {})
+            with column:
+                st.metric(
+                    STREAK_LABELS[record_type],
+                    f"{streak.get('current', 0)} 天",
+                    help=f"最长纪录: {streak.get('longest', 0)} 天"
+                )
+    
+    def display_metric_card(self, card: str, stats: Dict[str, Any]):
+        """显示单个指标卡片（card为 METRIC_CARDS 中的统计字段名）"""
+        if card == 'current_weight':
             weight_delta = None
             if stats.get('current_weight', 0) > 0:
                 st.metric(
@@ -278,7 +527,7 @@ class HealthVisualizer:
             else:
                 st.metric("当前体重", "未记录", delta=None)
         
-        with col2:
+        elif card == 'today_exercises':
             today_ex = stats.get('today_exercises', 0)
             st.metric(
                 "今日运动", 
@@ -286,7 +535,7 @@ class HealthVisualizer:
                 delta=f"+{today_ex}" if today_ex > 0 else None
             )
         
-        with col3:
+        elif card == 'week_exercises':
             week_ex = stats.get('week_exercises', 0)
             st.metric(
                 "本周运动", 
@@ -294,7 +543,7 @@ class HealthVisualizer:
                 delta=f"目标: 3-5次"
             )
         
-        with col4:
+        elif card == 'latest_mood':
             mood = stats.get('latest_mood', 5)
             mood_emoji = self._get_mood_emoji(mood)
             st.metric(
@@ -18,6 +18,7 @@ def test_tools():
         fitness_planner = FitnessPlanner()
         
         user_data = {
+            "user_id": 1,
             "primary_goal": "weight loss",
             "activity_level": "beginner",
             "workout_preferences": ["cardio", "strength"],
@@ -40,7 +41,7 @@ def test_tools():
         print("\n3. 测试心理健康教练...")
         wellness_coach = MentalWellnessCoach()
         
-        wellness_advice = wellness_coach.generate_wellness_advice()
+        wellness_advice = wellness_coach.generate_wellness_advice({"user_id": 1})
         print("✅ 心理健康建议生成成功")
         print(wellness_advice[:200] + "...")
         
@@ -105,7 +106,7 @@ def test_basic_functionality():
     ]
     
     for i, test_case in enumerate(test_cases, 1):
-        plan = planner.generate_workout_plan(test_case)
+        plan = planner.generate_workout_plan(test_case, seed=i)
         assert len(plan) > 100  # 确保计划有足够内容
         print(f"✅ 测试案例 {i} 通过")
     
@@ -113,6 +114,1300 @@ def test_basic_functionality():
     return True
 
 
+def test_plan_determinism():
+    """测试计划生成的确定性与缓存"""
+    print("🎲 测试计划确定性...")
+    
+    from datetime import date
+    from tools import FitnessPlanner, MentalWellnessCoach, derive_plan_seed
+    
+    user_data = {"user_id": 7, "primary_goal": "General Fitness", "workout_preferences": ["cardio", "strength"]}
+    
+    # 不经过缓存：每次生成前清空
+    FitnessPlanner.plan_cache.clear()
+    plan_a = FitnessPlanner().generate_workout_plan(user_data, seed=42)
+    FitnessPlanner.plan_cache.clear()
+    assert FitnessPlanner().generate_workout_plan(dict(user_data), seed=42) == plan_a
+    assert FitnessPlanner.plan_cache.hits == 0
+    print("✅ 相同数据和种子重新生成的健身计划一致")
+    
+    # 未指定种子时由 user_id 和日期派生，不同用户的种子不同
+    FitnessPlanner.plan_cache.clear()
+    assert FitnessPlanner().generate_workout_plan(user_data) == \
+        FitnessPlanner().generate_workout_plan(user_data, seed=derive_plan_seed(7))
+    assert derive_plan_seed(7, date(2024, 1, 1)) != derive_plan_seed(8, date(2024, 1, 1))
+    try:
+        FitnessPlanner().generate_workout_plan({"primary_goal": "General Fitness"})
+        assert False, "缺少 user_id 和种子时应报错"
+    except ValueError:
+        pass
+    print("✅ 默认种子按用户派生，缺少用户ID和种子时拒绝生成")
+    
+    # 缓存键为规范JSON：键顺序不同命中同一条目，值不同（大小写、列表顺序）不共享
+    FitnessPlanner.plan_cache.clear()
+    planner = FitnessPlanner()
+    planner.build_workout_plan(user_data, seed=42)
+    planner.build_workout_plan(dict(reversed(list(user_data.items()))), seed=42)
+    assert FitnessPlanner.plan_cache.hits == 1
+    planner.build_workout_plan({**user_data, "primary_goal": " general fitness "}, seed=42)
+    planner.build_workout_plan({**user_data, "workout_preferences": ["strength", "cardio"]}, seed=42)
+    assert FitnessPlanner.plan_cache.hits == 1 and len(FitnessPlanner.plan_cache) == 3
+    print("✅ 缓存按规范JSON区分用户数据")
+    
+    coach = MentalWellnessCoach()
+    assert coach.generate_wellness_advice(seed=3) == coach.generate_wellness_advice(seed=3)
+    print("✅ 心理健康建议可复现")
+    
+    return True
+
+
+def test_nutrition_engine():
+    """测试热量计算与餐食计划"""
+    print("🍎 测试营养计算...")
+    
+    from core.nutrition import calculate_bmr, macro_targets, MealPlanEngine
+    
+    # Mifflin-St Jeor: 10*70 + 6.25*175 - 5*30 + 5
+    assert abs(calculate_bmr(70, 175, 30, "男") - 1648.75) < 1e-6
+    assert abs(calculate_bmr(70, 175, 30, "女") - 1482.75) < 1e-6
+    print("✅ 基础代谢计算正确")
+    
+    profile = {"primary_goal": "weight loss", "age": 30, "gender": "女",
+               "height": 162, "weight": 60, "activity_level": "中度活跃"}
+    targets = macro_targets(profile)
+    assert targets["calories"] < targets["tdee"]
+    
+    plan = MealPlanEngine().plan(profile, days=7)
+    assert len(plan["days"]) == 7
+    for day in plan["days"]:
+        # 每日热量应接近目标（误差不超过15%）
+        assert abs(day["totals"]["calories"] - targets["calories"]) / targets["calories"] < 0.15
+    print("✅ 一周餐食计划满足热量目标")
+    
+    vegan_plan = MealPlanEngine().plan(profile, days=3, dietary_preferences="纯素")
+    vegan_foods = {item["name"] for day in vegan_plan["days"] for meal in day["meals"] for item in meal["items"]}
+    assert not vegan_foods & {"鸡胸肉", "三文鱼", "牛奶", "鸡蛋"}
+    print("✅ 饮食偏好过滤生效")
+    
+    # 工具调用的自由文本数值取其中的数字，无法解析时使用默认值
+    from tools import NutritionPlanner
+    text_profile = {**profile, "weight": "60kg", "height": "162 cm", "age": "30岁"}
+    assert macro_targets(text_profile) == targets
+    assert macro_targets({**profile, "weight": "不知道"}) == macro_targets({**profile, "weight": None})
+    plan = NutritionPlanner().build_nutrition_plan({**text_profile, "plan_days": "3天"})
+    assert plan.targets.calories == targets["calories"] and len(plan.days) == 3
+    print("✅ 文本形式的身体数据按数字解析")
+    
+    return True
+
+
+def test_structured_plans():
+    """测试结构化计划的序列化与比较"""
+    print("🧩 测试结构化计划...")
+    
+    import json
+    from tools import FitnessPlanner
+    from core.plans import PlanBase, WorkoutPlan
+    
+    planner = FitnessPlanner()
+    plan = planner.build_workout_plan({"primary_goal": "weight loss"}, seed=1)
+    
+    # Markdown与紧凑JSON都来自同一对象
+    assert planner.generate_workout_plan({"primary_goal": "weight loss"}, seed=1) == plan.to_markdown()
+    compact = plan.to_compact_json()
+    assert json.loads(compact)["focus"] == "weight_loss"
+    assert len(compact) < len(plan.to_markdown())
+    print("✅ Markdown渲染和紧凑序列化正常")
+    
+    restored = WorkoutPlan.model_validate_json(plan.model_dump_json())
+    assert restored.fingerprint() == plan.fingerprint()
+    
+    other = planner.build_workout_plan({"primary_goal": "weight loss", "workout_duration": 60}, seed=1)
+    assert other.diff(plan) == ["duration_minutes"]
+    print("✅ 计划指纹与差异比较正常")
+    
+    for duration, text in [(45.5, "45.5分钟"), ("45", "45分钟"), ("45分钟", "45分钟"), ("半小时", "45分钟")]:
+        flexible = planner.build_workout_plan({"primary_goal": "weight loss", "workout_duration": duration}, seed=1)
+        assert text in flexible.to_markdown()
+    try:
+        PlanBase(kind="workout")
+        assert False, "计划基类不应能实例化"
+    except TypeError:
+        pass
+    print("✅ 时长接受小数和文本（无法解析时为45分钟），基类方法为抽象方法")
+    
+    return True
+
+
+def test_batch_plans():
+    """测试批量计划生成的输出顺序和命令行入口"""
+    print("📦 测试批量计划...")
+    
+    import io
+    import json
+    import subprocess
+    import tempfile
+    from datetime import date
+    from batch_plans import generate_plans_batch, _iter_json_array, _read_profiles
+    from tools import derive_plan_seed
+    
+    day = date(2024, 3, 1)
+    profiles = [{"user_id": i, "primary_goal": "weight loss" if i % 2 else "muscle gain"} for i in range(1, 8)]
+    profiles.insert(3, {"primary_goal": "general fitness"})
+    
+    serial = list(generate_plans_batch(profiles, workers=0, chunksize=3, day=day))
+    assert [plan["user_id"] for plan in serial] == [p.get("user_id") for p in profiles]
+    assert serial[0]["seed"] == derive_plan_seed(1, day)
+    assert "error" in serial[3] and "workout" not in serial[3]
+    assert serial[1]["workout"]["focus"] == "muscle_gain"
+    print("✅ 按输入顺序生成计划，缺少用户ID的条目单独报错")
+    
+    parallel = list(generate_plans_batch(iter(profiles), workers=2, chunksize=1, day=day))
+    assert parallel == serial
+    print("✅ 进程池输出与顺序生成一致")
+    
+    text = json.dumps(profiles, ensure_ascii=False, indent=1)
+    assert list(_iter_json_array(io.StringIO(text[1:]), block_size=7)) == profiles
+    print("✅ JSON数组逐条解析")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        array_path, lines_path = os.path.join(tmp, "in.json"), os.path.join(tmp, "in.jsonl")
+        with open(array_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        with open(lines_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(json.dumps(p, ensure_ascii=False) for p in profiles) + "\n")
+        assert list(_read_profiles(array_path)) == list(_read_profiles(lines_path)) == profiles
+        
+        out_path = os.path.join(tmp, "out.jsonl")
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch_plans.py")
+        subprocess.run([sys.executable, script, array_path, "-o", out_path, "--workers", "0"],
+                       check=True, capture_output=True)
+        with open(out_path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+    assert [plan["user_id"] for plan in lines] == [p.get("user_id") for p in profiles]
+    assert lines[0]["seed"] == derive_plan_seed(1, date.today())
+    print("✅ 命令行输出JSON Lines")
+    
+    return True
+
+
+def test_trends():
+    """测试趋势、滑动平均、指数平滑和相关系数（与NumPy/pandas的参考实现对比）"""
+    print("📈 测试趋势计算...")
+    
+    import numpy as np
+    import pandas as pd
+    from core.trends import linear_trend, rolling_mean, ewma, correlation
+    
+    # 间隔不均匀的时间戳（含小时）
+    dates = np.array(["2024-01-01T08:00", "2024-01-02T20:00", "2024-01-04T08:00", "2024-01-09T12:00",
+                      "2024-01-10T07:30", "2024-01-15T21:00"], dtype="datetime64[s]")
+    values = np.array([70.0, 69.8, 70.1, 69.2, 69.5, 68.7])
+    days = (dates - dates[0]).astype(np.int64) / 86400.0
+    
+    trend = linear_trend(dates, values)
+    slope, intercept = np.polyfit(days, values, 1)
+    assert abs(trend["slope_per_day"] - slope) < 1e-9 and abs(trend["intercept"] - intercept) < 1e-9
+    assert np.allclose(trend["fitted"], np.polyval([slope, intercept], days))
+    assert linear_trend(dates[:1], values[:1])["slope_per_day"] == 0.0
+    print("✅ 线性趋势与 np.polyfit 一致")
+    
+    series = pd.Series(values, index=pd.DatetimeIndex(dates))
+    assert np.allclose(rolling_mean(dates, values, window_days=3), series.rolling("3D").mean().to_numpy())
+    assert np.allclose(rolling_mean(dates, values, window_days=7), series.rolling("7D").mean().to_numpy())
+    print("✅ 滑动平均与 pandas rolling 一致")
+    
+    # 按真实时间衰减的权重: 0.5 ** (间隔天数 / 半衰期)
+    expected = [np.average(values[:i + 1], weights=0.5 ** ((days[i] - days[:i + 1]) / 2)) for i in range(len(values))]
+    assert np.allclose(ewma(dates, values, halflife_days=2), expected)
+    assert np.allclose(ewma(dates, values, halflife_days=2),
+                       series.reset_index(drop=True).ewm(halflife=pd.Timedelta(days=2), times=pd.DatetimeIndex(dates)).mean())
+    print("✅ 指数平滑按真实时间间隔衰减")
+    
+    x = [0, 15, 30, np.nan, 45, 60]
+    y = [5.0, 6.0, 5.5, 8.0, np.nan, 7.5]
+    result = correlation(x, y)
+    assert result["n"] == 4
+    assert abs(result["r"] - pd.Series(x).corr(pd.Series(y))) < 1e-12
+    assert correlation([1, 2, 3], [4, 4, 4])["r"] is None  # 方差为0
+    print("✅ 相关系数与 pandas corr 一致")
+    
+    return True
+
+
+def test_downsample():
+    """测试LTTB和最小/最大值降采样"""
+    print("📉 测试降采样...")
+    
+    import numpy as np
+    from core.downsample import lttb_indices, minmax_indices, downsample_indices, downsample
+    
+    rng = np.random.default_rng(0)
+    n = 5000
+    x = np.datetime64("2024-01-01T00:00") + np.arange(n) * np.timedelta64(17, "m")
+    y = np.sin(np.arange(n) / 300) * 5 + rng.normal(0, 0.3, n) + 70
+    y[1234], y[3210] = 90.0, 50.0  # 孤立的尖峰
+    
+    for threshold in (3, 50, 400):
+        idx = lttb_indices(x, y, threshold)
+        assert len(idx) == threshold
+        assert idx[0] == 0 and idx[-1] == n - 1
+        assert np.all(np.diff(idx) > 0)
+    assert {1234, 3210} <= set(lttb_indices(x, y, 400).tolist())
+    print("✅ LTTB输出点数等于阈值，保留首尾点和尖峰")
+    
+    idx = minmax_indices(y, 100)
+    assert len(idx) <= 100 and idx[0] == 0 and idx[-1] == n - 1
+    assert np.all(np.diff(idx) > 0)
+    kept = set(idx.tolist())
+    assert {1234, 3210} <= kept
+    # 每个区间的局部最小值和最大值都被保留
+    buckets = (100 - 2) // 2
+    bucket_ids = (np.arange(n) * buckets) // n
+    for b in range(buckets):
+        members = np.flatnonzero(bucket_ids == b)
+        assert members[np.argmin(y[members])] in kept and members[np.argmax(y[members])] in kept
+    print("✅ 最小/最大值降采样保留各区间的局部极值")
+    
+    assert len(downsample_indices(x, y, n)) == n
+    assert len(downsample_indices(x, y, None)) == n
+    dx, dy = downsample(x, y, 300, mode="minmax")
+    assert len(dx) == len(dy) <= 300 and dy.max() == 90.0 and dy.min() == 50.0
+    try:
+        downsample_indices(x, y, 100, mode="median")
+        assert False, "未知模式应报错"
+    except ValueError:
+        pass
+    print("✅ 未超过上限时不降采样，未知模式报错")
+    
+    return True
+
+
+def test_webgl_switch():
+    """测试点数超过阈值时散点轨迹切换为WebGL"""
+    print("🖥️ 测试WebGL切换...")
+    
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    from modules.visualization import HealthVisualizer
+    
+    def records(n):
+        start = datetime(2024, 1, 1)
+        return [SimpleNamespace(date=start + timedelta(hours=6 * i), numeric_value=70 + (i % 5) * 0.1)
+                for i in range(n)]
+    
+    visualizer = HealthVisualizer(max_points=None, webgl_thresholds={'weight': 50, 'mood': 50})
+    for n, trace_type in [(50, 'scatter'), (51, 'scattergl')]:
+        assert visualizer.create_weight_trend_chart(records(n)).data[0].type == trace_type
+        assert visualizer.create_mood_trend_chart(records(n)).data[0].type == trace_type
+    print("✅ 阈值以内使用Scatter，超过阈值使用Scattergl")
+    
+    # 阈值按降采样后的点数判断
+    downsampled = HealthVisualizer(max_points=40, webgl_thresholds={'weight': 50})
+    assert downsampled.create_weight_trend_chart(records(500)).data[0].type == 'scatter'
+    print("✅ 降采样后点数未超过阈值时保持SVG渲染")
+    
+    return True
+
+
+def test_bucketing():
+    """测试按日/周/月分桶"""
+    print("🗓️ 测试时间分桶...")
+    
+    import numpy as np
+    from datetime import datetime
+    from core.bucketing import bucket_values
+    
+    dates = [datetime(2025, 3, 3, 8), datetime(2025, 3, 3, 20), datetime(2025, 3, 5, 7),
+             datetime(2025, 3, 10, 9), datetime(2025, 4, 1, 12)]
+    
+    days, counts = bucket_values(dates, "2025-03-03", "2025-03-06", "D")
+    assert counts.tolist() == [2, 0, 1, 0]
+    print("✅ 按日统计并补齐空日期")
+    
+    weeks, counts = bucket_values(dates, "2025-03-04", "2025-03-12", "W")
+    assert weeks.astype(str).tolist() == ["2025-03-03", "2025-03-10"]  # 周一开始
+    assert counts.tolist() == [3, 1]
+    
+    months, minutes = bucket_values(dates, "2025-03-01", "2025-04-30", "M", weights=np.full(5, 30.0))
+    assert minutes.tolist() == [120.0, 30.0]
+    print("✅ 按周/月分桶和加权求和正确")
+    
+    return True
+
+
+def test_timezone_boundaries():
+    """测试按用户时区计算自然日边界"""
+    print("🌏 测试时区边界...")
+    
+    from datetime import datetime
+    from core.calendar_utils import period_bounds_utc, last_n_days_bounds_utc
+    from core.database import DatabaseManager, HealthRecord
+    
+    # UTC 2025-03-02 20:00 是北京时间 3月3日（周一）04:00
+    now = datetime(2025, 3, 2, 20, 0)
+    assert period_bounds_utc("Asia/Shanghai", "day", now) == (datetime(2025, 3, 2, 16), datetime(2025, 3, 3, 16))
+    assert period_bounds_utc("Asia/Shanghai", "week", now)[0] == datetime(2025, 3, 2, 16)
+    assert period_bounds_utc("UTC", "month", now) == (datetime(2025, 3, 1), datetime(2025, 4, 1))
+    assert last_n_days_bounds_utc("Asia/Shanghai", 7, now)[0] == datetime(2025, 2, 24, 16)
+    print("✅ 日/周/月边界换算为UTC正确")
+    
+    db = DatabaseManager(":memory:")
+    assert db.get_user_timezone() == "Asia/Shanghai"
+    start, end = period_bounds_utc("Asia/Shanghai", "day", now)
+    db.session.add_all([
+        HealthRecord(record_type='exercise', value='跑步', numeric_value=30, date=datetime(2025, 3, 2, 15, 59)),
+        HealthRecord(record_type='exercise', value='跑步', numeric_value=30, date=datetime(2025, 3, 2, 16, 1)),
+    ])
+    db.session.commit()
+    assert db.count_records_between('exercise', start, end) == 1
+    db.update_user_profile({'timezone': 'UTC'})
+    assert db.get_user_timezone() == "UTC"
+    db.close()
+    print("✅ 按本地自然日统计记录正确")
+    
+    return True
+
+
+def test_combined_chart():
+    """测试多指标组合图和相关性计算"""
+    print("🔗 测试组合图...")
+    
+    import numpy as np
+    from core.trends import correlation
+    from core.database import DatabaseManager
+    from modules.visualization import HealthVisualizer
+    
+    assert abs(correlation([0, 30, 60, 90], [4, 6, 7, np.nan])["r"] - 0.9820) < 1e-3
+    assert correlation([1, 2], [3, 4])["r"] is None  # 样本不足
+    print("✅ 相关系数计算正确（忽略缺失日期）")
+    
+    db = DatabaseManager(":memory:")
+    for minutes, mood in [(20, 5), (40, 6), (60, 8)]:
+        db.add_health_record('exercise', f"跑步 {minutes}分钟", minutes)
+        db.add_health_record('mood', f"心情: {mood}/10", mood)
+    records = db.get_health_records_multi(['weight', 'exercise', 'mood'], days=7)
+    assert [len(records[t]) for t in ('weight', 'exercise', 'mood')] == [0, 3, 3]
+    
+    fig = HealthVisualizer().create_combined_chart(records)
+    assert [t.type for t in fig.data] == ['bar', 'scatter', 'scatter']
+    assert fig.layout.xaxis.matches == fig.layout.xaxis3.matches == 'x4'  # 左列时间轴联动
+    print("✅ 单次查询构建组合图")
+    
+    # 心情记录都没有数值时相关性面板显示数据不足
+    db.add_health_record('mood', "心情不错")
+    records = db.get_health_records_multi(['exercise', 'mood'], days=7)
+    records['mood'] = [r for r in records['mood'] if r.numeric_value is None]
+    fig = HealthVisualizer().create_combined_chart(records)
+    assert any(a.text == "数据不足" for a in fig.layout.annotations)
+    db.close()
+    print("✅ 没有心情数值时不计算相关性")
+    
+    return True
+
+
+def test_figure_cache():
+    """测试图表JSON缓存（不依赖kaleido）"""
+    print("📈 测试图表缓存...")
+    
+    from core.database import DatabaseManager
+    from modules.figure_cache import FigureCache, image_renderer_available
+    from modules.visualization import HealthVisualizer
+    
+    db = DatabaseManager(":memory:")
+    db.add_health_record('weight', "70 kg", 70)
+    cache = FigureCache(db)
+    visualizer = HealthVisualizer()
+    builds = []
+    
+    def build(days=30, user_id=1):
+        builds.append((user_id, days))
+        records = db.get_health_records('weight', days=days, user_id=user_id)
+        return visualizer.create_weight_trend_chart(records) if records else None
+    
+    build_other = lambda: build(user_id=2)
+    
+    fig_json = cache.get_figure_json('weight', 30, build)
+    assert fig_json is not None and cache.get_figure_json('weight', 30, build) is fig_json
+    assert len(builds) == 1 and (cache.hits, cache.misses) == (1, 1)
+    print("✅ 数据未变化时第二次读取命中缓存")
+    
+    cache.get_figure_json('weight', 7, lambda: build(days=7))
+    assert cache.get_figure_json('weight', 30, build_other, user_id=2) is None  # 用户2没有记录
+    assert len(builds) == 3 and set(cache._entries) == {(1, 'weight', 30), (1, 'weight', 7), (2, 'weight', 30)}
+    print("✅ 缓存键区分用户、图表和时间范围")
+    
+    db.add_health_record('mood', "心情: 7/10", 7)
+    assert cache.get_figure_json('weight', 30, build) is fig_json  # 其他指标的写入不影响
+    db.add_health_record('weight', "69.5 kg", 69.5)
+    assert cache.get_figure_json('weight', 30, build) != fig_json and len(builds) == 4
+    assert cache.get_figure_json('weight', 30, build_other, user_id=2) is None and len(builds) == 4  # 其他用户不受影响
+    print("✅ 记录写入后按数据版本失效")
+    
+    # 轻量模式的图片缓存建立在JSON缓存之上：无数据时不渲染图片，也不重复构建图表；
+    # 未安装kaleido时回退为交互式图表
+    cache.lite_mode = True
+    for _ in range(2):
+        cache.render_chart('weight', 30, build_other, "暂无体重数据", user_id=2)
+    images = (1, 1) if image_renderer_available() else (0, 0)
+    assert len(builds) == 4 and (cache.image_hits, cache.image_misses) == images
+    assert cache.stats()['image_bytes'] == 0
+    db.close()
+    print("✅ 轻量模式复用图表JSON缓存")
+    
+    return True
+
+
+def test_lite_images():
+    """测试轻量模式静态图片缓存"""
+    print("🖼️ 测试轻量模式图片...")
+    
+    from core.database import DatabaseManager
+    from modules.figure_cache import FigureCache, image_renderer_available
+    from modules.visualization import HealthVisualizer
+    
+    if not image_renderer_available():
+        print("⚠️ 未安装kaleido，跳过")
+        return True
+    
+    db = DatabaseManager(":memory:")
+    db.add_health_record('weight', "70 kg", 70)
+    cache = FigureCache(db)
+    visualizer = HealthVisualizer()
+    build = lambda: visualizer.create_weight_trend_chart(db.get_health_records('weight'))
+    
+    png = cache.get_figure_image('weight', 30, build)
+    assert png.startswith(b"\x89PNG")
+    assert cache.get_figure_image('weight', 30, build) is png
+    db.add_health_record('weight', "69.5 kg", 69.5)
+    assert cache.get_figure_image('weight', 30, build) is not png  # 数据变化后重新渲染
+    assert cache.get_figure_image('weight', 30, build, fmt='svg').lstrip().startswith(b"<svg")
+    assert cache.stats()['image_hits'] == 1
+    db.close()
+    print("✅ 图片按数据版本缓存")
+    
+    return True
+
+
+def test_db_cache():
+    """测试数据库读缓存和写入失效"""
+    print("🗄️ 测试查询缓存...")
+    
+    from datetime import datetime
+    from core.database import DatabaseManager, HealthRecord
+    from core.db_cache import CachedDatabase
+    
+    db = CachedDatabase(DatabaseManager(":memory:"))
+    db.add_health_record('weight', "70 kg", 70)
+    db.get_health_records('weight')
+    db.get_latest_record('mood')
+    
+    with db.track_queries() as stats:
+        assert db.get_health_records('weight', days=30)[0].numeric_value == 70
+        assert db.get_latest_record('mood') is None
+    assert stats['queries'] == 0
+    print("✅ 相同查询签名命中缓存")
+    
+    db.add_health_record('mood', "心情: 7/10", 7)
+    with db.track_queries() as stats:
+        db.get_health_records('weight')
+        assert db.get_latest_record('mood').numeric_value == 7
+    assert stats['queries'] == 1  # 只有心情查询失效
+    assert db.cache_stats()['invalidations'] == 1
+    db.close()
+    print("✅ 写入只使相关数据范围失效")
+    
+    counters = CachedDatabase(DatabaseManager(":memory:"))
+    counters.add_health_record('exercise', "跑步 30分钟", 30)
+    assert counters.get_dashboard_stats()['today_exercises'] == 1
+    # 导入的记录不经过计数器，回填只写计数器表
+    counters.session.add(HealthRecord(record_type='exercise', value="游泳 40分钟", numeric_value=40,
+                                      date=datetime.utcnow()))
+    counters.session.commit()
+    assert counters.rebuild_daily_totals()
+    with counters.track_queries() as stats:
+        assert counters.get_dashboard_stats()['today_exercises'] == 2
+    assert stats['queries'] > 0
+    counters.close()
+    print("✅ 计数器表写入使仪表板统计失效")
+    
+    small = CachedDatabase(DatabaseManager(":memory:"), maxsize=3)
+    for days in range(1, 11):
+        small.get_health_records('weight', days=days)
+    indexed = set().union(*small._index.values())
+    assert len(small._entries) == 3 and indexed == set(small._entries)
+    small.add_health_record('weight', "71 kg", 71)
+    assert not small._entries and not small._index
+    small.close()
+    print("✅ LRU淘汰和失效同时清理反向索引")
+    
+    return True
+
+
+def test_insight_rules():
+    """测试洞察规则引擎"""
+    print("💡 测试洞察规则...")
+    
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    from core.insights import InsightEngine, daily_rollups, records_to_frame, build_feature_frame
+    
+    now = datetime(2025, 3, 10, 4)  # 北京时间 3月10日 12:00
+    records = []
+    for user_id, days in [(1, [0, 1, 2, 4]), (2, [1, 2])]:
+        for d in days:
+            records.append(SimpleNamespace(user_id=user_id, record_type='exercise', numeric_value=30,
+                                           date=now - timedelta(days=d)))
+    records.append(SimpleNamespace(user_id=1, record_type='mood', numeric_value=4, date=now))
+    
+    rollups = daily_rollups(records_to_frame(records))
+    frame = build_feature_frame(rollups, "2025-03-10", user_ids=[1, 2, 3])
+    assert frame.loc[1, 'exercise_streak'] == 3 and frame.loc[2, 'exercise_streak'] == 2  # 昨天起算
+    assert frame.loc[3, 'exercise_count_7d'] == 0  # 无记录的用户计数为0
+    print("✅ 日汇总特征（窗口计数、连续天数）正确")
+    
+    engine = InsightEngine([
+        {"id": "low", "when": [("exercise_count_7d", "<", 3)], "message": "少"},
+        {"id": "streak", "when": [("exercise_streak", ">=", 3), ("exercise_days_7d", ">=", 3)],
+         "message": "连续{exercise_streak:.0f}天", "priority": 1},
+        {"id": "sad", "when": [("mood_mean_7d", "<", 5)], "message": "低落"},
+    ])
+    fired = engine.evaluate(frame)
+    assert fired.loc[1].tolist() == [False, True, True]
+    assert fired.loc[3].tolist() == [True, False, False]  # 缺失特征不触发
+    assert engine.messages(frame)[1] == ["连续3天", "低落"]
+    print("✅ 规则向量化求值和优先级排序正确")
+    
+    return True
+
+
+def test_daily_digest():
+    """测试每日摘要批处理"""
+    print("🌙 测试每日摘要...")
+    
+    import tempfile
+    from datetime import datetime, timedelta
+    from core.database import DatabaseManager, HealthRecord, UserProfile
+    from daily_digest import run_daily_digest
+    from modules.visualization import HealthVisualizer
+    from modules.dashboard import Dashboard
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/digest.db"
+        db = DatabaseManager(db_path)
+        db.session.add(UserProfile(id=2, name="用户2", timezone="America/New_York"))
+        db.session.commit()
+        for i in range(5):
+            db.add_health_record('exercise', "跑步 30分钟", 30)
+            db.add_health_record('mood', "心情: 4/10", 4, user_id=2)
+        db.create_goal("减重5公斤", "", "weight", 5, "kg", datetime.utcnow() + timedelta(days=3))
+        
+        assert run_daily_digest(db_path, workers=0, chunksize=1) == 2
+        dashboard = Dashboard(db, HealthVisualizer())
+        stored = dashboard._load_stored_digest(dashboard.snapshot())
+        assert stored is not None and dashboard.digest() is stored  # 数据未变化时直接使用预计算摘要
+        assert stored['week_exercise_count'] == 5 and stored['week_avg_mood'] is None
+        assert "目标即将到期" in stored['motivation']
+        
+        from core.calendar_utils import local_today
+        other = db.get_daily_digest(local_today("America/New_York"), user_id=2)  # 按用户自己的时区确定日期
+        assert other is not None and other.week_avg_mood == 4 and other.week_exercise_count == 0
+        print("✅ 批处理摘要与实时数据一致时直接读取")
+        
+        # 文字记录和窗口之外的补录不影响摘要，两侧的记录指纹按同一过滤条件计算，仍然匹配
+        db.add_health_record('diet', "早餐: 燕麦")
+        db.session.add(HealthRecord(user_id=1, record_type='weight', value="70kg", numeric_value=70,
+                                    date=datetime.utcnow() - timedelta(days=40)))
+        db.session.commit()
+        assert run_daily_digest(db_path, workers=0, chunksize=1) == 2
+        dashboard = Dashboard(db, HealthVisualizer())
+        stored = dashboard._load_stored_digest(dashboard.snapshot())
+        assert dashboard.digest() is stored
+        print("✅ 最新记录不是数值记录或早于窗口时仍使用预计算摘要")
+        
+        db.add_health_record('exercise', "跑步 30分钟", 30)
+        live = dashboard.digest()
+        assert live is not stored and live['week_exercise_count'] == 6
+        print("✅ 有新记录后回退为实时计算")
+        db.close()
+    
+    return True
+
+
+def _brute_force_streak(days):
+    """参考实现：逐天向前数连续天数"""
+    from datetime import timedelta
+    day_set = set(days)
+    runs = {}
+    for day in day_set:
+        n = 0
+        while day - timedelta(days=n) in day_set:
+            n += 1
+        runs[day] = n
+    last_day = max(day_set)
+    return runs[last_day], max(runs.values()), last_day
+
+
+def test_streaks():
+    """测试连续打卡的增量更新和回填"""
+    print("🔥 测试连续打卡...")
+    
+    import random
+    import tempfile
+    import numpy as np
+    from datetime import date, timedelta
+    from core.database import DatabaseManager, Streak
+    from core.streaks import compute_streaks, current_streak
+    from backfill import backfill
+    
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/streaks.db"
+        db = DatabaseManager(db_path)
+        expected, backfill_rows = {}, {'user_id': [], 'record_type': [], 'day': []}
+        for user_id in range(1, 21):
+            for record_type in ('exercise', 'water'):
+                # 单调不减的打卡日期：同一天重复、相邻和间隔都有
+                day, days = date(2025, 1, 1), []
+                for _ in range(rng.randint(1, 40)):
+                    day += timedelta(days=rng.choice([0, 1, 1, 1, 2, 5]))
+                    days.append(day)
+                    db._update_streak(user_id, record_type, day)
+                expected[(user_id, record_type)] = _brute_force_streak(days)
+                backfill_rows['user_id'] += [user_id] * len(days)
+                backfill_rows['record_type'] += [record_type] * len(days)
+                backfill_rows['day'] += days
+        db.session.commit()
+        
+        rows = db.session.query(Streak).all()
+        incremental = {(r.user_id, r.record_type): (r.current, r.longest, r.last_day) for r in rows}
+        assert incremental == expected
+        print(f"✅ 增量更新与暴力参考实现一致 ({len(expected)} 组)")
+        
+        backfill_rows['day'] = np.array(backfill_rows['day'], dtype='datetime64[D]')
+        computed = compute_streaks(backfill_rows)
+        vectorized = {(r.user_id, r.record_type): (r.current, r.longest, r.last_day.date())
+                      for r in computed.itertuples(index=False)}
+        assert vectorized == expected
+        print("✅ 向量化回填与暴力参考实现一致")
+        
+        # 添加记录的钩子和回填工具：同一天多条记录只算一天
+        db.add_health_record('mood', "心情: 7/10", 7, user_id=1)
+        db.add_health_record('mood', "心情: 8/10", 8, user_id=1)
+        assert db.get_streaks(1)['mood']['current'] == 1
+        assert db.get_streaks(1)['exercise']['current'] == 0  # 2025年的连续已中断
+        db.close()
+        assert backfill(db_path, ["streaks"]) == 1  # 默认用户
+        db = DatabaseManager(db_path)
+        streaks = db.get_streaks(1)
+        assert streaks['mood']['current'] == 1 and streaks['mood']['longest'] == 1
+        assert streaks['exercise']['longest'] == 0  # 回填只依据真实记录
+        db.close()
+        
+        assert current_streak(4, date(2025, 3, 9), date(2025, 3, 10)) == 4
+        assert current_streak(4, date(2025, 3, 8), date(2025, 3, 10)) == 0
+        print("✅ 记录钩子、回填工具和中断判断正确")
+    
+    return True
+
+
+def test_anomaly_detection():
+    """测试流式异常检测与向量化回填一致"""
+    print("🚨 测试异常检测...")
+    
+    import json
+    import tempfile
+    import numpy as np
+    import pandas as pd
+    from core.anomaly import ANOMALY_METRICS, detect_series, new_state, update_state
+    from core.database import DatabaseManager, Anomaly, AnomalyState
+    
+    # 随机序列：噪声 + 中途水平漂移 + 注入的离群点，多个序列交错到达
+    rng = np.random.default_rng(0)
+    rows = []
+    for user_id in range(20):
+        for record_type, scale in ANOMALY_METRICS.items():
+            n = int(rng.integers(1, 60))
+            values = 60 + rng.normal(0, scale * 2, n)
+            values[n // 2:] += scale * 15 if n > 20 else 0
+            values[rng.integers(0, n, 2)] += scale * 30
+            rows += [(user_id, record_type, v, i) for i, v in enumerate(values)]
+    records = pd.DataFrame(rows, columns=['user_id', 'record_type', 'value', 'record_id'])
+    records = records.sample(frac=1, random_state=0).sort_values('record_id', kind='stable')
+    
+    streamed, states = set(), {}
+    for r in records.itertuples():
+        state = states.setdefault((r.user_id, r.record_type), new_state())
+        anomaly = update_state(state, r.value, ANOMALY_METRICS[r.record_type])
+        if anomaly:
+            streamed.add((r.user_id, r.record_type, r.record_id, anomaly['kind']))
+    anomalies, final_states = detect_series(records)
+    assert streamed == set(zip(anomalies.user_id, anomalies.record_type, anomalies.record_id, anomalies.kind))
+    assert {'outlier', 'drift'} <= set(anomalies.kind)
+    assert all(np.allclose(states[k]['window'], final_states[k]['window']) and
+               states[k]['count'] == final_states[k]['count'] for k in states)
+    print(f"✅ 流式检测与向量化回填一致 ({len(streamed)} 个异常)")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(f"{tmp}/anomaly.db")
+        for value in [70.0, 70.2, 69.9, 70.1, 70.0, 69.8, 70.1, 75.0]:
+            db.add_health_record('weight', f"{value} kg", value)
+        flagged = db.get_anomalies(30)
+        assert [(a.kind, a.value) for a in flagged] == [('outlier', 75.0)]
+        incremental = db.session.get(AnomalyState, (1, 'weight')).state
+        
+        assert db.rebuild_anomalies()
+        assert [(a.kind, a.value) for a in db.session.query(Anomaly).all()] == [('outlier', 75.0)]
+        rebuilt = db.session.get(AnomalyState, (1, 'weight'), populate_existing=True).state
+        assert json.loads(rebuilt)['window'] == json.loads(incremental)['window']
+        db.close()
+    print("✅ 添加记录时增量检测，回填结果一致")
+    
+    return True
+
+
+def test_daily_targets():
+    """测试今日计数器和每日目标"""
+    print("📈 测试每日目标...")
+    
+    from datetime import datetime
+    from core.database import DatabaseManager, DailyTotal, HealthRecord
+    from core.daily_targets import daily_progress, parse_targets
+    
+    assert parse_targets(None) == {'exercise': 30, 'water': 8}
+    assert parse_targets('{"water": 10, "exercise": -5, "steps": 1}') == {'exercise': 30, 'water': 10}
+    
+    db = DatabaseManager(":memory:")
+    db.add_health_record('exercise', "跑步 20分钟", 20)
+    db.add_health_record('exercise', "瑜伽 25分钟", 25)
+    for _ in range(3):
+        db.add_health_record('water', "1杯", None)
+    with db.track_queries() as stats:
+        totals = db.get_daily_totals()
+    assert stats['queries'] == 1  # 只查询计数器表，不扫描原始记录
+    assert totals == {'exercise': {'count': 2, 'total': 45}, 'water': {'count': 3, 'total': 0}}
+    
+    assert db.update_daily_targets({'exercise': 60, 'water': 6})
+    progress = {p['metric']: p for p in daily_progress(totals, db.get_daily_targets())}
+    assert progress['exercise']['ratio'] == 0.75 and progress['water']['ratio'] == 0.5
+    print("✅ 写入时累加计数器，进度按用户目标计算")
+    
+    # 回填：北京时间零点两侧的记录落在不同的本地日期
+    db.session.add_all([
+        HealthRecord(record_type='water', value='1杯', date=datetime(2025, 3, 2, 15, 59)),
+        HealthRecord(record_type='water', value='1杯', date=datetime(2025, 3, 2, 16, 1)),
+    ])
+    db.session.commit()
+    assert db.rebuild_daily_totals()
+    days = {str(r.day): r.count for r in db.session.query(DailyTotal).filter_by(record_type='water')}
+    assert days['2025-03-02'] == 1 and days['2025-03-03'] == 1
+    assert db.get_daily_totals() == totals  # 今天的计数与增量结果一致
+    db.close()
+    print("✅ 回填按用户本地零点切分")
+    
+    return True
+
+
+def test_goal_sync():
+    """测试目标进度根据健康记录自动同步"""
+    print("🔗 测试目标同步...")
+    
+    from datetime import date, datetime, timedelta
+    from core.database import DatabaseManager, Goal
+    from core.goal_metrics import apply_record, start_goal
+    
+    # 按周计数：跨过周一后从0重新计数
+    _, state, current = start_goal('exercise_weekly', date(2025, 3, 2), period_count=2)
+    assert current == 2
+    assert apply_record('exercise_weekly', None, state, None, date(2025, 3, 2)) == (None, 3.0)
+    assert apply_record('exercise_weekly', None, state, None, date(2025, 3, 3)) == (None, 1.0)
+    
+    db = DatabaseManager(":memory:")
+    deadline = datetime.utcnow() + timedelta(days=30)
+    db.add_health_record('weight', "70kg", 70)
+    db.create_goal("减重2公斤", "", "weight", 2, "kg", deadline, metric='weight_loss')
+    db.create_goal("保证睡眠", "", "wellness", 7, "小时/天", deadline, metric='sleep_avg')
+    db.create_goal("跑10公里", "", "fitness", 10, "km", deadline)
+    loss, sleep, manual = db.session.query(Goal).order_by(Goal.id).all()
+    assert loss.baseline == 70 and loss.current_value == 0
+    
+    # 只有订阅了该记录类型的目标会被读取和更新
+    goals_version = db.get_data_version(scope='goals')
+    db.add_health_record('mood', "心情: 7/10", 7)
+    assert db.get_data_version(scope='goals') == goals_version
+    with db.track_queries() as stats:
+        db.add_health_record('weight', "69kg", 69)
+    assert loss.current_value == 1 and db.get_data_version(scope='goals') == goals_version + 1
+    db.add_health_record('mood', "心情: 7/10", 7)
+    with db.track_queries() as mood_stats:
+        db.add_health_record('mood', "心情: 7/10", 7)
+    assert stats['queries'] <= mood_stats['queries'] + 2, (stats, mood_stats)
+    print(f"✅ 体重记录只更新订阅的目标（{stats['queries']} 条SQL）")
+    
+    db.add_health_record('weight', "67.5kg", 67.5)
+    assert loss.status == 'completed' and loss.current_value == 2.5 and loss.completed_at
+    db.add_health_record('weight', "66kg", 66)
+    assert loss.current_value == 2.5  # 已完成的目标不再更新
+    
+    # 平均睡眠：满7晚前不判定完成
+    for _ in range(6):
+        db.add_health_record('sleep', "8小时", 8)
+    assert sleep.current_value == 8 and sleep.status == 'active'
+    db.add_health_record('sleep', "7小时", 7)
+    assert sleep.status == 'completed'
+    assert manual.current_value == 0 and manual.status == 'active'
+    db.close()
+    print("✅ 达到目标后自动完成，未绑定指标的目标保持手动更新")
+    
+    # 周期计数：单个周期达标不算完成，期限内的完整周期都达标才完成
+    from core.goal_metrics import goal_reached, periods_met, required_periods
+    assert required_periods('exercise_weekly', 30) == 4 and required_periods('water_daily', 30) == 30
+    _, state, _ = start_goal('exercise_weekly', date(2025, 3, 3), target=4)
+    for week in range(4):
+        for _ in range(5):
+            current = apply_record('exercise_weekly', None, state, None, date(2025, 3, 3) + timedelta(weeks=week), 4)[1]
+        assert state['met'] == week + 1
+        assert goal_reached('exercise_weekly', state, current, 4, 30) == (week == 3)
+    
+    db = DatabaseManager(":memory:")
+    db.create_goal("每周运动4次", "", "fitness", 4, "次/周", datetime.utcnow() + timedelta(days=30), metric='exercise_weekly')
+    db.create_goal("每天8杯水", "", "nutrition", 8, "杯/天", datetime.utcnow() + timedelta(days=30), metric='water_daily')
+    db.create_goal("本周运动4次", "", "fitness", 4, "次/周", datetime.utcnow() + timedelta(days=7), metric='exercise_weekly')
+    monthly, water, weekly = db.session.query(Goal).order_by(Goal.id).all()
+    for _ in range(4):
+        db.add_health_record('exercise', "跑步", 30)
+    for _ in range(8):
+        db.add_health_record('water', "一杯水", 1)
+    assert monthly.current_value == 4 and monthly.status == 'active'
+    assert water.current_value == 8 and water.status == 'active'
+    assert weekly.status == 'completed'
+    assert periods_met(monthly) == (1, 4) and periods_met(water) == (1, 30) and periods_met(weekly) == (1, 1)
+    print("✅ 周期计数目标按达标周期数判定完成")
+    
+    # 周期结束后（没有新记录）显示的进度归零，统计和激励消息一致
+    import json
+    from core.calendar_utils import local_today
+    from core.digest import motivation_message
+    from core.goal_metrics import current_progress
+    today = local_today(db.get_user_timezone())
+    assert current_progress(monthly, today) == 4 and current_progress(monthly, today + timedelta(days=7)) == 0
+    assert current_progress(water, today + timedelta(days=1)) == 0
+    avg = db.get_goal_stats()['avg_progress']
+    assert abs(avg - (100 + 100) / 2) < 1e-9  # 运动 4/4、饮水 8/8
+    for goal in (monthly, water):
+        state = json.loads(goal.state)
+        state['period'] = (date.fromisoformat(state['period']) - timedelta(days=7)).isoformat()
+        goal.state = json.dumps(state)
+    db.session.commit()
+    assert db.get_goal_stats()['avg_progress'] == 0
+    far = [monthly, water]
+    for goal in far:
+        goal.deadline = datetime.utcnow() + timedelta(days=60)
+    assert "进展顺利" not in motivation_message(far, db.get_user_timezone())
+    db.close()
+    print("✅ 跨过周期边界后进度按0显示")
+    
+    # 应用内没有饮水、睡眠记录入口：模板不绑定这些指标，已绑定的目标保留手动更新
+    from core.goal_metrics import auto_synced
+    from modules.goals import GoalManager
+    templates = GoalManager(DatabaseManager(":memory:"), None).goal_templates
+    bound = {name: t["metric"] for name, t in templates.items() if t.get("metric")}
+    assert bound == {"减重": "weight_loss", "运动频率": "exercise_weekly"}
+    assert all(auto_synced(metric) for metric in bound.values())
+    assert not auto_synced('water_daily') and not auto_synced('sleep_avg') and not auto_synced(None)
+    print("✅ 只有应用内可录入的指标自动同步")
+    
+    return True
+
+
+def test_goal_stats():
+    """测试目标统计的分组SQL和已完成目标分页"""
+    print("🏆 测试目标统计...")
+    
+    import random
+    from datetime import datetime, timedelta
+    from core.calendar_utils import utc_to_local
+    from core.database import DatabaseManager, Goal
+    
+    db = DatabaseManager(":memory:")
+    db.update_user_profile({'timezone': 'America/New_York'})
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    goals = []
+    for i in range(300):
+        status = rng.choice(['active', 'completed', 'completed', 'paused'])
+        created = now - timedelta(days=rng.uniform(0, 500))
+        goals.append(Goal(
+            user_id=rng.choice([1, 1, 2]), title=f"目标{i}", category=rng.choice(['fitness', 'weight', 'wellness']),
+            target_value=rng.choice([0, 5, 10]), current_value=rng.uniform(0, 10), status=status,
+            created_at=created, deadline=created + timedelta(days=60),
+            completed_at=created + timedelta(days=rng.uniform(0, (now - created).days)) if status == 'completed' else None))
+    db.session.add_all(goals)
+    db.session.commit()
+    
+    with db.track_queries() as q:
+        stats = db.get_goal_stats()
+    assert q['queries'] <= 4, q  # 用户时区 + 3条分组查询
+    
+    mine = [g for g in goals if g.user_id == 1]
+    completed = [g for g in mine if g.status == 'completed']
+    active = [g for g in mine if g.status == 'active']
+    assert stats['by_status'] == {s: sum(g.status == s for g in mine) for s in {g.status for g in mine}}
+    assert stats['by_category'] == {c: sum(g.category == c for g in completed) for c in {g.category for g in completed}}
+    expected_progress = sum(g.current_value / g.target_value * 100 if g.target_value > 0 else 0 for g in active) / len(active)
+    assert abs(stats['avg_progress'] - expected_progress) < 1e-6
+    expected_days = sum((g.completed_at - g.created_at).days for g in completed) / len(completed)
+    assert abs(stats['avg_days'] - expected_days) < 1e-9
+    # 按用户本地月份分组
+    local_months = [utc_to_local(g.completed_at, 'America/New_York').strftime('%Y-%m') for g in completed]
+    for month, count in stats['by_month'].items():
+        assert count == local_months.count(month), month
+    assert stats['month_completed'] == list(stats['by_month'].values())[0]
+    print(f"✅ 目标统计 {q['queries']} 条SQL，与逐个目标计算一致")
+    
+    ordered = sorted(completed, key=lambda g: (g.completed_at, g.id), reverse=True)
+    pages = [db.get_completed_goals(10, offset) for offset in range(0, len(completed), 10)]
+    assert [g.id for page in pages for g in page] == [g.id for g in ordered]
+    db.close()
+    print("✅ 已完成目标分页按完成时间倒序")
+    
+    return True
+
+
+def test_goal_reminders():
+    """测试截止日期范围查询和目标提醒调度"""
+    print("🔔 测试目标提醒...")
+    
+    import tempfile
+    import time
+    from datetime import datetime, timedelta
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from core.calendar_utils import utc_now
+    from core.database import DatabaseManager, Goal, GoalReminder
+    from core.reminders import RETRY_SECONDS, ReminderScheduler
+    
+    db = DatabaseManager(":memory:")
+    db.update_user_profile({'timezone': 'America/New_York'})
+    now = datetime(2025, 3, 8, 12, 0)  # 纽约 3月8日 07:00，次日切换夏令时
+    # 本地 3月11日 23:30 在3天内，3月12日 00:30 不在
+    for title, deadline, status in [("逾期", datetime(2025, 3, 1), 'active'),
+                                    ("三天内", datetime(2025, 3, 12, 3, 30), 'active'),
+                                    ("第四天", datetime(2025, 3, 12, 4, 30), 'active'),
+                                    ("已完成", datetime(2025, 3, 9), 'completed')]:
+        db.session.add(Goal(title=title, target_value=1, deadline=deadline, status=status))
+    db.session.commit()
+    assert [g.title for g in db.get_goals_due_within(3, now_utc=now)] == ["逾期", "三天内"]
+    plan = db.session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT * FROM goals WHERE user_id = 1 AND status = 'active' AND deadline < '2025-03-12'"
+    )).fetchall()
+    assert any('ix_goals_user_status_deadline' in row[-1] for row in plan), plan
+    print("✅ 按用户本地日期的截止范围查询使用截止日期索引")
+    
+    scheduler = ReminderScheduler(":memory:")
+    settings = db.get_reminder_settings()
+    assert settings['enabled'] and settings['time'] == "09:00"
+    scheduler.schedule(1, settings['timezone'], settings['time'], now_utc=now)
+    assert scheduler.next_due() == datetime(2025, 3, 8, 14, 0)  # 09:00 EST
+    assert scheduler.run_due(db, datetime(2025, 3, 8, 13, 59)) == 0
+    assert scheduler.run_due(db, datetime(2025, 3, 8, 14, 0)) == 2
+    assert scheduler.next_due() == datetime(2025, 3, 9, 13, 0)  # 夏令时后 09:00 EDT
+    assert scheduler.run_due(db, datetime(2025, 3, 8, 20, 0)) == 0
+    assert [r.message for r in db.get_unread_reminders()] == ["⚠️ 目标「三天内」还剩 3 天截止", "⏰ 目标「逾期」已逾期 8 天"]
+    assert db.mark_reminders_read() and not db.get_unread_reminders()
+    
+    # 查询或写入失败时不跳到明天，RETRY_SECONDS 后重试直到写入成功
+    db.session.query(GoalReminder).delete()
+    db.session.commit()
+    scheduler.schedule(1, settings['timezone'], settings['time'], now_utc=now)
+    save = db.save_goal_reminders
+    db.save_goal_reminders = lambda reminders: False
+    assert scheduler.run_due(db, datetime(2025, 3, 8, 14, 0)) == 0
+    assert scheduler.next_due() == datetime(2025, 3, 8, 14, 0) + timedelta(seconds=RETRY_SECONDS)
+    def locked(*args, **kwargs):
+        raise OperationalError("SELECT", {}, Exception("database is locked"))
+    db.get_goals_due_within, query = locked, db.get_goals_due_within
+    assert scheduler.run_due(db, scheduler.next_due()) == 0
+    assert scheduler.next_due() == datetime(2025, 3, 8, 14, 2)
+    db.save_goal_reminders, db.get_goals_due_within = save, query
+    assert scheduler.run_due(db, scheduler.next_due()) == 2
+    assert scheduler.next_due() == datetime(2025, 3, 9, 13, 0)
+    assert len(db.get_unread_reminders()) == 2
+    print("✅ 触发失败时稍后重试，写入成功后才排到下一天")
+    
+    scheduler.schedule(1, settings['timezone'], "21:30", now_utc=now)
+    assert scheduler.next_due() == datetime(2025, 3, 9, 2, 30)
+    scheduler.schedule(1, settings['timezone'], "21:30", enabled=False)
+    assert scheduler.next_due() is None
+    db.close()
+    print("✅ 堆按本地提醒时间调度，跨夏令时仍在本地09:00触发")
+    
+    # 后台线程使用自己的数据库会话触发到期提醒
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/reminders.db"
+        db = DatabaseManager(db_path)
+        assert db.update_reminder_settings(False, "08:00")
+        db.create_goal("明天截止", "", "fitness", 1, "次", utc_now() + timedelta(hours=12))
+        scheduler = ReminderScheduler(db_path)
+        scheduler.start()
+        scheduler.schedule(1, db.get_user_timezone(), "08:00", now_utc=utc_now() - timedelta(days=1))
+        for _ in range(50):
+            if db.get_unread_reminders():
+                break
+            time.sleep(0.1)
+        scheduler.stop(timeout=5)
+        assert len(db.get_unread_reminders()) == 1 and scheduler.fired == 1
+        db.close()
+    print("✅ 后台线程触发到期提醒")
+    
+    return True
+
+
+def test_goal_forecast():
+    """测试目标进度的批量回归和完成预测"""
+    print("🔮 测试目标预测...")
+    
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    import numpy as np
+    from core.database import DatabaseManager
+    from core.goal_forecast import fit_progress, forecast_goals
+    
+    # 向量化的分组最小二乘与逐个 np.polyfit 一致
+    rng = np.random.default_rng(0)
+    index = rng.integers(0, 50, 2000)
+    t = rng.uniform(0, 60, 2000)
+    slopes = rng.uniform(-1, 1, 50)
+    y = slopes[index] * t + rng.normal(0, 0.3, 2000)
+    fit = fit_progress(index, t, y, 50, robust=False)
+    expected = [np.polyfit(t[index == g], y[index == g], 1)[0] for g in range(50)]
+    assert np.allclose(fit['slope'], expected)
+    # 稳健拟合不受误输入的影响
+    y_bad = y.copy()
+    y_bad[np.nonzero(index == 0)[0][:2]] += 100
+    assert abs(fit_progress(index, t, y_bad, 50, robust=False)['slope'][0] - slopes[0]) > 0.1
+    assert abs(fit_progress(index, t, y_bad, 50)['slope'][0] - slopes[0]) < 0.05
+    print("✅ 分组回归与逐个拟合一致，稳健拟合降低离群点影响")
+    
+    now = datetime(2025, 3, 1)
+    days = np.arange(0, 11)
+    events = {
+        'goal_id': np.repeat([1, 2, 3], len(days)).tolist() + [4],
+        'at': [now - timedelta(days=float(10 - d)) for d in days] * 3 + [now],
+        'value': (0.5 * days).tolist() * 3 + [1.0],
+    }
+    goal = lambda gid, deadline_days, metric=None: SimpleNamespace(
+        id=gid, current_value=5.0, target_value=10.0, deadline=now + timedelta(days=deadline_days), metric=metric)
+    forecasts = forecast_goals([goal(1, 20), goal(2, 5), goal(3, 20, 'exercise_weekly'), goal(4, 20)], events, now)
+    assert abs(forecasts[1]['rate'] - 0.5) < 1e-9 and forecasts[1]['on_track']
+    assert abs((forecasts[1]['projected'] - now).total_seconds() - 10 * 86400) < 1
+    assert forecasts[2]['on_track'] is False and forecasts[2]['required_rate'] == 1.0
+    assert 3 not in forecasts  # 按周期计数的进度不做外推
+    assert forecasts[4]['on_track'] is None and forecasts[4]['rate'] is None
+    print("✅ 预测完成日期和按期完成所需的每日进度")
+    
+    db = DatabaseManager(":memory:")
+    db.create_goal("跑100公里", "", "fitness", 100, "km", datetime.utcnow() + timedelta(days=30))
+    db.create_goal("别人的目标", "", "fitness", 100, "km", datetime.utcnow() + timedelta(days=30), user_id=2)
+    db.update_goal_progress(1, 10)
+    db.update_goal_progress(1, 25)
+    history = db.get_goal_progress_events([1, 2])
+    assert history['goal_id'] == [1, 1, 1] and history['value'] == [0, 10, 25]
+    db.close()
+    print("✅ 进度更新写入历史")
+    
+    return True
+
+
+def test_goal_progress_history():
+    """测试目标进度历史的事务写入、时间序列读取和补写"""
+    print("📜 测试目标进度历史...")
+    
+    from datetime import datetime, timedelta
+    import tempfile
+    import numpy as np
+    import pandas as pd
+    from streamlit.testing.v1 import AppTest
+    from core.database import DatabaseManager, Goal, GoalProgressEvent
+    from modules.visualization import HealthVisualizer
+    
+    db = DatabaseManager(":memory:")
+    deadline = datetime.utcnow() + timedelta(days=30)
+    db.create_goal("跑100公里", "", "fitness", 100, "km", deadline)
+    db.create_goal("每周运动", "", "fitness", 3, "次/周", deadline, metric='exercise_weekly')
+    db.update_goal_progress(1, 10)
+    db.update_goal_progress(1, 25)
+    db.add_health_record('exercise', "跑步 30分钟", 30)
+    
+    series = db.get_goal_progress_series(1)
+    assert series['value'].dtype == np.float64 and series.index.dtype.kind == 'M'
+    assert series['value'].tolist() == [0, 10, 25] and series.index.is_monotonic_increasing
+    assert db.get_goal_progress_series(2)['value'].tolist() == [0, 1]  # 建立时的起点 + 记录同步
+    assert db.get_goal_progress_series(1, user_id=2).empty
+    print("✅ 建立、手动更新和记录同步都写入历史，按时间读取为数据框")
+    
+    # 提交失败时进度和历史一起回滚
+    commit = db.session.commit
+    def failing_commit():
+        raise RuntimeError("disk full")
+    db.session.commit = failing_commit
+    assert not db.update_goal_progress(1, 40)
+    db.session.commit = commit
+    assert db.session.query(GoalProgressEvent).filter_by(goal_id=1).count() == 3
+    assert db.get_goal_progress_series(1)['value'].iloc[-1] == 25
+    
+    # 为没有历史的已有目标补写起点和当前进度，已有历史的目标不变
+    db.session.add(Goal(title="旧目标", target_value=10, current_value=4, deadline=deadline,
+                        created_at=datetime.utcnow() - timedelta(days=20)))
+    db.session.commit()
+    assert db.seed_goal_progress_events() and db.seed_goal_progress_events()
+    assert db.get_goal_progress_series(3)['value'].tolist() == [0, 4]
+    assert len(db.get_goal_progress_series(1)) == 3
+    print("✅ 写入失败时历史随进度回滚，补写只处理没有历史的目标")
+    
+    goal = db.session.get(Goal, 1)
+    fig = HealthVisualizer().create_goal_history_chart(db.get_goal_progress_series(1), goal, deadline)
+    assert len(fig.data) == 2  # 进度 + 预计完成
+    
+    # 批量读取的事件按目标切分后与逐个查询的序列一致
+    histories = DatabaseManager.split_goal_progress_events(db.get_goal_progress_events([1, 2, 3, 99]))
+    assert sorted(histories) == [1, 2, 3]
+    for goal_id, history in histories.items():
+        pd.testing.assert_frame_equal(history, db.get_goal_progress_series(goal_id))
+    assert DatabaseManager.split_goal_progress_events(db.get_goal_progress_events([])) == {}
+    db.close()
+    print("✅ 进度历史按目标切分，无需逐个查询")
+    
+    # 目标页面的查询数与目标个数无关
+    queries = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_goals in (2, 8):
+            db_path = f"{tmp}/goals_{n_goals}.db"
+            db = DatabaseManager(db_path)
+            for i in range(n_goals):
+                db.create_goal(f"目标{i}", "", "fitness", 10, "次", deadline)
+                db.update_goal_progress(i + 1, 2)
+            db.close()
+            at = AppTest.from_function(_goals_app, args=(db_path,), default_timeout=30).run()
+            assert not at.exception
+            queries.append(at.session_state.render_queries)
+            at.session_state.goal_manager.db.close()
+    assert queries[0] == queries[1], queries
+    print(f"✅ 活跃目标页面 {queries[1]} 条SQL（与目标数无关）")
+    
+    return True
+
+
+def _goals_app(db_path):
+    """目标页面测试应用（活跃目标卡片和进度历史）"""
+    import streamlit as st
+    from core.database import DatabaseManager
+    from modules.visualization import HealthVisualizer
+    from modules.goals import GoalManager
+    
+    if 'goal_manager' not in st.session_state:
+        st.session_state.goal_manager = GoalManager(DatabaseManager(db_path), HealthVisualizer())
+    manager = st.session_state.goal_manager
+    with manager.db.track_queries() as stats:
+        manager._render_active_goals()
+    st.session_state.render_queries = stats['queries']
+
+
+def _dashboard_app(db_path):
+    """仪表板测试应用（在AppTest的脚本线程中运行，片段会真正执行）"""
+    import streamlit as st
+    from core.database import DatabaseManager
+    from modules.visualization import HealthVisualizer
+    from modules.dashboard import Dashboard
+    
+    if 'dashboard' not in st.session_state:
+        st.session_state.dashboard = Dashboard(DatabaseManager(db_path), HealthVisualizer())
+    dashboard = st.session_state.dashboard
+    with dashboard.db.track_queries() as stats:
+        dashboard.render_dashboard()
+        dashboard.render_progress_bars()
+        dashboard.render_health_insights()
+    st.session_state.render_queries = stats['queries']
+
+
+def test_dashboard_queries():
+    """测试仪表板每次渲染的SQL语句数有上限"""
+    print("🧮 测试仪表板查询数...")
+    
+    import re
+    import tempfile
+    from datetime import datetime, timedelta
+    from streamlit.testing.v1 import AppTest
+    from core.database import DatabaseManager
+    from modules.dashboard import METRIC_PANELS, SNAPSHOT_DAYS, Dashboard
+    from modules.visualization import HealthVisualizer
+    
+    db = DatabaseManager(":memory:")
+    for record_type, value in [('weight', 70), ('exercise', 30), ('mood', 6)]:
+        db.add_health_record(record_type, str(value), value)
+    dashboard = Dashboard(db, HealthVisualizer())
+    for record_type in METRIC_PANELS:
+        dashboard.load_metric_panel(record_type)
+    misses = dashboard.figure_cache.misses
+    db.add_health_record('weight', "69.5 kg", 69.5)
+    with db.track_queries() as reload:
+        db.get_dashboard_snapshot(SNAPSHOT_DAYS)
+    with db.track_queries() as stats:
+        panel = dashboard.load_metric_panel('weight')
+    # 片段重跑只重新加载一次快照，只重建本指标的图表
+    assert stats['queries'] == reload['queries'] and dashboard.figure_cache.misses == misses + 1
+    assert panel['stats']['current_weight'] == 69.5 and panel['chart'][1] is not None
+    with db.track_queries() as stats:
+        dashboard.load_metric_panel('exercise')
+    assert stats['queries'] == 0 and dashboard.figure_cache.misses == misses + 1
+    db.close()
+    print("✅ 指标面板只执行本面板的查询")
+    
+    # AppTest在其他线程运行脚本，SQLite内存库无法跨线程共享，使用临时文件
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/dashboard.db"
+        db = DatabaseManager(db_path)
+        for i in range(20):
+            db.add_health_record('weight', "70 kg", 70 - i * 0.1)
+            db.add_health_record('exercise', "跑步 30分钟", 30)
+            db.add_health_record('mood', "心情: 6/10", 6)
+            db.add_health_record('water', "1杯", 1)
+        db.create_goal("减重5公斤", "", "weight", 5, "kg", datetime.utcnow() + timedelta(days=30))
+        db.close()
+        
+        at = AppTest.from_function(_dashboard_app, args=(db_path,), default_timeout=30).run()
+        assert not at.exception
+        # 用户档案设置 + 记录快照 + 活跃目标 + 连续打卡 + 异常 + 今日计数器 + 每日摘要
+        assert at.session_state.render_queries <= 7, at.session_state.render_queries
+        print(f"✅ 首次渲染 {at.session_state.render_queries} 条SQL")
+        
+        at.run()
+        assert at.session_state.render_queries == 0
+        print("✅ 数据未变化时重新渲染无SQL")
+        
+        at.button(key="save_weight").click().run()
+        assert not at.exception
+        # 写入后只重新加载一次快照（记录、活跃目标、连续打卡、异常、今日计数器各一条）
+        assert at.session_state.render_queries <= 5, at.session_state.render_queries
+        print("✅ 记录数据后只重新加载一次快照")
+        
+        # 耗时说明只出现在操作所在的面板，查询数为该次操作执行的语句数：
+        # 写入（保存后重跑之前）加上重跑时刷新面板的查询
+        def action_costs():
+            return [int(re.search(r"(\d+) 次查询", c.value).group(1))
+                    for c in at.caption if c.value.startswith("⏱️")]
+        costs = action_costs()
+        assert len(costs) == 1 and costs[0] > at.session_state.render_queries, costs
+        at.button(key="save_exercise").click().run()
+        assert not at.exception
+        both = action_costs()
+        assert len(both) == 2 and both[0] == costs[0] and both[1] > at.session_state.render_queries, both
+        at.session_state.dashboard.db.close()
+        print(f"✅ 耗时说明按操作统计查询数（记录体重 {costs[0]} 条SQL）")
+    
+    return True
+
+
 def main():
     """主测试函数"""
     print("🚀 智能健康助手 - 测试套件")
@@ -121,19 +1416,43 @@ def main():
     # 测试环境
     env_ok = test_environment()
     
-    # 测试工具
-    tools_ok = test_tools()
-    
-    # 测试基础功能
-    basic_ok = test_basic_functionality()
+    # 依次运行各项测试
+    results = {
+        "工具功能": test_tools(),
+        "基础功能": test_basic_functionality(),
+        "计划确定性": test_plan_determinism(),
+        "营养计算": test_nutrition_engine(),
+        "结构化计划": test_structured_plans(),
+        "批量计划": test_batch_plans(),
+        "趋势计算": test_trends(),
+        "降采样": test_downsample(),
+        "WebGL切换": test_webgl_switch(),
+        "时间分桶": test_bucketing(),
+        "时区边界": test_timezone_boundaries(),
+        "组合图表": test_combined_chart(),
+        "图表缓存": test_figure_cache(),
+        "轻量图片": test_lite_images(),
+        "查询缓存": test_db_cache(),
+        "洞察规则": test_insight_rules(),
+        "每日摘要": test_daily_digest(),
+        "连续打卡": test_streaks(),
+        "异常检测": test_anomaly_detection(),
+        "每日目标": test_daily_targets(),
+        "目标同步": test_goal_sync(),
+        "目标统计": test_goal_stats(),
+        "目标提醒": test_goal_reminders(),
+        "目标预测": test_goal_forecast(),
+        "进度历史": test_goal_progress_history(),
+        "仪表板查询": test_dashboard_queries(),
+    }
     
     print("\n" + "="*50)
     print("📊 测试结果汇总:")
     print(f"环境配置: {'✅ 通过' if env_ok else '❌ 失败'}")
-    print(f"工具功能: {'✅ 通过' if tools_ok else '❌ 失败'}")
-    print(f"基础功能: {'✅ 通过' if basic_ok else '❌ 失败'}")
+    for name, ok in results.items():
+        print(f"{name}: {'✅ 通过' if ok else '❌ 失败'}")
     
-    if env_ok and tools_ok and basic_ok:
+    if env_ok and all(results.values()):
         print("\n🎉 所有测试通过！可以运行主应用了。")
         print("运行命令: streamlit run main.py")
     else:
@@ -1,11 +1,22 @@
-from typing import Annotated, TypedDict, List
+from typing import Annotated, TypedDict, List, Any, Hashable, Optional
+from collections import OrderedDict
+from datetime import date
 from langchain.tools import tool
+from langchain_core.runnables import RunnableConfig
 from dotenv import load_dotenv
 import requests
 import random
+import hashlib
 import os
 import json
 
+from core.nutrition import MealPlanEngine, parse_number
+from core.plans import (
+    WorkoutPlan, ExerciseBlock, Exercise,
+    NutritionPlan, MacroTargets, DayMenu, MealSuggestion,
+    WellnessPlan
+)
+
 load_dotenv()
 
 # 获取API密钥
@@ -13,9 +24,77 @@ fitness_api_key = os.getenv("EXERCISE_API_KEY")
 diet_api_key = os.getenv("DIET_API_KEY")
 
 
+class PlanCache:
+    """已渲染计划的LRU缓存"""
+    
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，命中时将条目移到最近使用位置"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+    
+    def put(self, key: Hashable, value: Any):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+def canonical_user_data(user_data: Optional[dict]) -> str:
+    """用户数据的规范JSON（仅对字典键排序，值保持原样），用作缓存键
+
+    大小写、空白或列表顺序不同的数据渲染出的计划可能不同，因此不做进一步归一化。
+    """
+    return json.dumps(user_data or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def derive_plan_seed(user_id: int, day: Optional[date] = None) -> int:
+    """由用户ID和日期派生计划随机种子，同一用户同一天得到相同的计划"""
+    day = day or date.today()
+    digest = hashlib.sha256(f"{user_id}:{day.isoformat()}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def resolve_plan_seed(user_data: Optional[dict], seed: Optional[int] = None,
+                      day: Optional[date] = None) -> int:
+    """计划使用的随机种子：显式种子优先，否则由用户数据中的 user_id 派生
+
+    Raises:
+        ValueError: 既没有种子也没有 user_id（否则所有用户会得到同一份计划）
+    """
+    if seed is not None:
+        return seed
+    user_id = (user_data or {}).get("user_id")
+    if user_id is None:
+        raise ValueError("生成计划需要指定 user_id 或 seed")
+    return derive_plan_seed(user_id, day)
+
+
 class FitnessPlanner:
     """健身计划生成器"""
     
+    # 所有实例共享的计划缓存（工具函数每次调用都会新建实例）
+    plan_cache = PlanCache()
+    
     def __init__(self):
         self.base_url = "https://api.api-ninjas.com/v1/exercises"
         self.api_key = fitness_api_key
@@ -71,124 +150,126 @@ class FitnessPlanner:
             print(f"API请求失败: {e}")
         return None
     
-    def generate_workout_plan(self, user_data):
-        """生成个性化健身计划"""
+    def generate_workout_plan(self, user_data, seed: Optional[int] = None):
+        """生成个性化健身计划（Markdown）"""
+        return self.build_workout_plan(user_data, seed).to_markdown()
+    
+    def build_workout_plan(self, user_data, seed: Optional[int] = None) -> WorkoutPlan:
+        """生成结构化的个性化健身计划
+        
+        相同的用户数据和种子总是生成相同的计划；未指定种子时由用户ID和当天日期派生，
+        两者都没有时抛出 ValueError。
+        """
+        seed = resolve_plan_seed(user_data, seed)
+        cache_key = (canonical_user_data(user_data), seed)
+        cached = self.plan_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        rng = random.Random(seed)
         goal = user_data.get("primary_goal", "general fitness").lower()
         activity_level = user_data.get("activity_level", "beginner").lower()
         workout_preferences = user_data.get("workout_preferences", [])
-        workout_duration = user_data.get("workout_duration", 45)
-        
-        plan = []
-        plan.append(f"🏋️ **个性化健身计划** (基于目标: {goal})")
-        plan.append(f"⏱️ **建议时长**: {workout_duration}分钟")
-        plan.append(f"📊 **难度等级**: {activity_level}")
-        plan.append("")
+        # 时长可能是 "45分钟" 之类的自由文本，取其中的数字
+        workout_duration = parse_number(user_data.get("workout_duration"), 45)
         
         # 根据目标选择运动类型
         if "weight loss" in goal or "减重" in goal:
-            plan.extend(self._create_weight_loss_plan(workout_preferences, activity_level))
+            focus = "weight_loss"
+            schedule, blocks = self._create_weight_loss_plan(workout_preferences, activity_level, rng)
         elif "muscle gain" in goal or "增肌" in goal:
-            plan.extend(self._create_muscle_gain_plan(workout_preferences, activity_level))
+            focus = "muscle_gain"
+            schedule, blocks = self._create_muscle_gain_plan(workout_preferences, activity_level, rng)
         elif "endurance" in goal or "耐力" in goal:
-            plan.extend(self._create_endurance_plan(workout_preferences, activity_level))
+            focus = "endurance"
+            schedule, blocks = self._create_endurance_plan(workout_preferences, activity_level, rng)
         else:
-            plan.extend(self._create_general_fitness_plan(workout_preferences, activity_level))
-        
-        plan.append("")
-        plan.append("⚠️ **注意事项**:")
-        plan.append("- 运动前进行5-10分钟热身")
-        plan.append("- 运动后进行拉伸放松")
-        plan.append("- 如有身体不适请立即停止")
-        plan.append("- 建议咨询专业教练指导")
-        
-        return "\n".join(plan)
+            focus = "general"
+            schedule, blocks = self._create_general_fitness_plan(workout_preferences, activity_level, rng)
+        
+        plan = WorkoutPlan(
+            goal=goal,
+            level=activity_level,
+            duration_minutes=workout_duration,
+            focus=focus,
+            schedule=schedule,
+            blocks=blocks,
+            notes=[
+                "运动前进行5-10分钟热身",
+                "运动后进行拉伸放松",
+                "如有身体不适请立即停止",
+                "建议咨询专业教练指导"
+            ]
+        )
+        self.plan_cache.put(cache_key, plan)
+        return plan
     
-    def _create_weight_loss_plan(self, preferences, level):
+    @staticmethod
+    def _block(title, frequency, exercises):
+        """由运动库条目构建训练组"""
+        return ExerciseBlock(title=title, frequency=frequency,
+                             exercises=[Exercise(**exercise) for exercise in exercises])
+    
+    def _create_weight_loss_plan(self, preferences, level, rng):
         """减重计划"""
-        plan = ["🔥 **减重专项计划**", ""]
-        
         # 有氧运动为主
-        cardio_exercises = random.sample(self.exercise_database["cardio"], 2)
-        plan.append("**有氧运动 (3-4次/周)**:")
-        for i, exercise in enumerate(cardio_exercises, 1):
-            plan.append(f"{i}. {exercise['name']}: {exercise['instructions']}")
-        
-        plan.append("")
+        cardio_exercises = rng.sample(self.exercise_database["cardio"], 2)
         
         # 力量训练辅助
         strength_exercises = []
         for muscle_group in ["chest", "back", "legs"]:
             exercises = self.exercise_database["strength"][muscle_group]
-            strength_exercises.append(random.choice(exercises))
-        
-        plan.append("**力量训练 (2-3次/周)**:")
-        for i, exercise in enumerate(strength_exercises, 1):
-            plan.append(f"{i}. {exercise['name']}: {exercise['instructions']}")
+            strength_exercises.append(rng.choice(exercises))
         
-        return plan
+        return [], [
+            self._block("有氧运动", "3-4次/周", cardio_exercises),
+            self._block("力量训练", "2-3次/周", strength_exercises)
+        ]
     
-    def _create_muscle_gain_plan(self, preferences, level):
+    def _create_muscle_gain_plan(self, preferences, level, rng):
         """增肌计划"""
-        plan = ["💪 **增肌专项计划**", ""]
-        
-        plan.append("**力量训练 (4-5次/周)**:")
-        exercise_count = 1
+        schedule = ["力量训练 4-5次/周，按肌群轮换"]
+        blocks = []
         for muscle_group, exercises in self.exercise_database["strength"].items():
-            selected = random.sample(exercises, 2)
-            plan.append(f"**{muscle_group.title()}训练:**")
-            for exercise in selected:
-                plan.append(f"{exercise_count}. {exercise['name']}: {exercise['instructions']}")
-                exercise_count += 1
-            plan.append("")
+            selected = rng.sample(exercises, 2)
+            blocks.append(self._block(f"{muscle_group.title()}训练", None, selected))
         
-        return plan
+        return schedule, blocks
     
-    def _create_endurance_plan(self, preferences, level):
+    def _create_endurance_plan(self, preferences, level, rng):
         """耐力计划"""
-        plan = ["🏃 **耐力提升计划**", ""]
-        
-        cardio_exercises = self.exercise_database["cardio"]
-        plan.append("**耐力训练 (4-5次/周)**:")
-        for i, exercise in enumerate(cardio_exercises, 1):
-            plan.append(f"{i}. {exercise['name']}: {exercise['instructions']}")
-        
-        return plan
+        return [], [self._block("耐力训练", "4-5次/周", self.exercise_database["cardio"])]
     
-    def _create_general_fitness_plan(self, preferences, level):
+    def _create_general_fitness_plan(self, preferences, level, rng):
         """综合健身计划"""
-        plan = ["🌟 **综合健身计划**", ""]
-        
         # 混合训练
-        plan.append("**每周训练安排**:")
-        plan.append("周一/三/五: 力量训练")
-        plan.append("周二/四: 有氧运动")
-        plan.append("周六: 柔韧性训练")
-        plan.append("周日: 休息")
-        plan.append("")
-        
-        # 具体运动
-        plan.append("**推荐运动**:")
-        all_exercises = []
+        schedule = [
+            "周一/三/五: 力量训练",
+            "周二/四: 有氧运动",
+            "周六: 柔韧性训练",
+            "周日: 休息"
+        ]
         
         # 选择各类运动
+        all_exercises = []
         for muscle_group in self.exercise_database["strength"]:
-            all_exercises.append(random.choice(self.exercise_database["strength"][muscle_group]))
-        
-        all_exercises.extend(random.sample(self.exercise_database["cardio"], 2))
-        all_exercises.extend(random.sample(self.exercise_database["flexibility"], 2))
+            all_exercises.append(rng.choice(self.exercise_database["strength"][muscle_group]))
         
-        for i, exercise in enumerate(all_exercises, 1):
-            plan.append(f"{i}. {exercise['name']}: {exercise['instructions']}")
+        all_exercises.extend(rng.sample(self.exercise_database["cardio"], 2))
+        all_exercises.extend(rng.sample(self.exercise_database["flexibility"], 2))
         
-        return plan
+        return schedule, [self._block("推荐运动", None, all_exercises)]
 
 
 class NutritionPlanner:
     """营养计划生成器"""
     
+    plan_cache = PlanCache()
+    
     def __init__(self):
         self.base_url = "https://api.spoonacular.com"
         self.api_key = diet_api_key
+        self.meal_engine = MealPlanEngine()
         
         # 预定义的营养建议数据
         self.nutrition_database = {
@@ -238,54 +319,57 @@ class NutritionPlanner:
         }
     
     def generate_nutrition_plan(self, user_data):
-        """生成营养计划"""
+        """生成营养计划（Markdown）"""
+        return self.build_nutrition_plan(user_data).to_markdown()
+    
+    def build_nutrition_plan(self, user_data) -> NutritionPlan:
+        """生成结构化的营养计划
+        
+        热量和宏量营养素目标由用户的年龄、性别、身高、体重和活动水平计算，
+        餐食由本地食物成分表求解得出；计划是确定性的，按用户数据的规范JSON缓存。
+        """
+        cache_key = canonical_user_data(user_data)
+        cached = self.plan_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         goal = user_data.get("primary_goal", "general fitness").lower()
         dietary_preferences = user_data.get("dietary_preferences", "")
-        
-        plan = []
-        plan.append("🍎 **个性化营养计划**")
-        plan.append("")
+        plan_days = max(int(parse_number(user_data.get("plan_days"), 7)), 1)
+        meal_plan = self.meal_engine.plan(user_data, days=plan_days)
         
         # 根据目标选择营养策略
         if "weight loss" in goal or "减重" in goal:
             nutrition_data = self.nutrition_database["weight_loss"]
-            plan.append("🎯 **减重营养策略**")
+            strategy = "减重营养策略"
         elif "muscle gain" in goal or "增肌" in goal:
             nutrition_data = self.nutrition_database["muscle_gain"]
-            plan.append("🎯 **增肌营养策略**")
+            strategy = "增肌营养策略"
         else:
             nutrition_data = self.nutrition_database["general_health"]
-            plan.append("🎯 **健康营养策略**")
-        
-        plan.append("")
-        
-        # 营养原则
-        plan.append("**营养原则:**")
-        for i, principle in enumerate(nutrition_data["principles"], 1):
-            plan.append(f"{i}. {principle}")
-        
-        plan.append("")
-        
-        # 餐食建议
-        plan.append("**每日餐食建议:**")
-        for meal_info in nutrition_data["meals"]:
-            plan.append(f"**{meal_info['meal']}**: {meal_info['suggestion']}")
-        
-        # 个性化建议
-        if dietary_preferences:
-            plan.append("")
-            plan.append(f"**个人偏好考虑**: {dietary_preferences}")
-        
-        plan.append("")
-        plan.append("💧 **水分摄入**: 每日8-10杯水")
-        plan.append("⚠️ **注意**: 如有特殊疾病请咨询营养师")
-        
-        return "\n".join(plan)
+            strategy = "健康营养策略"
+        
+        plan = NutritionPlan(
+            strategy=strategy,
+            targets=MacroTargets(**meal_plan["targets"]),
+            principles=nutrition_data["principles"],
+            meal_suggestions=[MealSuggestion(**meal_info) for meal_info in nutrition_data["meals"]],
+            days=[DayMenu(**day) for day in meal_plan["days"]],
+            dietary_preferences=dietary_preferences,
+            notes=[
+                "💧 **水分摄入**: 每日8-10杯水",
+                "⚠️ **注意**: 如有特殊疾病请咨询营养师"
+            ]
+        )
+        self.plan_cache.put(cache_key, plan)
+        return plan
 
 
 class MentalWellnessCoach:
     """心理健康教练"""
     
+    plan_cache = PlanCache()
+    
     def __init__(self):
         self.wellness_tips = [
             "深呼吸练习：每天进行5-10分钟的深呼吸，有助于减压放松",
@@ -312,52 +396,63 @@ class MentalWellnessCoach:
             "暂时断网：给自己一些不被打扰的宁静时间"
         ]
     
-    def generate_wellness_advice(self, user_data=None):
-        """生成心理健康建议"""
-        advice = []
-        advice.append("🧘 **心理健康指导**")
-        advice.append("")
-        
-        # 随机选择几个健康建议
-        selected_tips = random.sample(self.wellness_tips, 3)
-        advice.append("**今日健康贴士:**")
-        for i, tip in enumerate(selected_tips, 1):
-            advice.append(f"{i}. {tip}")
-        
-        advice.append("")
-        
-        # 压力缓解技巧
-        selected_techniques = random.sample(self.stress_relief_techniques, 2)
-        advice.append("**压力缓解技巧:**")
-        for i, technique in enumerate(selected_techniques, 1):
-            advice.append(f"{i}. {technique}")
-        
-        advice.append("")
-        advice.append("🔔 **重要提醒:**")
-        advice.append("- 如果情绪持续低落超过两周，建议寻求专业心理咨询")
-        advice.append("- 心理健康和身体健康同样重要")
-        advice.append("- 每个人的情况不同，找到适合自己的方法")
-        
-        return "\n".join(advice)
+    def generate_wellness_advice(self, user_data=None, seed: Optional[int] = None):
+        """生成心理健康建议（Markdown）"""
+        return self.build_wellness_plan(user_data, seed).to_markdown()
+    
+    def build_wellness_plan(self, user_data=None, seed: Optional[int] = None) -> WellnessPlan:
+        """生成结构化的心理健康建议
+        
+        与健身计划相同，建议由种子决定并按用户数据的规范JSON缓存。
+        """
+        seed = resolve_plan_seed(user_data, seed)
+        cache_key = (canonical_user_data(user_data), seed)
+        cached = self.plan_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        rng = random.Random(seed)
+        plan = WellnessPlan(
+            # 随机选择几个健康建议和压力缓解技巧
+            tips=rng.sample(self.wellness_tips, 3),
+            techniques=rng.sample(self.stress_relief_techniques, 2),
+            notes=[
+                "如果情绪持续低落超过两周，建议寻求专业心理咨询",
+                "心理健康和身体健康同样重要",
+                "每个人的情况不同，找到适合自己的方法"
+            ]
+        )
+        self.plan_cache.put(cache_key, plan)
+        return plan
 
 
 # 工具函数定义
+def _with_user_id(user_data: Optional[dict], config: Optional[RunnableConfig]) -> dict:
+    """把运行配置中的 user_id 合并进用户数据（LLM 生成的用户数据不含用户ID）"""
+    user_data = dict(user_data or {})
+    user_id = ((config or {}).get("configurable") or {}).get("user_id")
+    if user_id is not None:
+        user_data["user_id"] = user_id
+    return user_data
+
+
 @tool
-def fitness_planning_tool(user_data: Annotated[dict, "用户的健身相关数据，包括目标、偏好等"]):
-    """生成个性化健身计划的工具"""
+def fitness_planning_tool(user_data: Annotated[dict, "用户的健身相关数据，包括目标、偏好等"],
+                          config: RunnableConfig):
+    """生成个性化健身计划的工具，返回紧凑JSON格式的计划"""
     planner = FitnessPlanner()
-    return planner.generate_workout_plan(user_data)
+    return planner.build_workout_plan(_with_user_id(user_data, config)).to_compact_json()
 
 
 @tool
 def nutrition_planning_tool(user_data: Annotated[dict, "用户的营养相关数据，包括目标、偏好等"]):
-    """生成个性化营养计划的工具"""
+    """生成个性化营养计划的工具，返回紧凑JSON格式的计划（含热量目标和每日餐单）"""
     planner = NutritionPlanner()
-    return planner.generate_nutrition_plan(user_data)
+    return planner.build_nutrition_plan(user_data).to_compact_json()
 
 
 @tool
-def wellness_advice_tool(user_data: Annotated[dict, "用户数据，可选"] = None):
-    """提供心理健康建议的工具"""
+def wellness_advice_tool(config: RunnableConfig, user_data: Annotated[dict, "用户数据，可选"] = None):
+    """提供心理健康建议的工具，返回紧凑JSON格式的建议"""
     coach = MentalWellnessCoach()
-    return coach.generate_wellness_advice(user_data)
+    return coach.build_wellness_plan(_with_user_id(user_data, config)).to_compact_json()